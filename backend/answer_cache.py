@@ -0,0 +1,117 @@
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?.!؟ ")
+
+
+def question_numbers(normalized: str) -> tuple:
+    """Numbers in a normalized question (article, year, amount...); int() also reads Arabic-Indic digits."""
+    return tuple(int(number) for number in re.findall(r"\d+", normalized))
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache of RAG answers keyed by (routed sources, their version,
+    normalized question). The version is whatever identifies the indexed
+    content of the sources (see services.source_versions); it is read from
+    the shared registry, so a change made by another process is never
+    answered from here.
+
+    With an embedding model set, a miss on the exact key falls back to the
+    most similar cached question for the same sources, if its cosine
+    similarity is at least similarity_threshold and both questions contain
+    the same numbers: "article 12" and "article 13" embed almost identically
+    but have different answers. Entries that used a source
+    are also dropped when that source is re-uploaded or deleted here.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 1000,
+                 embedding=None, similarity_threshold: float = 0.95):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embedding = embedding
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _embed(self, question: str):
+        vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, now: float):
+        expired = [key for key, entry in self._entries.items() if entry["expires"] <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, sources: List[str], question: str, version: Hashable = None) -> Optional[dict]:
+        routed = tuple(sorted(sources))
+        normalized = normalize_question(question)
+        key = (routed, version, normalized)
+        numbers = question_numbers(normalized)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry["value"]
+            candidates = [(k, e["vector"]) for k, e in self._entries.items()
+                          if k[:2] == (routed, version) and e["vector"] is not None
+                          and question_numbers(k[2]) == numbers]
+
+        if self.embedding is None or not candidates:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        # Raw question, so the embedding cache entry is shared with retrieval
+        query_vector = self._embed(question)
+        best_key, best_score = None, -1.0
+        for candidate_key, vector in candidates:
+            score = float(np.dot(query_vector, vector))
+            if score > best_score:
+                best_key, best_score = candidate_key, score
+
+        with self._lock:
+            entry = self._entries.get(best_key)
+            if entry is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self._stats["semantic_hits"] += 1
+                return entry["value"]
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, sources: List[str], question: str, value: dict, version: Hashable = None):
+        key = (tuple(sorted(sources)), version, normalize_question(question))
+        vector = self._embed(question) if self.embedding is not None else None
+        with self._lock:
+            self._entries[key] = {"value": value, "vector": vector, "expires": time.time() + self.ttl_seconds}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_source(self, source: str):
+        with self._lock:
+            for key in [k for k in self._entries if source in k[0]]:
+                del self._entries[key]
+            self._stats["invalidations"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            s["entries"] = len(self._entries)
+        lookups = s["hits"] + s["semantic_hits"] + s["misses"]
+        s["hit_rate"] = round((s["hits"] + s["semantic_hits"]) / lookups, 4) if lookups else None
+        return s
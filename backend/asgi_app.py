@@ -0,0 +1,258 @@
+"""
+Async serving mode with the same routes as main.py.
+
+    cd backend && uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+
+LLM calls go through the chains' ainvoke (httpx-based async OpenAI client);
+blocking work (reranking, uploads, SQLite) is pushed to threads. In-flight
+calls per upstream are capped by UpstreamLimits instead of by worker count.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from pinecone_util import show_metadata
+from pydantic_models import QueryInput, DeleteFileRequest
+from services import (
+    UpstreamLimits,
+    aroute_question,
+    aanswer_question,
+    stream_answer,
+    load_history,
+    remember_turn,
+    ingest_files,
+    finish_upload,
+    get_job,
+    get_page_text,
+    start_ingest_workers,
+    delete_document as delete_indexed_document,
+    collect_stats,
+    check_readiness,
+)
+from document_util import get_all_documents
+from session_memory import history_tokens
+from tracing import TIMING_HEADERS, metrics, stage, start_trace
+
+app = FastAPI()
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+logging.basicConfig(level=logging.ERROR,
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+limits = UpstreamLimits({
+    "openai": int(os.getenv("ASYNC_OPENAI_CONCURRENCY", "64")),
+    "pinecone": int(os.getenv("ASYNC_PINECONE_CONCURRENCY", "32")),
+    "cohere": int(os.getenv("ASYNC_COHERE_CONCURRENCY", "16")),
+    "ingest": int(os.getenv("ASYNC_INGEST_CONCURRENCY", "2")),
+})
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    # The endpoint runs in a copy of this context, so it records into this trace
+    trace = start_trace()
+    response = await call_next(request)
+    if TIMING_HEADERS and trace.stages:
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
+@app.on_event("startup")
+async def startup():
+    start_ingest_workers()
+
+
+@app.get("/")
+async def home():
+    return "Hello from Personal RAG Chatbot!"
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    report, is_ready = await asyncio.to_thread(check_readiness)
+    return JSONResponse({"ready": is_ready, "checks": report}, status_code=200 if is_ready else 503)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    try:
+        query_input = QueryInput(**(await request.json() or {}))
+    except Exception as e:
+        logging.error(f"Error in input data: {str(e)}")
+        return JSONResponse({"error": "Invalid input data"}, status_code=400)
+
+    if not query_input.session_id:
+        return JSONResponse({"error": "No session assigned"}, status_code=400)
+
+    chat_history = await asyncio.to_thread(load_history, query_input)
+
+    sources, response_text, query = await aroute_question(query_input.question, chat_history, limits)
+    if sources is None:
+        response = {
+            "answer": response_text,
+            "highlighted_contexts": []
+        }
+    else:
+        response = await aanswer_question(sources, query_input.question, chat_history, limits, query)
+
+    with stage("assemble"):
+        return await asyncio.to_thread(remember_turn, query_input.session_id, query_input.question, response, chat_history)
+
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """Server-sent events variant of /chat; same events as main.py's /chat/stream."""
+    try:
+        query_input = QueryInput(**(await request.json() or {}))
+    except Exception as e:
+        logging.error(f"Error in input data: {str(e)}")
+        return JSONResponse({"error": "Invalid input data"}, status_code=400)
+
+    if not query_input.session_id:
+        return JSONResponse({"error": "No session assigned"}, status_code=400)
+
+    chat_history = await asyncio.to_thread(load_history, query_input)
+
+    async def generate():
+        started = time.perf_counter()
+        first_token_at = None
+        answer_parts = []
+        history_token_count = history_tokens(chat_history)
+        try:
+            sources, response_text, query = await aroute_question(query_input.question, chat_history, limits)
+            routed_at = time.perf_counter()
+            yield sse_event("route", {
+                "sources": sources,
+                "router_ms": round((routed_at - started) * 1000, 1)
+            })
+
+            if sources is None:
+                first_token_at = time.perf_counter()
+                yield sse_event("contexts", {"highlighted_contexts": []})
+                answer_parts.append(response_text)
+                yield sse_event("token", {"text": response_text})
+            else:
+                # stream_answer blocks on retrieval and on the LLM stream, so
+                # each step of it runs in a thread
+                events = stream_answer(sources, query_input.question, chat_history, query)
+                done = object()
+                while True:
+                    item = await asyncio.to_thread(next, events, done)
+                    if item is done:
+                        break
+                    event, payload = item
+                    if event == "contexts":
+                        yield sse_event("contexts", {"highlighted_contexts": payload})
+                    else:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        answer_parts.append(payload)
+                        yield sse_event("token", {"text": payload})
+            await asyncio.to_thread(remember_turn, query_input.session_id, query_input.question,
+                                    {"answer": "".join(answer_parts)}, chat_history)
+        except Exception as e:
+            logging.error(f"Error streaming chat response: {str(e)}", exc_info=True)
+            yield sse_event("error", {"error": "An error occurred while generating the answer"})
+
+        finished = time.perf_counter()
+        yield sse_event("done", {
+            "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            "total_ms": round((finished - started) * 1000, 1),
+            "history_tokens": history_token_count
+        })
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/upload-doc")
+async def index_document(file: list[UploadFile] = File(...), mode: str = Form("")):
+    def saver(content: bytes):
+        def save_to(path):
+            with open(path, "wb") as f:
+                f.write(content)
+        return save_to
+
+    uploads = [(upload.filename, saver(await upload.read())) for upload in file]
+    async with limits.acquire("ingest"):
+        results = await asyncio.to_thread(ingest_files, uploads, mode == "update")
+    # Indexing happens in the background; poll /jobs/{job_id} for progress
+    body = finish_upload(results)
+    # 409 when every file already had a job running, so nothing was queued
+    busy = bool(results) and body["summary"]["busy"] == len(results)
+    return JSONResponse(body, status_code=409 if busy else 202)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job
+
+
+@app.get("/documents/{file_id}/pages/{page}")
+async def page_text(file_id: int, page: int):
+    result = await asyncio.to_thread(get_page_text, file_id, page)
+    if result is None:
+        return JSONResponse({"error": "Page not found"}, status_code=404)
+    return result
+
+
+@app.delete("/delete-doc")
+async def delete_document(request: Request):
+    try:
+        data = await request.json()
+        if not data.get('file_id'):
+            return JSONResponse({"error": "file_id is required"}, status_code=400)
+
+        response = DeleteFileRequest(**data)
+        message, status = await asyncio.to_thread(delete_indexed_document, response.file_id)
+
+        if status == 200:
+            return {"message": message}
+        return JSONResponse({"error": message}, status_code=status)
+    except Exception as e:
+        logging.error(f"Error deleting document: {str(e)}", exc_info=True)
+        return JSONResponse({"error": "An error occurred while deleting the document"}, status_code=500)
+
+
+@app.get("/list-docs")
+async def list_documents():
+    return await asyncio.to_thread(get_all_documents)
+
+
+@app.get("/stats")
+async def stats():
+    result = await asyncio.to_thread(collect_stats)
+    result["upstream_limits"] = limits.stats()
+    return result
+
+
+@app.get("/show-docs")
+async def show_metaData():
+    return await asyncio.to_thread(show_metadata)
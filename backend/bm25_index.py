@@ -0,0 +1,279 @@
+import os
+import re
+import asyncio
+import json
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bm25_index.db")
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+ARABIC_DIACRITICS = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+ARABIC_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي",
+    **{chr(0x0660 + d): str(d) for d in range(10)},  # Arabic-Indic digits
+    **{chr(0x06F0 + d): str(d) for d in range(10)},  # Extended Arabic-Indic digits
+})
+STOPWORDS = {
+    "the", "and", "of", "to", "in", "a", "an", "is", "are", "be", "for", "on", "or", "by", "with",
+    "as", "at", "this", "that", "it", "from", "which", "shall", "any",
+    # Arabic entries are written after letter folding (see ARABIC_CHAR_MAP)
+    "في", "من", "على", "الى", "عن", "ان", "او", "التي", "الذي", "هذا", "هذه", "ما",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; Arabic is stripped of diacritics/tatweel and letter variants are folded."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = ARABIC_DIACRITICS.sub("", text).translate(ARABIC_CHAR_MAP)
+    return [t for t in TOKEN_PATTERN.findall(text) if t not in STOPWORDS]
+
+
+class _SourcePostings:
+    """In-memory postings for one source, loaded from SQLite on first use."""
+
+    def __init__(self, rows):
+        self.ids: List[str] = []
+        self.documents: List[Document] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for vector_id, text, metadata, terms in rows:
+            position = len(self.ids)
+            counts = json.loads(terms)
+            self.ids.append(vector_id)
+            self.documents.append(Document(page_content=text, metadata=json.loads(metadata)))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((position, tf))
+        self.avgdl = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+
+class BM25Index:
+    """
+    Incrementally updated BM25 index over indexed chunks, partitioned by source.
+
+    Chunks and their term counts are persisted in SQLite keyed by vector id
+    (the same ids as the vector manifest). Each source's postings are loaded
+    into memory on first query, together with the source's version counter,
+    which every write to the source bumps in the same transaction; a query
+    reloads the postings when the counter moved, so writes made by other
+    processes (job workers, bulk_ingest.py) are picked up too.
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sources: Dict[str, Tuple[int, _SourcePostings]] = {}
+        conn = self._conn()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS bm25_chunks (
+                vector_id TEXT PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                terms TEXT NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_bm25_source ON bm25_chunks (source)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_bm25_file_id ON bm25_chunks (file_id)")
+        conn.execute("CREATE TABLE IF NOT EXISTS bm25_sources (source TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, file_id: int, vector_ids: List[str], documents: List[Document]):
+        rows = []
+        sources = set()
+        for vector_id, document in zip(vector_ids, documents):
+            source = document.metadata.get("source", "")
+            sources.add(source)
+            rows.append((
+                vector_id, file_id, source, document.page_content,
+                json.dumps(document.metadata, ensure_ascii=False),
+                json.dumps(Counter(tokenize(document.page_content)), ensure_ascii=False),
+            ))
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO bm25_chunks (vector_id, file_id, source, text, metadata, terms) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self._bump(conn, sources)
+        conn.commit()
+        self._invalidate(sources)
+
+    def delete(self, vector_ids: List[str]):
+        if not vector_ids:
+            return
+        conn = self._conn()
+        placeholders = ",".join("?" * len(vector_ids))
+        sources = {row[0] for row in conn.execute(
+            f"SELECT DISTINCT source FROM bm25_chunks WHERE vector_id IN ({placeholders})", vector_ids)}
+        conn.execute(f"DELETE FROM bm25_chunks WHERE vector_id IN ({placeholders})", vector_ids)
+        self._bump(conn, sources)
+        conn.commit()
+        self._invalidate(sources)
+
+    def delete_file(self, file_id: int):
+        conn = self._conn()
+        sources = {row[0] for row in conn.execute(
+            "SELECT DISTINCT source FROM bm25_chunks WHERE file_id = ?", (file_id,))}
+        conn.execute("DELETE FROM bm25_chunks WHERE file_id = ?", (file_id,))
+        self._bump(conn, sources)
+        conn.commit()
+        self._invalidate(sources)
+
+    def indexed_file_ids(self) -> set:
+        return {row[0] for row in self._conn().execute("SELECT DISTINCT file_id FROM bm25_chunks")}
+
+    def _bump(self, conn: sqlite3.Connection, sources):
+        conn.executemany(
+            "INSERT INTO bm25_sources (source, version) VALUES (?, 1) "
+            "ON CONFLICT(source) DO UPDATE SET version = version + 1",
+            [(source,) for source in sources]
+        )
+
+    def _invalidate(self, sources):
+        with self._lock:
+            for source in sources:
+                self._sources.pop(source, None)
+
+    def _postings(self, source: str) -> _SourcePostings:
+        conn = self._conn()
+        # Read before the rows: a write in between only causes one more reload
+        row = conn.execute("SELECT version FROM bm25_sources WHERE source = ?", (source,)).fetchone()
+        version = row[0] if row else 0
+        with self._lock:
+            cached = self._sources.get(source)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        rows = conn.execute(
+            "SELECT vector_id, text, metadata, terms FROM bm25_chunks WHERE source = ?", (source,)
+        ).fetchall()
+        postings = _SourcePostings(rows)
+        with self._lock:
+            self._sources[source] = (version, postings)
+        return postings
+
+    def search(self, query: str, sources: List[str], k: int = 10) -> List[Tuple[Document, float]]:
+        terms = set(tokenize(query))
+        results = []
+        for source in sources:
+            postings = self._postings(source)
+            n = len(postings.ids)
+            if not n:
+                continue
+            scores: Dict[int, float] = {}
+            for term in terms:
+                matches = postings.postings.get(term)
+                if not matches:
+                    continue
+                idf = math.log(1 + (n - len(matches) + 0.5) / (len(matches) + 0.5))
+                for position, tf in matches:
+                    norm = self.k1 * (1 - self.b + self.b * postings.lengths[position] / postings.avgdl)
+                    scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+            for position, score in scores.items():
+                results.append((postings.documents[position], score))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results[:k]
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """Fuses ranked lists; a chunk is identified by (source, page, text) since dense hits carry no id."""
+    scores: Dict[tuple, float] = {}
+    documents: Dict[tuple, Document] = {}
+    for results in result_lists:
+        for rank, document in enumerate(results):
+            key = (document.metadata.get("source"), document.metadata.get("page"), document.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(key, document)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [documents[key] for key in ranked[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """Dense retriever + BM25 over the same sources, merged by reciprocal-rank fusion."""
+
+    dense_retriever: BaseRetriever
+    keyword_index: BM25Index
+    sources: List[str]
+    k: int = 10
+    keyword_k: int = 10
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        dense = self.dense_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        keyword = [doc for doc, _ in self.keyword_index.search(query, self.sources, self.keyword_k)]
+        return reciprocal_rank_fusion([dense, keyword], self.k)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # The keyword search is SQLite work; run it off the event loop alongside the dense search
+        dense, hits = await asyncio.gather(
+            self.dense_retriever.ainvoke(query, config={"callbacks": run_manager.get_child()}),
+            asyncio.to_thread(self.keyword_index.search, query, self.sources, self.keyword_k),
+        )
+        keyword = [doc for doc, _ in hits]
+        return reciprocal_rank_fusion([dense, keyword], self.k)
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def get_bm25_index() -> BM25Index:
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = BM25Index()
+        return _default_index
+
+
+def backfill_from_vector_index(index, file_ids: Optional[List[int]] = None, batch_size: int = 100) -> int:
+    """Adds chunks of already indexed documents by fetching their text from the vector index."""
+    from document_util import get_all_documents, get_manifest_vector_ids
+
+    keyword_index = get_bm25_index()
+    done = keyword_index.indexed_file_ids()
+    added = 0
+    for document in get_all_documents():
+        file_id = document["id"]
+        if (file_ids and file_id not in file_ids) or file_id in done:
+            continue
+        vector_ids = get_manifest_vector_ids(file_id)
+        for start in range(0, len(vector_ids), batch_size):
+            response = index.fetch(ids=vector_ids[start:start + batch_size], namespace=document.get("namespace"))
+            vectors = response["vectors"] if isinstance(response, dict) else response.vectors
+            ids, chunks = [], []
+            for vector_id, vector in vectors.items():
+                metadata = dict(vector["metadata"] if isinstance(vector, dict) else vector.metadata)
+                text = metadata.pop("text", "")
+                ids.append(vector_id)
+                chunks.append(Document(page_content=text, metadata=metadata))
+            keyword_index.add(file_id, ids, chunks)
+            added += len(ids)
+    return added
+
+
+if __name__ == '__main__':
+    # python bm25_index.py  -> index chunks of documents uploaded before hybrid retrieval existed
+    from pinecone_util import get_index
+    print(f"Backfilled {backfill_from_vector_index(get_index())} chunks")
@@ -0,0 +1,185 @@
+"""
+Indexes a directory or ZIP archive of documents from the command line, in
+this process, instead of through /upload-doc and the web workers. Each file
+is still recorded in the jobs database (kind bulk-index or bulk-update), so
+/jobs shows it and uploads of the same document are refused while it runs.
+
+    cd backend && python bulk_ingest.py ~/regulations/
+    cd backend && python bulk_ingest.py regulations.zip --workers 4
+    cd backend && python bulk_ingest.py ~/regulations/ --update --dry-run
+
+Every supported file (.pdf, .docx, .html) is fingerprinted (size + sha256)
+and compared with the documents registry:
+
+- unchanged: same name and content, already indexed; skipped
+- duplicate: the same content is indexed under another name; skipped
+- resume: same name and content, but not indexed yet (an earlier run stopped);
+  chunks the vector manifest already has are not embedded again
+- update: same name, new content; re-indexes only the changed chunks, with --update
+- changed: same as update, without --update; skipped
+- new: registered, then indexed
+- busy: an upload job for the document is queued or running; skipped
+
+The registry and the per-batch manifest are the checkpoint: running the same
+command again after an interruption picks up where it stopped. Files are
+indexed --workers at a time through the shared ingest pipeline, which itself
+parses, embeds and upserts in parallel (see the INGEST_* settings).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from document_util import STATUS_FAILED, STATUS_INDEXED, get_all_documents, insert_document_records, update_document_status
+from services import ALLOWED_EXTENSIONS, file_fingerprint, index_file, job_queue
+
+
+def _supported(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def collect_files(source: str, extract_dir: str) -> List[Tuple[str, str]]:
+    """(filename, path) of every supported file; ZIP members are extracted to extract_dir first."""
+    if os.path.isdir(source):
+        files = []
+        for root, dirs, names in os.walk(source):
+            dirs.sort()
+            files += [(name, os.path.join(root, name)) for name in sorted(names) if _supported(name)]
+        return files
+
+    files = []
+    with zipfile.ZipFile(source) as archive:
+        for position, member in enumerate(archive.infolist()):
+            name = os.path.basename(member.filename)
+            if member.is_dir() or member.filename.startswith("__MACOSX/") or not _supported(name):
+                continue
+            # One directory per member: archives may hold the same filename in several folders
+            path = os.path.join(extract_dir, str(position), name)
+            os.makedirs(os.path.dirname(path))
+            with archive.open(member) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            files.append((name, path))
+    return files
+
+
+def plan(files: List[Tuple[str, str]], update: bool) -> List[dict]:
+    documents = get_all_documents()
+    by_filename = {document["filename"]: document for document in documents}
+    indexed_hashes = {document["content_hash"]: document["filename"] for document in documents
+                      if document["content_hash"] and document["status"] == STATUS_INDEXED}
+    busy = job_queue.active_file_ids()
+    seen = {}
+
+    items = []
+    for filename, path in files:
+        item = {"filename": filename, "path": path}
+        items.append(item)
+        if filename in seen:
+            item.update(action="error", message=f"Same filename as {seen[filename]}")
+            continue
+        seen[filename] = path
+        item["byte_size"], item["content_hash"] = file_fingerprint(path)
+        document = by_filename.get(filename)
+        if document:
+            item["file_id"] = document["id"]
+            if document["id"] in busy:
+                item["action"] = "busy"
+            elif document["content_hash"] == item["content_hash"]:
+                item["action"] = "unchanged" if document["status"] == STATUS_INDEXED else "resume"
+            else:
+                item["action"] = "update" if update else "changed"
+        elif item["content_hash"] in indexed_hashes:
+            item.update(action="duplicate", message=f"Same content as {indexed_hashes[item['content_hash']]}")
+        else:
+            item["action"] = "new"
+            indexed_hashes[item["content_hash"]] = filename
+    return items
+
+
+def index_item(item: dict) -> dict:
+    kind = "update" if item["action"] == "update" else "index"
+    job_id = job_queue.begin_external(kind, item["filename"], item["path"], item["file_id"])
+    if job_id is None:
+        # An upload of the same document was queued since the plan was made
+        item.update(action="busy", status="skipped", message="An upload job for the document is queued or running")
+        return item
+    item["job_id"] = job_id
+    try:
+        # Progress updates double as the job's heartbeat
+        result = index_file(kind, item["file_id"], item["filename"], item["path"],
+                            progress=lambda **counts: job_queue.update_progress(job_id, **counts),
+                            resume=item["action"] == "resume")
+    except Exception as e:
+        if kind == "index":
+            # Left registered with its manifest entries, so the next run resumes it
+            update_document_status(item["file_id"], STATUS_FAILED)
+        job_queue.finish_external(job_id, error=str(e))
+        item.update(status="failed", message=str(e))
+        return item
+    job_queue.finish_external(job_id, result=result)
+    stats = result["stats"]
+    item.update(status="indexed", message=result["message"], pages=stats["pages"], chunks=stats["chunks"],
+                chunks_embedded=stats["added"] + stats["moved"] if kind == "update" else stats["chunks"] - stats["resumed"],
+                seconds=stats["seconds"])
+    return item
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="directory (searched recursively) or ZIP archive")
+    parser.add_argument("--workers", type=int, default=2, help="files indexed at a time")
+    parser.add_argument("--update", action="store_true", help="re-index files whose content changed")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be done")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as extract_dir:
+        items = plan(collect_files(args.source, extract_dir), args.update)
+        todo = [item for item in items if item["action"] in ("new", "resume", "update")]
+        if args.dry_run:
+            print(json.dumps({"dry_run": True, "actions": Counter(item["action"] for item in items),
+                              "files": [{key: value for key, value in item.items() if key != "path"} for item in items]},
+                             indent=2))
+            return
+
+        new_items = [item for item in todo if item["action"] == "new"]
+        file_ids = insert_document_records([(item["filename"], item["byte_size"], item["content_hash"])
+                                            for item in new_items])
+        for item, file_id in zip(new_items, file_ids):
+            if file_id is None:
+                # Registered by an upload since the plan was made
+                item.update(action="error", message="File already uploaded")
+            item["file_id"] = file_id
+        todo = [item for item in todo if item["action"] != "error"]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for done, item in enumerate(pool.map(index_item, todo), 1):
+                print(f"[{done}/{len(todo)}] {item['filename']}: {item['status']} ({item['message']})", file=sys.stderr)
+        elapsed = time.perf_counter() - started
+
+    indexed = [item for item in todo if item["status"] == "indexed"]
+    chunks = sum(item["chunks"] for item in indexed)
+    print(json.dumps({
+        "source": args.source,
+        "actions": Counter(item["action"] for item in items),
+        "indexed": len(indexed),
+        "failed": sum(1 for item in todo if item["status"] == "failed"),
+        "pages": sum(item["pages"] for item in indexed),
+        "chunks": chunks,
+        "chunks_embedded": sum(item["chunks_embedded"] for item in indexed),
+        "seconds": round(elapsed, 2),
+        "docs_per_second": round(len(indexed) / elapsed, 2) if elapsed > 0 else None,
+        "chunks_per_second": round(chunks / elapsed, 1) if elapsed > 0 else None,
+        "files": [{key: value for key, value in item.items() if key != "path"} for item in items],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+from session_memory import count_tokens
+
+# The splitter repeats up to chunk_overlap (200) characters at the start of the
+# next chunk; a shorter match is more likely a repeated phrase than that overlap
+MIN_OVERLAP_CHARS = 20
+
+
+def overlap_length(left: str, right: str, min_overlap: int = MIN_OVERLAP_CHARS) -> int:
+    """Length of the longest suffix of left that is also a prefix of right (0 if under min_overlap)."""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    head = right[:min_overlap]
+    position = left.find(head, max(0, len(left) - len(right)))
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(head, position + 1)
+    return 0
+
+
+def merge_passages(texts: List[str]) -> List[Tuple[str, List[int]]]:
+    """
+    Joins texts that continue one another (end of one == start of the next)
+    or contain one another into passages, in order of first appearance.
+    Returns (passage text, indexes of the texts it was built from).
+    """
+    passages = [(text, [i]) for i, text in enumerate(texts)]
+    merged = True
+    while merged:
+        merged = False
+        for a, (left, left_indexes) in enumerate(passages):
+            for b, (right, right_indexes) in enumerate(passages):
+                if a == b:
+                    continue
+                if right in left:
+                    joined = left
+                else:
+                    size = overlap_length(left, right)
+                    if not size:
+                        continue
+                    joined = left + right[size:]
+                passages[a] = (joined, left_indexes + right_indexes)
+                del passages[b]
+                merged = True
+                break
+            if merged:
+                break
+    return passages
+
+
+class ContextPacker:
+    """
+    Assembles the reranked chunks into the context sent to the answer model.
+
+    Chunks of the same page that overlap (neighbours from the splitter) are
+    merged into one passage with the repeated text removed, passages are kept
+    in order of relevance until token_budget is reached, and the result is
+    ordered by source (most relevant source first) and page. Each passage
+    keeps the source/page/file_id metadata of its best-ranked chunk, so
+    citations are unchanged; the most relevant passage is always kept.
+    """
+
+    def __init__(self, token_budget: int = 3000, enabled: bool = True):
+        self.token_budget = token_budget
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "chunks_in": 0, "passages_out": 0, "passages_dropped": 0,
+                       "tokens_in": 0, "tokens_out": 0}
+
+    def pack(self, documents: List[Document]) -> Tuple[List[Document], dict]:
+        """Returns (packed documents, report of this request's savings)."""
+        tokens_in = sum(count_tokens(document.page_content) for document in documents)
+        if not self.enabled or not documents:
+            return list(documents), {"chunks_in": len(documents), "passages_out": len(documents),
+                                     "passages_dropped": 0, "tokens_in": tokens_in, "tokens_out": tokens_in,
+                                     "tokens_saved": 0}
+
+        # documents arrive best first, so a rank is a position in the list
+        pages = OrderedDict()
+        source_rank = {}
+        for rank, document in enumerate(documents):
+            source = document.metadata.get("source")
+            source_rank.setdefault(source, len(source_rank))
+            pages.setdefault((source, document.metadata.get("page")), []).append(rank)
+
+        passages = []  # (best rank, text, ranks of the merged chunks)
+        for ranks in pages.values():
+            for text, indexes in merge_passages([documents[rank].page_content for rank in ranks]):
+                merged_ranks = [ranks[i] for i in indexes]
+                passages.append((min(merged_ranks), text, merged_ranks))
+        passages.sort(key=lambda passage: passage[0])
+
+        kept, used, dropped = [], 0, 0
+        for best_rank, text, merged_ranks in passages:
+            tokens = count_tokens(text)
+            if kept and used + tokens > self.token_budget:
+                dropped += 1
+                continue
+            kept.append((best_rank, text, merged_ranks))
+            used += tokens
+
+        def position(passage):
+            metadata = documents[passage[0]].metadata
+            page = metadata.get("page")
+            return source_rank[metadata.get("source")], page is None, page or 0, passage[0]
+
+        packed = []
+        for best_rank, text, merged_ranks in sorted(kept, key=position):
+            metadata = dict(documents[best_rank].metadata)
+            metadata["merged_chunks"] = len(merged_ranks)
+            packed.append(Document(page_content=text, metadata=metadata))
+
+        report = {"chunks_in": len(documents), "passages_out": len(packed), "passages_dropped": dropped,
+                  "tokens_in": tokens_in, "tokens_out": used, "tokens_saved": tokens_in - used}
+        with self._lock:
+            self._stats["requests"] += 1
+            for key in ("chunks_in", "passages_out", "passages_dropped", "tokens_in", "tokens_out"):
+                self._stats[key] += report[key]
+        return packed, report
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        s["enabled"] = self.enabled
+        s["token_budget"] = self.token_budget
+        s["avg_tokens_saved"] = round((s["tokens_in"] - s["tokens_out"]) / s["requests"], 1) if s["requests"] else None
+        s["saved_ratio"] = round(1 - s["tokens_out"] / s["tokens_in"], 4) if s["tokens_in"] else None
+        return s
@@ -1,11 +1,46 @@
 import sqlite3
 import os
+import threading
 from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
 
-DB_NAME = "documents.db"
+# Absolute, so the Flask app, the ASGI app and scripts run from the repo root
+# all share one registry instead of each creating documents.db in their cwd.
+DB_NAME = os.getenv("DOCUMENTS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents.db"))
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
+# Indexing status of a document row
+STATUS_PENDING = "pending"
+STATUS_INDEXING = "indexing"
+STATUS_INDEXED = "indexed"
+STATUS_FAILED = "failed"
+
+_local = threading.local()
+_db_ready = False
+_db_lock = threading.Lock()
+
+# Columns added after the first release; existing databases get them through ALTER TABLE
+_DOCUMENT_COLUMNS = {
+    "chunk_count": "INTEGER DEFAULT 0",
+    "byte_size": "INTEGER",
+    "content_hash": "TEXT",
+    # Rows that predate the column were fully indexed
+    "status": f"TEXT NOT NULL DEFAULT '{STATUS_INDEXED}'",
+    "updated_at": "DATETIME",
+    # Vector namespace holding the document's chunks; NULL for documents
+    # indexed into the shared default namespace (found by metadata filter)
+    "namespace": "TEXT",
+}
+
+LIST_DOCUMENTS_SQL = "SELECT * FROM documents ORDER BY id"
+DOCUMENT_BY_ID_SQL = "SELECT * FROM documents WHERE id = ?"
+DOCUMENT_BY_FILENAME_SQL = "SELECT * FROM documents WHERE filename = ?"
+VERSION_SQL = "SELECT value FROM registry_meta WHERE key = 'version'"
+BUMP_VERSION_SQL = "UPDATE registry_meta SET value = value + 1 WHERE key = 'version'"
+
+
+def init_db(conn: Optional[sqlite3.Connection] = None):
+    owned = conn is None
+    conn = conn or sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
@@ -14,49 +49,217 @@ def init_db():
             upload_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(documents)")}
+    for column, definition in _DOCUMENT_COLUMNS.items():
+        if column not in existing:
+            try:
+                cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} {definition}")
+            except sqlite3.OperationalError as e:
+                # Another worker migrated the table between PRAGMA table_info and here
+                if "duplicate column" not in str(e):
+                    raise
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents (status)")
+    # Bumped on every change to `documents`, so callers can poll it instead of re-reading the table
+    cursor.execute("CREATE TABLE IF NOT EXISTS registry_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    cursor.execute("INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('version', 0)")
+    # One row per vector written to the index, so deletes and audits never
+    # have to scan the vector store.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vector_manifest (
+            vector_id TEXT PRIMARY KEY,
+            file_id INTEGER NOT NULL,
+            page INTEGER,
+            chunk_index INTEGER,
+            content_hash TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_manifest_file_id ON vector_manifest (file_id)")
+    # Keyword counts and summed chunk embeddings per document, for the local router
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_profiles (
+            file_id INTEGER PRIMARY KEY,
+            filename TEXT NOT NULL,
+            keywords TEXT NOT NULL,
+            vector_sum BLOB,
+            vector_count INTEGER DEFAULT 0
+        )
+    ''')
     conn.commit()
-    conn.close()
+    if owned:
+        conn.close()
+
+def _connect() -> sqlite3.Connection:
+    """
+    One long-lived connection per thread, in WAL mode so readers never block
+    the writer. The SQL above is kept in constants so every call reuses the
+    connection's prepared-statement cache.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_NAME, timeout=30, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    global _db_ready
+    if not _db_ready:
+        with _db_lock:
+            if not _db_ready:
+                init_db(conn)
+                _db_ready = True
+    return conn
+
+def get_registry_version() -> int:
+    return _connect().execute(VERSION_SQL).fetchone()[0]
 
 def get_all_documents():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM documents")
-    rows = cursor.fetchall()
-    documents = [dict(row) for row in rows]
-    conn.close()
-    return documents
-
-def insert_document_record(filename):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    try:
-        cursor.execute("INSERT INTO documents (filename) VALUES (?)", (filename,))
-        conn.commit()
-        file_id = cursor.lastrowid
-    except sqlite3.IntegrityError:
-        file_id = None # Or handle as existing
-    finally:
-        conn.close()
-    return file_id
+    return [dict(row) for row in _connect().execute(LIST_DOCUMENTS_SQL)]
+
+def insert_document_record(filename, byte_size=None, content_hash=None, status=STATUS_PENDING):
+    file_ids = insert_document_records([(filename, byte_size, content_hash)], status=status)
+    return file_ids[0]
+
+def insert_document_records(records: Iterable[Tuple[str, Optional[int], Optional[str]]],
+                            status: str = STATUS_PENDING) -> List[Optional[int]]:
+    """
+    Registers several uploads in one transaction; records are
+    (filename, byte_size, content_hash). Returns the new ids in order, None
+    where the filename already exists.
+    """
+    conn = _connect()
+    file_ids = []
+    with conn:
+        for filename, byte_size, content_hash in records:
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO documents (filename, byte_size, content_hash, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (filename, byte_size, content_hash, status, datetime.now().isoformat(timespec="seconds"))
+                )
+                file_ids.append(cursor.lastrowid)
+            except sqlite3.IntegrityError:
+                file_ids.append(None)
+        if any(file_id is not None for file_id in file_ids):
+            conn.execute(BUMP_VERSION_SQL)
+    return file_ids
+
+def update_document_status(file_id, status, chunk_count=None, byte_size=None, content_hash=None, namespace=None):
+    """Sets the status; the other columns are only written when given."""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            '''
+            UPDATE documents SET status = ?,
+                chunk_count = COALESCE(?, chunk_count),
+                byte_size = COALESCE(?, byte_size),
+                content_hash = COALESCE(?, content_hash),
+                namespace = COALESCE(?, namespace),
+                updated_at = ?
+            WHERE id = ?
+            ''',
+            (status, chunk_count, byte_size, content_hash, namespace,
+             datetime.now().isoformat(timespec="seconds"), file_id)
+        )
+        conn.execute(BUMP_VERSION_SQL)
+
+def set_document_namespace(file_id, namespace):
+    conn = _connect()
+    with conn:
+        conn.execute("UPDATE documents SET namespace = ?, updated_at = ? WHERE id = ?",
+                     (namespace, datetime.now().isoformat(timespec="seconds"), file_id))
+        conn.execute(BUMP_VERSION_SQL)
 
 def delete_document_record(file_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM documents WHERE id = ?", (file_id,))
-    conn.commit()
-    conn.close()
+    delete_document_records([file_id])
+
+def delete_document_records(file_ids: List[int]):
+    if not file_ids:
+        return
+    conn = _connect()
+    rows = [(file_id,) for file_id in file_ids]
+    with conn:
+        conn.executemany("DELETE FROM documents WHERE id = ?", rows)
+        conn.executemany("DELETE FROM document_profiles WHERE file_id = ?", rows)
+        conn.execute(BUMP_VERSION_SQL)
 
 def get_document_by_filename(filename):
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM documents WHERE filename = ?", (filename,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        return dict(row)
-    return None
-
-# Initialize DB on module load (or call explicitly in main)
-init_db()
+    row = _connect().execute(DOCUMENT_BY_FILENAME_SQL, (filename,)).fetchone()
+    return dict(row) if row else None
+
+def get_documents_by_filenames(filenames: List[str]) -> Dict[str, dict]:
+    if not filenames:
+        return {}
+    placeholders = ",".join("?" * len(filenames))
+    rows = _connect().execute(f"SELECT * FROM documents WHERE filename IN ({placeholders})", list(filenames))
+    return {row["filename"]: dict(row) for row in rows}
+
+def get_document_by_id(file_id):
+    row = _connect().execute(DOCUMENT_BY_ID_SQL, (file_id,)).fetchone()
+    return dict(row) if row else None
+
+def insert_manifest_entries(file_id, entries):
+    """entries: iterable of (vector_id, page, chunk_index, content_hash)."""
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO vector_manifest (vector_id, file_id, page, chunk_index, content_hash) VALUES (?, ?, ?, ?, ?)",
+            [(vector_id, file_id, page, chunk_index, content_hash) for vector_id, page, chunk_index, content_hash in entries]
+        )
+
+def get_manifest_vector_ids(file_id):
+    rows = _connect().execute("SELECT vector_id FROM vector_manifest WHERE file_id = ?", (file_id,))
+    return [row[0] for row in rows]
+
+def get_manifest_pages(file_id) -> Dict[str, Optional[int]]:
+    rows = _connect().execute("SELECT vector_id, page FROM vector_manifest WHERE file_id = ?", (file_id,))
+    return {row[0]: row[1] for row in rows}
+
+def delete_manifest_entries(file_id, vector_ids=None):
+    conn = _connect()
+    with conn:
+        if vector_ids is None:
+            conn.execute("DELETE FROM vector_manifest WHERE file_id = ?", (file_id,))
+        else:
+            conn.executemany("DELETE FROM vector_manifest WHERE vector_id = ?", [(v,) for v in vector_ids])
+
+def audit_manifest():
+    """Returns file_ids present in only one of `documents` and `vector_manifest`."""
+    conn = _connect()
+    orphaned_vectors = [row[0] for row in conn.execute('''
+        SELECT DISTINCT m.file_id FROM vector_manifest m
+        LEFT JOIN documents d ON d.id = m.file_id
+        WHERE d.id IS NULL
+    ''')]
+    unindexed_documents = [row[0] for row in conn.execute('''
+        SELECT d.id FROM documents d
+        WHERE NOT EXISTS (SELECT 1 FROM vector_manifest m WHERE m.file_id = d.id)
+    ''')]
+    return {
+        "orphaned_vector_file_ids": orphaned_vectors,
+        "documents_without_vectors": unindexed_documents,
+    }
+
+def upsert_document_profile(file_id, filename, keywords, vector_sum, vector_count):
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO document_profiles (file_id, filename, keywords, vector_sum, vector_count) VALUES (?, ?, ?, ?, ?)",
+            (file_id, filename, keywords, vector_sum, vector_count)
+        )
+
+def get_document_profile(file_id):
+    row = _connect().execute("SELECT * FROM document_profiles WHERE file_id = ?", (file_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_document_profiles():
+    return [dict(row) for row in _connect().execute("SELECT * FROM document_profiles")]
+
+
+if __name__ == '__main__':
+    # python document_util.py audit  -> registry, manifest and vector index consistency
+    import sys
+    import json
+    if sys.argv[1:] != ["audit"]:
+        sys.exit("usage: python document_util.py audit")
+    from pinecone_util import audit_index
+    print(json.dumps({**audit_manifest(), **audit_index()}, indent=2))
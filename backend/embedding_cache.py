@@ -0,0 +1,162 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional, Union
+
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.db")
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Persistent, content-addressed cache in front of an Embeddings model.
+
+    Vectors are keyed by (model, sha256(text)) and stored as float32 blobs in
+    SQLite. embed_documents and embed_query share the same entries, so a chunk
+    indexed once is never re-embedded and popular questions are embedded once.
+    Least recently used rows are evicted once max_entries is exceeded.
+
+    base may be a zero-argument factory; it is only called on the first cache
+    miss. The database is likewise opened on first use, so constructing this
+    at import time costs nothing.
+    """
+
+    def __init__(self, base: Union[Embeddings, Callable[[], Embeddings]], model: str,
+                 db_path: str = DEFAULT_CACHE_PATH, max_entries: int = 50000, lookup_batch_size: int = 500):
+        self._base = base
+        self.model = model
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.lookup_batch_size = lookup_batch_size
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def base(self) -> Embeddings:
+        if not isinstance(self._base, Embeddings):
+            with self._init_lock:
+                if not isinstance(self._base, Embeddings):
+                    self._base = self._base()
+        return self._base  # type: ignore
+
+    def _init_schema(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self._init_schema(conn)
+                    self._ready = True
+        return conn
+
+    def _key(self, text: str) -> str:
+        return f"{self.model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        conn = self._conn()
+        found = {}
+        for start in range(0, len(keys), self.lookup_batch_size):
+            batch = keys[start:start + self.lookup_batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        if found:
+            now = time.time()
+            conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                             [(now, key) for key in found])
+            conn.commit()
+        return found
+
+    def _store(self, items: Dict[str, List[float]]):
+        if not items:
+            return
+        conn = self._conn()
+        now = time.time()
+        conn.executemany(
+            "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+            [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        )
+        conn.commit()
+        # Counted in the database, since other processes sharing the cache file insert too
+        overflow = self._count() - self.max_entries
+        if overflow > 0:
+            self._evict(overflow)
+
+    def _count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _evict(self, count: int):
+        conn = self._conn()
+        cursor = conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (count,)
+        )
+        conn.commit()
+        with self._lock:
+            self._evictions += cursor.rowcount
+
+    def _embed(self, texts: List[str], embed_fn) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self._hits += len(keys) - len(missing)
+            self._misses += len(missing)
+
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(fresh)
+            cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, self.base.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], lambda texts: [self.base.embed_query(texts[0])])[0]
+
+    def stats(self) -> dict:
+        entries = self._count()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "model": self.model,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "evictions": self._evictions,
+            }
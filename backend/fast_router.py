@@ -0,0 +1,253 @@
+import os
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from document_util import get_document_profile, get_document_profiles, get_registry_version, upsert_document_profile
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+STOPWORDS = {
+    "the", "and", "for", "are", "what", "which", "who", "how", "does", "with", "that", "this",
+    "from", "under", "about", "into", "any", "can", "law", "laws", "pdf", "not", "there", "their",
+    "have", "has", "was", "were", "will", "shall", "may", "its", "all", "other", "such", "than",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if len(t) > 2 and t not in STOPWORDS and not t.isdigit()]
+
+
+def count_keywords(texts: Iterable[str], counts: Optional[Counter] = None) -> Counter:
+    counts = Counter() if counts is None else counts
+    for text in texts:
+        counts.update(tokenize(text))
+    return counts
+
+
+def build_keyword_profile(texts: Iterable[str] = (), top_n: int = 300, counts: Optional[Counter] = None) -> dict:
+    """Top keywords of the texts, or of counts already gathered with count_keywords."""
+    counts = count_keywords(texts) if counts is None else counts
+    return dict(counts.most_common(top_n))
+
+
+def save_document_profile(file_id: int, filename: str, texts: Iterable[str], vector_sum=None, vector_count: int = 0,
+                          keyword_counts: Optional[Counter] = None):
+    """
+    Stores the keyword profile and summed chunk embeddings used by FastRouter.
+    keyword_counts (from count_keywords) replaces texts when the caller
+    counted keywords while streaming the chunks.
+    """
+    if vector_sum is not None:
+        vector_sum = np.asarray(vector_sum, dtype=np.float32).tobytes()
+    keywords = build_keyword_profile(texts, counts=keyword_counts)
+    upsert_document_profile(file_id, filename, json.dumps(keywords), vector_sum, vector_count)
+
+
+def update_document_profile(file_id: int, filename: str, texts: Iterable[str],
+                            added_sum=None, added_count: int = 0, removed_sum=None, removed_count: int = 0,
+                            keyword_counts: Optional[Counter] = None):
+    """Rebuilds keywords from the full text but adjusts the embedding sum by the diff only."""
+    existing = get_document_profile(file_id)
+    vector_sum, vector_count = None, 0
+    if existing and existing["vector_sum"]:
+        vector_sum = np.frombuffer(existing["vector_sum"], dtype=np.float32).copy()
+        vector_count = existing["vector_count"]
+    for delta, count, sign in ((added_sum, added_count, 1), (removed_sum, removed_count, -1)):
+        if delta is None or not count:
+            continue
+        delta = np.asarray(delta, dtype=np.float32)
+        vector_sum = sign * delta if vector_sum is None else vector_sum + sign * delta
+        vector_count += sign * count
+    if vector_count <= 0:
+        vector_sum, vector_count = None, 0
+    save_document_profile(file_id, filename, texts, vector_sum, vector_count, keyword_counts=keyword_counts)
+
+
+class FastRouter:
+    """
+    Local pre-router that picks a source without the LLM classifier.
+
+    Each document is scored by title overlap and tf-idf cosine against its
+    keyword profile, optionally averaged with the cosine between the query
+    embedding and the document centroid. The fast path is taken only when the
+    best score clears min_score and beats the runner-up by min_margin; anything
+    else (greetings, follow-ups, ambiguous questions) goes to the LLM router.
+    A sample of fast-path decisions is re-checked by the LLM in the background
+    to measure agreement. Follow-up questions always go to the LLM router,
+    which sees the chat history.
+    """
+
+    def __init__(self, embedding=None, min_score: float = 0.3, min_margin: float = 0.1,
+                 audit_rate: float = 0.05, enabled: bool = True):
+        self.embedding = embedding
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.audit_rate = audit_rate
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._profiles = None
+        self._profiles_version = None
+        self._audit_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="router-audit")
+        self._stats = {
+            "fast_path": 0,
+            "llm_path": 0,
+            "fast_ms_total": 0.0,
+            "llm_ms_total": 0.0,
+            "audits": 0,
+            "audit_agreements": 0,
+        }
+
+    def refresh(self):
+        with self._lock:
+            self._profiles = None
+
+    def _load_profiles(self):
+        with self._lock:
+            # Other worker processes bump the registry version when documents change
+            version = get_registry_version()
+            if self._profiles is not None and version == self._profiles_version:
+                return self._profiles
+            self._profiles_version = version
+
+            rows = get_document_profiles()
+            doc_freq = Counter()
+            for row in rows:
+                doc_freq.update(json.loads(row["keywords"]).keys())
+            total = max(len(rows), 1)
+            idf = {term: math.log(1 + total / df) for term, df in doc_freq.items()}
+
+            profiles = []
+            for row in rows:
+                centroid = None
+                if row["vector_sum"] and row["vector_count"]:
+                    centroid = np.frombuffer(row["vector_sum"], dtype=np.float32)
+                    centroid = centroid / (np.linalg.norm(centroid) or 1.0)
+                weights = {term: count * idf[term] for term, count in json.loads(row["keywords"]).items()}
+                norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+                profiles.append({
+                    "filename": row["filename"],
+                    "title_tokens": set(tokenize(os.path.splitext(row["filename"])[0].replace("_", " "))),
+                    "weights": {term: w / norm for term, w in weights.items()},
+                    "centroid": centroid,
+                })
+            self._profiles = (profiles, idf)
+            return self._profiles
+
+    def score(self, question: str) -> List[Tuple[str, float]]:
+        profiles, idf = self._load_profiles()
+        tokens = set(tokenize(question))
+        if not profiles or not tokens:
+            return []
+
+        query_weights = {t: idf.get(t, 0.0) for t in tokens}
+        query_norm = math.sqrt(sum(w * w for w in query_weights.values())) or 1.0
+
+        query_vector = None
+        if self.embedding is not None and any(p["centroid"] is not None for p in profiles):
+            query_vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+            query_vector /= (np.linalg.norm(query_vector) or 1.0)
+
+        scored = []
+        for profile in profiles:
+            title_tokens = profile["title_tokens"]
+            title = len(tokens & title_tokens) / len(title_tokens) if title_tokens else 0.0
+            keywords = sum(w * profile["weights"].get(t, 0.0) for t, w in query_weights.items()) / query_norm
+            signals = [title, keywords]
+            if query_vector is not None and profile["centroid"] is not None:
+                signals.append(float(np.dot(query_vector, profile["centroid"])))
+            # No lexical evidence at all means we can't tell small talk from a query
+            score = sum(signals) / len(signals) if (title or keywords) else 0.0
+            scored.append((profile["filename"], score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored
+
+    def pick(self, question: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        scored = self.score(question)
+        if not scored:
+            return None
+        best_source, best = scored[0]
+        runner_up = scored[1][1] if len(scored) > 1 else 0.0
+        if best >= self.min_score and best - runner_up >= self.min_margin:
+            return best_source
+        return None
+
+    def route(self, question: str, llm_route: Callable[[], Tuple[Optional[List[str]], str]],
+              audit_route: Optional[Callable[[], Tuple[Optional[List[str]], str]]] = None,
+              chat_history=None) -> Tuple[Optional[List[str]], str]:
+        """
+        Same contract as the LLM router: returns (sources, response_text). The
+        fast path only ever returns one source; a question spanning several
+        documents has no clear margin and falls through to the LLM.
+        audit_route re-checks a sample of fast-path picks and should not count
+        as routing work; without it no audit runs.
+        """
+        started = time.perf_counter()
+        source = None if chat_history else self.pick(question)
+        if source is not None:
+            with self._lock:
+                self._stats["fast_path"] += 1
+                self._stats["fast_ms_total"] += (time.perf_counter() - started) * 1000
+            if audit_route is not None and random.random() < self.audit_rate:
+                self._audit_pool.submit(self._audit, source, audit_route)
+            return [source], f"False\n{source}"
+
+        result = llm_route()
+        with self._lock:
+            self._stats["llm_path"] += 1
+            self._stats["llm_ms_total"] += (time.perf_counter() - started) * 1000
+        return result
+
+    async def aroute(self, question: str, allm_route, audit_route=None, chat_history=None) -> Tuple[Optional[List[str]], str]:
+        """Async route(); scoring may embed the question, so it runs off the event loop."""
+        started = time.perf_counter()
+        source = None if chat_history else await asyncio.to_thread(self.pick, question)
+        if source is not None:
+            with self._lock:
+                self._stats["fast_path"] += 1
+                self._stats["fast_ms_total"] += (time.perf_counter() - started) * 1000
+            if audit_route is not None and random.random() < self.audit_rate:
+                self._audit_pool.submit(self._audit, source, audit_route)
+            return [source], f"False\n{source}"
+
+        result = await allm_route()
+        with self._lock:
+            self._stats["llm_path"] += 1
+            self._stats["llm_ms_total"] += (time.perf_counter() - started) * 1000
+        return result
+
+    def _audit(self, fast_source: str, llm_route):
+        try:
+            llm_sources, _ = llm_route()
+        except Exception as e:
+            logging.error(f"Router audit failed: {str(e)}", exc_info=True)
+            return
+        with self._lock:
+            self._stats["audits"] += 1
+            if llm_sources and llm_sources[0] == fast_source:
+                self._stats["audit_agreements"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        routed = s["fast_path"] + s["llm_path"]
+        return {
+            "fast_path": s["fast_path"],
+            "llm_path": s["llm_path"],
+            "fast_path_hit_rate": round(s["fast_path"] / routed, 4) if routed else None,
+            "fast_avg_ms": round(s["fast_ms_total"] / s["fast_path"], 2) if s["fast_path"] else None,
+            "llm_avg_ms": round(s["llm_ms_total"] / s["llm_path"], 2) if s["llm_path"] else None,
+            "audits": s["audits"],
+            "llm_agreement": round(s["audit_agreements"] / s["audits"], 4) if s["audits"] else None,
+        }
@@ -0,0 +1,474 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter, deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from pinecone_util import (
+    VectorIdBuilder,
+    extract_text_from_pdf,
+    get_pdf_page_count,
+    iter_pdf_pages,
+    iter_split_documents,
+    load_document,
+)
+from document_util import insert_manifest_entries, get_manifest_pages, get_manifest_vector_ids, delete_manifest_entries
+from fast_router import count_keywords, save_document_profile, update_document_profile
+
+
+def _extract_page_range(file_path: str, start_page: int, end_page: int) -> List[Document]:
+    # Top-level so it can be pickled into the process pool
+    return extract_text_from_pdf(file_path, start_page, end_page)
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class StageTimer:
+    """Counts items per stage and the wall time from first start to last finish."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, dict] = {}
+
+    def start(self, stage: str):
+        with self._lock:
+            self._stages.setdefault(stage, {"items": 0, "started": time.perf_counter(), "finished": None})
+
+    def finish(self, stage: str, items: int):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {"items": 0, "started": time.perf_counter(), "finished": None})
+            entry["items"] += items
+            entry["finished"] = time.perf_counter()
+
+    def report(self) -> dict:
+        report = {}
+        with self._lock:
+            for stage, entry in self._stages.items():
+                seconds = (entry["finished"] or entry["started"]) - entry["started"]
+                report[stage] = {
+                    "items": entry["items"],
+                    "seconds": round(seconds, 3),
+                    "per_second": round(entry["items"] / seconds, 1) if seconds > 0 else None,
+                }
+        return report
+
+
+class InMemoryIndex:
+    """Local stand-in for a Pinecone index: upsert/delete/fetch by id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.vectors: Dict[str, dict] = {}
+
+    def upsert(self, vectors: List[dict], **kwargs):
+        with self._lock:
+            for vector in vectors:
+                self.vectors[vector["id"]] = vector
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs):
+        with self._lock:
+            for vector_id in ids or []:
+                self.vectors.pop(vector_id, None)
+
+    def fetch(self, ids: List[str], **kwargs):
+        with self._lock:
+            return {"vectors": {i: self.vectors[i] for i in ids if i in self.vectors}}
+
+
+class IngestPipeline:
+    """
+    parse -> split -> embed -> upsert for a single file, as a stream.
+
+    PDFs are parsed in page ranges across a process pool. Pages are chunked
+    as they arrive and chunks are grouped into embedding batches, so a file
+    is never held in memory as a whole. Embedding and upsert run on bounded
+    thread pools shared by every call, so concurrent uploads can't exceed the
+    configured number of in-flight OpenAI/Pinecone requests. Each upsert
+    batch is sent as soon as its embedding batch returns.
+    """
+
+    def __init__(
+        self,
+        embedding,
+        index,
+        parse_workers: int = 4,
+        pages_per_task: int = 25,
+        embed_batch_size: int = 128,
+        embed_concurrency: int = 4,
+        upsert_batch_size: int = 64,
+        upsert_concurrency: int = 4,
+        delete_batch_size: int = 1000,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        text_key: str = "text",
+        record_manifest: bool = True,
+        keyword_index=None,
+        page_cache=None,
+    ):
+        self.embedding = embedding
+        self.index = index
+        self.parse_workers = parse_workers
+        self.pages_per_task = pages_per_task
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.delete_batch_size = delete_batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.text_key = text_key
+        self.record_manifest = record_manifest
+        self.keyword_index = keyword_index
+        self.page_cache = page_cache
+        self._parse_pool = None
+        self._parse_pool_lock = threading.Lock()
+        self.max_pending_embeds = 2 * embed_concurrency
+        self.max_pending_upserts = 4 * upsert_concurrency
+        self._embed_pool = ThreadPoolExecutor(max_workers=embed_concurrency, thread_name_prefix="embed")
+        self._upsert_pool = ThreadPoolExecutor(max_workers=upsert_concurrency, thread_name_prefix="upsert")
+
+    def _get_parse_pool(self):
+        with self._parse_pool_lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+            return self._parse_pool
+
+    def _with_retry(self, fn, *args, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.retry_backoff * (2 ** attempt)
+                logging.warning(f"Retrying {getattr(fn, '__name__', fn)} in {delay}s after error: {e}")
+                time.sleep(delay)
+
+    def iter_pages(self, file_path: str, content_hash: Optional[str] = None) -> Iterator[Document]:
+        """
+        Pages in document order. With a page cache and the file's content
+        hash, pages extracted before are read from the cache, and newly
+        extracted ones are written to it.
+        """
+        if self.page_cache is None or not content_hash:
+            yield from self._extract_pages(file_path)
+        elif self.page_cache.has(content_hash):
+            yield from self.page_cache.iter_pages(content_hash, os.path.basename(file_path))
+        else:
+            yield from self.page_cache.write_through(content_hash, self._extract_pages(file_path))
+
+    def _extract_pages(self, file_path: str) -> Iterator[Document]:
+        """
+        Large PDFs are parsed in page ranges on the process pool with at most
+        two ranges per worker in flight, so memory holds those ranges rather
+        than the whole file.
+        """
+        if not file_path.endswith('.pdf'):
+            yield from load_document(file_path)
+            return
+
+        page_count = get_pdf_page_count(file_path)
+        if page_count <= self.pages_per_task or self.parse_workers <= 1:
+            yield from iter_pdf_pages(file_path)
+            return
+
+        pool = self._get_parse_pool()
+        in_flight = deque()
+        for start in range(0, page_count, self.pages_per_task):
+            in_flight.append(pool.submit(_extract_page_range, file_path, start,
+                                         min(start + self.pages_per_task, page_count)))
+            if len(in_flight) >= 2 * self.parse_workers:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+    def parse(self, file_path: str) -> List[Document]:
+        return list(self.iter_pages(file_path))
+
+    def iter_chunks(self, file_path: str, file_id: int, timer: StageTimer, counts: dict,
+                    content_hash: Optional[str] = None) -> Iterator[Tuple[Document, tuple]]:
+        """(chunk, manifest entry) pairs as pages are read; counts["pages"/"chunks"] keep running totals."""
+        source = os.path.basename(file_path)
+        vector_ids = VectorIdBuilder(file_id)
+        timer.start("parse")
+        timer.start("split")
+        for page in self.iter_pages(file_path, content_hash):
+            timer.finish("parse", 1)
+            counts["pages"] += 1
+            chunks = list(iter_split_documents([page]))
+            timer.finish("split", len(chunks))
+            for chunk in chunks:
+                chunk.metadata['file_id'] = file_id
+                # Loaders record the path they were given; jobs read from a spool directory
+                chunk.metadata['source'] = source
+                counts["chunks"] += 1
+                yield chunk, vector_ids.entry(chunk)
+
+    def _upsert_batch(self, records: List[dict], entries: List[tuple], file_id: Optional[int],
+                      namespace: Optional[str]):
+        self._with_retry(self.index.upsert, vectors=records, namespace=namespace)
+        # Recorded per batch, so an interrupted run can resume from here
+        if file_id is not None:
+            insert_manifest_entries(file_id, entries)
+
+    def embed_and_upsert(self, chunks: Iterable[Tuple[Document, tuple]], timer: StageTimer,
+                         file_id: Optional[int] = None, progress: Optional[Callable] = None,
+                         counts: Optional[dict] = None, namespace: Optional[str] = None):
+        """
+        Embeds and upserts (chunk, manifest entry) pairs, pulling them from the
+        iterable only as batches are sent, and returns the element-wise sum of
+        the vectors (for router centroids).
+
+        At most 2 * embed_concurrency embedding batches and 4 * upsert_concurrency
+        upsert batches are in flight, so memory is bounded by batch sizes, not
+        by the length of the file. Vectors go to `namespace` (the index's default
+        namespace when None). With a file_id, manifest entries are written as
+        each upsert batch succeeds. progress(**counters) gets running totals.
+        """
+        vector_sum = None
+        embedded = upserted = 0
+        pending_embeds = deque()   # (future, batch)
+        pending_upserts = deque()  # (future, count)
+
+        def collect_embeds():
+            nonlocal vector_sum, embedded
+            future, batch = pending_embeds.popleft()
+            vectors = future.result()
+            timer.finish("embed", len(vectors))
+            embedded += len(vectors)
+            batch_sum = np.asarray(vectors, dtype=np.float32).sum(axis=0)
+            vector_sum = batch_sum if vector_sum is None else vector_sum + batch_sum
+
+            records = []
+            for (chunk, entry), values in zip(batch, vectors):
+                metadata = dict(chunk.metadata)
+                metadata[self.text_key] = chunk.page_content
+                records.append({"id": entry[0], "values": values, "metadata": metadata})
+            for start in range(0, len(records), self.upsert_batch_size):
+                record_batch = records[start:start + self.upsert_batch_size]
+                batch_entries = [entry for _, entry in batch[start:start + self.upsert_batch_size]]
+                pending_upserts.append((
+                    self._upsert_pool.submit(self._upsert_batch, record_batch, batch_entries, file_id, namespace),
+                    len(record_batch),
+                ))
+
+        def collect_upserts():
+            nonlocal upserted
+            future, count = pending_upserts.popleft()
+            future.result()
+            timer.finish("upsert", count)
+            upserted += count
+
+        def report():
+            if progress is not None:
+                totals = {"pages_parsed": counts["pages"], "chunks_total": counts["chunks"]} if counts else {}
+                progress(chunks_embedded=embedded, vectors_upserted=upserted, **totals)
+
+        timer.start("embed")
+        timer.start("upsert")
+        for batch in _batched(chunks, self.embed_batch_size):
+            pending_embeds.append((
+                self._embed_pool.submit(self._with_retry, self.embedding.embed_documents,
+                                        [chunk.page_content for chunk, _ in batch]),
+                batch,
+            ))
+            while len(pending_embeds) > self.max_pending_embeds:
+                collect_embeds()
+            while pending_upserts and (pending_upserts[0][0].done() or len(pending_upserts) > self.max_pending_upserts):
+                collect_upserts()
+            report()
+        while pending_embeds:
+            collect_embeds()
+        while pending_upserts:
+            collect_upserts()
+        report()
+        return vector_sum
+
+    def fetch_vector_sum(self, vector_ids: List[str], namespace: Optional[str] = None):
+        """Sums stored vectors by id; used to take removed chunks out of the router centroid."""
+        vector_sum = None
+        for start in range(0, len(vector_ids), self.upsert_batch_size):
+            response = self._with_retry(self.index.fetch, ids=vector_ids[start:start + self.upsert_batch_size],
+                                        namespace=namespace)
+            vectors = response["vectors"] if isinstance(response, dict) else response.vectors
+            for vector in vectors.values():
+                values = vector["values"] if isinstance(vector, dict) else vector.values
+                values = np.asarray(values, dtype=np.float32)
+                vector_sum = values if vector_sum is None else vector_sum + values
+        return vector_sum
+
+    def delete_vectors(self, vector_ids: List[str], namespace: Optional[str] = None):
+        for start in range(0, len(vector_ids), self.delete_batch_size):
+            self._with_retry(self.index.delete, ids=vector_ids[start:start + self.delete_batch_size],
+                             namespace=namespace)
+
+    def run(self, file_path: str, file_id: int, progress: Optional[Callable] = None, resume: bool = False,
+            namespace: Optional[str] = None, content_hash: Optional[str] = None) -> dict:
+        """
+        Indexes one file and returns per-stage item counts and rates. Pages are
+        read, chunked and embedded as a stream, so the stages overlap.
+
+        Vectors are written to `namespace` (see pinecone_util.new_namespace).
+        With resume=True, chunks already in the manifest (committed by an
+        earlier, interrupted run) are not embedded or upserted again.
+        content_hash (sha256 of the file) lets pages come from the page cache.
+        """
+        timer = StageTimer()
+        started = time.perf_counter()
+        counts = {"pages": 0, "chunks": 0}
+        keywords = Counter()
+        done_ids = set(get_manifest_vector_ids(file_id)) if resume and self.record_manifest else set()
+        resumed = []
+
+        def pending_chunks():
+            for batch in _batched(self.iter_chunks(file_path, file_id, timer, counts, content_hash),
+                                  self.embed_batch_size):
+                count_keywords((chunk.page_content for chunk, _ in batch), keywords)
+                if self.keyword_index is not None:
+                    self.keyword_index.add(file_id, [entry[0] for _, entry in batch], [chunk for chunk, _ in batch])
+                for chunk, entry in batch:
+                    if entry[0] in done_ids:
+                        resumed.append(entry[0])
+                    else:
+                        yield chunk, entry
+
+        vector_sum = self.embed_and_upsert(pending_chunks(), timer, file_id=file_id if self.record_manifest else None,
+                                           progress=progress, counts=counts, namespace=namespace)
+        if resumed:
+            resumed_sum = self.fetch_vector_sum(resumed, namespace)
+            if resumed_sum is not None:
+                vector_sum = resumed_sum if vector_sum is None else vector_sum + resumed_sum
+        if self.record_manifest:
+            save_document_profile(file_id, os.path.basename(file_path), (), vector_sum, counts["chunks"],
+                                  keyword_counts=keywords)
+
+        total = time.perf_counter() - started
+        return {
+            "pages": counts["pages"],
+            "chunks": counts["chunks"],
+            "resumed": len(resumed),
+            "seconds": round(total, 3),
+            "chunks_per_second": round(counts["chunks"] / total, 1) if total > 0 else None,
+            "stages": timer.report(),
+        }
+
+    def update(self, file_path: str, file_id: int, progress: Optional[Callable] = None,
+               namespace: Optional[str] = None, content_hash: Optional[str] = None) -> dict:
+        """
+        Re-indexes a new revision of an already indexed file.
+
+        Vector IDs are content-addressed, so diffing the new IDs against the
+        manifest tells exactly which chunks were added or removed. Only added
+        chunks are embedded and upserted, and only removed ones are deleted.
+        Chunks that only moved to another page keep their ID and are upserted
+        again so their page metadata stays right (their embeddings come from
+        the embedding cache). The same diff makes an interrupted update
+        resumable.
+        """
+        timer = StageTimer()
+        started = time.perf_counter()
+        counts = {"pages": 0, "chunks": 0}
+        keywords = Counter()
+        old_pages = get_manifest_pages(file_id)
+        entries = []
+        added = []
+        moved = []
+
+        def added_chunks():
+            for batch in _batched(self.iter_chunks(file_path, file_id, timer, counts, content_hash),
+                                  self.embed_batch_size):
+                count_keywords((chunk.page_content for chunk, _ in batch), keywords)
+                entries.extend(entry for _, entry in batch)
+                new = [(chunk, entry) for chunk, entry in batch
+                       if entry[0] not in old_pages or old_pages[entry[0]] != entry[1]]
+                for _, entry in new:
+                    (moved if entry[0] in old_pages else added).append(entry[0])
+                if self.keyword_index is not None and new:
+                    self.keyword_index.add(file_id, [entry[0] for _, entry in new], [chunk for chunk, _ in new])
+                yield from new
+
+        added_sum = self.embed_and_upsert(added_chunks(), timer, file_id=file_id, progress=progress, counts=counts,
+                                          namespace=namespace)
+        removed = sorted(set(old_pages) - {entry[0] for entry in entries})
+
+        timer.start("delete")
+        # A moved chunk's vector is unchanged: it counts as removed and added again in the router centroid
+        removed_sum = self.fetch_vector_sum(removed + moved, namespace) if removed or moved else None
+        self.delete_vectors(removed, namespace)
+        timer.finish("delete", len(removed))
+
+        # Refreshes chunk positions for unchanged rows too
+        insert_manifest_entries(file_id, entries)
+        delete_manifest_entries(file_id, removed)
+        update_document_profile(file_id, os.path.basename(file_path), (),
+                                added_sum, len(added) + len(moved), removed_sum, len(removed) + len(moved),
+                                keyword_counts=keywords)
+        if self.keyword_index is not None:
+            self.keyword_index.delete(removed)
+
+        total = time.perf_counter() - started
+        return {
+            "pages": counts["pages"],
+            "chunks": counts["chunks"],
+            "added": len(added),
+            "removed": len(removed),
+            "moved": len(moved),
+            "unchanged": counts["chunks"] - len(added) - len(moved),
+            "seconds": round(total, 3),
+            "stages": timer.report(),
+        }
+
+    def shutdown(self):
+        self._embed_pool.shutdown(wait=True)
+        self._upsert_pool.shutdown(wait=True)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True)
+
+
+_default_pipeline = None
+_default_pipeline_lock = threading.Lock()
+
+def get_default_pipeline() -> IngestPipeline:
+    """Pipeline wired to the real embedding function and Pinecone index."""
+    global _default_pipeline
+    with _default_pipeline_lock:
+        if _default_pipeline is None:
+            from pinecone_util import get_embedding_function, get_index
+            from bm25_index import get_bm25_index
+            from page_cache import get_page_cache
+            _default_pipeline = IngestPipeline(
+                get_embedding_function(),
+                get_index(),
+                keyword_index=get_bm25_index(),
+                page_cache=get_page_cache() if os.getenv("PAGE_CACHE_ENABLED", "1") == "1" else None,
+                parse_workers=int(os.getenv("INGEST_PARSE_WORKERS", "4")),
+                embed_batch_size=int(os.getenv("INGEST_EMBED_BATCH_SIZE", "128")),
+                embed_concurrency=int(os.getenv("INGEST_EMBED_CONCURRENCY", "4")),
+                upsert_batch_size=int(os.getenv("INGEST_UPSERT_BATCH_SIZE", "64")),
+                upsert_concurrency=int(os.getenv("INGEST_UPSERT_CONCURRENCY", "4")),
+            )
+        return _default_pipeline
+
+
+if __name__ == '__main__':
+    # Dry run against local fakes: python ingest_pipeline.py <file> [<file> ...]
+    import json
+
+    pipeline = IngestPipeline(DeterministicFakeEmbedding(size=3072), InMemoryIndex(), record_manifest=False)
+    for file_id, path in enumerate(sys.argv[1:], start=1):
+        print(path, json.dumps(pipeline.run(path, file_id), indent=2))
+    pipeline.shutdown()
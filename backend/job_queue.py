@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Callable, List, Optional, Set
+
+DEFAULT_JOBS_DB_PATH = os.getenv("INGEST_JOBS_DB_PATH",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db"))
+# Uploaded files wait here (one directory per job) until their job has finished
+DEFAULT_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+PROGRESS_FIELDS = ("pages_parsed", "chunks_total", "chunks_embedded", "vectors_upserted")
+
+# Kind prefix of jobs run by another process (bulk_ingest.py) rather than by the workers
+EXTERNAL_KIND_PREFIX = "bulk-"
+
+JOB_BY_ID_SQL = "SELECT * FROM ingest_jobs WHERE id = ?"
+# Queued or running; an external job only counts while it keeps heartbeating
+ACTIVE_JOB_SQL = (f"(status = '{JOB_QUEUED}' OR (status = '{JOB_RUNNING}' AND "
+                  f"(kind NOT LIKE '{EXTERNAL_KIND_PREFIX}%' OR heartbeat >= ?)))")
+
+
+class JobQueue:
+    """
+    Durable ingestion jobs in SQLite, run by a bounded pool of worker threads.
+
+    A worker claims a job in a write transaction, so several processes (e.g.
+    gunicorn workers) can share one jobs database without running a job twice.
+    Running jobs refresh a heartbeat with every progress update; a job whose
+    heartbeat is older than `lease_seconds` belonged to a worker that died and
+    is claimed again, and the handler resumes it from what was already
+    committed. After `max_attempts` claims a job is failed instead.
+
+    handler(job, progress) does the work and returns a JSON-serializable
+    result; progress(**counts) records any of PROGRESS_FIELDS. on_failure(job)
+    runs once when a job is given up on.
+
+    Work done outside the workers (bulk_ingest.py) is recorded with
+    begin_external/finish_external, so it shows up in /jobs and blocks jobs
+    for the same document. Workers never claim it; if its process stops
+    heartbeating for `lease_seconds` it no longer counts as active.
+    """
+
+    def __init__(self, handler: Callable[[dict, Callable], dict], on_failure: Optional[Callable[[dict], None]] = None,
+                 path: str = DEFAULT_JOBS_DB_PATH, workers: int = 2, poll_seconds: float = 1.0,
+                 lease_seconds: float = 600.0, max_attempts: int = 3):
+        self.handler = handler
+        self.on_failure = on_failure
+        self.path = path
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are opened explicitly in _claim
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS ingest_jobs (
+                            id TEXT PRIMARY KEY,
+                            kind TEXT NOT NULL,
+                            filename TEXT NOT NULL,
+                            file_path TEXT NOT NULL,
+                            file_id INTEGER,
+                            status TEXT NOT NULL,
+                            pages_parsed INTEGER DEFAULT 0,
+                            chunks_total INTEGER DEFAULT 0,
+                            chunks_embedded INTEGER DEFAULT 0,
+                            vectors_upserted INTEGER DEFAULT 0,
+                            attempts INTEGER DEFAULT 0,
+                            error TEXT,
+                            result TEXT,
+                            heartbeat REAL,
+                            created_at REAL NOT NULL,
+                            updated_at REAL NOT NULL
+                        )
+                    ''')
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, created_at)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_file_id ON ingest_jobs (file_id, status)")
+                    self._schema_ready = True
+        return conn
+
+    def enqueue(self, kind: str, filename: str, file_path: str, file_id: Optional[int] = None,
+                job_id: Optional[str] = None) -> str:
+        """
+        Returns the new job's id. If file_id already has a queued or running
+        job (in any process), nothing is queued and that job's id is returned.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            active = self._active_job(conn, file_id, now)
+            if active is None:
+                conn.execute(
+                    "INSERT INTO ingest_jobs (id, kind, filename, file_path, file_id, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, filename, file_path, file_id, JOB_QUEUED, now, now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if active is not None:
+            return active[0]
+        self._wakeup.set()
+        return job_id
+
+    def begin_external(self, kind: str, filename: str, file_path: str, file_id: int,
+                       job_id: Optional[str] = None) -> Optional[str]:
+        """
+        Records work this process is about to do itself as a running job of
+        kind "bulk-<kind>" and returns its id, or None if file_id already has
+        an active job. Call update_progress to heartbeat and finish_external
+        when done.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            active = self._active_job(conn, file_id, now)
+            if active is None:
+                conn.execute(
+                    "INSERT INTO ingest_jobs (id, kind, filename, file_path, file_id, status, attempts, heartbeat, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?)",
+                    (job_id, f"{EXTERNAL_KIND_PREFIX}{kind}", filename, file_path, file_id, JOB_RUNNING, now, now, now)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id if active is None else None
+
+    def finish_external(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None):
+        self._finish(job_id, JOB_FAILED if error is not None else JOB_SUCCEEDED, result=result, error=error)
+
+    def _active_job(self, conn: sqlite3.Connection, file_id: Optional[int], now: float):
+        """Inside a write transaction: fails external jobs that stopped heartbeating, then finds file_id's active job."""
+        conn.execute(
+            "UPDATE ingest_jobs SET status = ?, error = ?, updated_at = ? "
+            "WHERE status = ? AND kind LIKE ? AND heartbeat < ?",
+            (JOB_FAILED, "Stopped heartbeating", now, JOB_RUNNING, f"{EXTERNAL_KIND_PREFIX}%", now - self.lease_seconds)
+        )
+        if file_id is None:
+            return None
+        return conn.execute(
+            f"SELECT id FROM ingest_jobs WHERE file_id = ? AND {ACTIVE_JOB_SQL} ORDER BY created_at LIMIT 1",
+            (file_id, now - self.lease_seconds)
+        ).fetchone()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._conn().execute(JOB_BY_ID_SQL, (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def active_file_ids(self) -> Set[int]:
+        """Documents with a queued or running job, in any process sharing the database."""
+        rows = self._conn().execute(
+            f"SELECT DISTINCT file_id FROM ingest_jobs WHERE {ACTIVE_JOB_SQL} AND file_id IS NOT NULL",
+            (time.time() - self.lease_seconds,)
+        )
+        return {row[0] for row in rows}
+
+    def update_progress(self, job_id: str, **counts):
+        fields = [field for field in PROGRESS_FIELDS if field in counts]
+        now = time.time()
+        assignments = "".join(f", {field} = ?" for field in fields)
+        self._conn().execute(
+            f"UPDATE ingest_jobs SET heartbeat = ?, updated_at = ?{assignments} WHERE id = ?",
+            (now, now, *[counts[field] for field in fields], job_id)
+        )
+
+    def _finish(self, job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None):
+        self._conn().execute(
+            "UPDATE ingest_jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+
+    def _claim(self) -> Optional[dict]:
+        """Takes the oldest queued job, or a running one whose worker stopped heartbeating."""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT * FROM ingest_jobs WHERE (status = ? OR (status = ? AND heartbeat < ?)) AND kind NOT LIKE ? "
+                "ORDER BY created_at LIMIT 1",
+                (JOB_QUEUED, JOB_RUNNING, now - self.lease_seconds, f"{EXTERNAL_KIND_PREFIX}%")
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE ingest_jobs SET status = ?, attempts = attempts + 1, heartbeat = ?, updated_at = ? WHERE id = ?",
+                    (JOB_RUNNING, now, now, row["id"])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+
+    def _give_up(self, job: dict, error: str):
+        self._finish(job["id"], JOB_FAILED, error=error)
+        if self.on_failure is not None:
+            try:
+                self.on_failure(job)
+            except Exception as e:
+                logging.error(f"Error cleaning up job {job['id']}: {str(e)}", exc_info=True)
+
+    def _run(self, job: dict):
+        if job["attempts"] > self.max_attempts:
+            self._give_up(job, f"Gave up after {self.max_attempts} attempts")
+            return
+        try:
+            result = self.handler(job, lambda **counts: self.update_progress(job["id"], **counts))
+        except Exception as e:
+            logging.error(f"Ingest job {job['id']} ({job['filename']}) failed: {str(e)}", exc_info=True)
+            self._give_up(job, str(e))
+            return
+        self._finish(job["id"], JOB_SUCCEEDED, result=result)
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError as e:
+                logging.error(f"Error claiming ingest job: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self):
+        """Starts the worker threads; safe to call more than once."""
+        with self._start_lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingest-job-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status")
+        return {"workers": self.workers, "running_threads": len(self._threads), **{status: count for status, count in rows}}
@@ -1,53 +1,64 @@
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from pinecone_util import vectorstore
-from langchain.chains import LLMChain
-from typing import List
-from langchain.retrievers.contextual_compression import ContextualCompressionRetriever
-from langchain_cohere import CohereRerank
-
-#vector=vectorstore.as_retriever(search_kwargs={"k": 10})
+from pinecone_util import get_vectorstore, get_embedding_function
+from typing import List, NamedTuple, Optional
+from pydantic import BaseModel, Field
+from langchain_core.output_parsers import StrOutputParser
+from bm25_index import HybridRetriever, get_bm25_index
+from collections import OrderedDict
+import threading
+import os
 
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+RERANKER = os.getenv("RERANKER", "cohere")  # cohere | local | none
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))
+MAX_ROUTED_SOURCES = int(os.getenv("MAX_ROUTED_SOURCES", "3"))
 
-def get_filtered_retriever(matched_source: str):
-    return vectorstore.as_retriever(
-        search_kwargs={
-            "k": 10,
-            "filter": {"source": {"$in": [matched_source]}},
-        }
-    )
+#vector=vectorstore.as_retriever(search_kwargs={"k": 10})
 
+# langchain, langchain_openai and langchain_cohere are imported where they are
+# used: they take seconds to import and most entry points never need them.
 
+def _default_llm():
+    from langchain_openai import ChatOpenAI
+    # stream_usage: streamed answers report token counts too (see tracing.py)
+    return ChatOpenAI(model="gpt-4o-mini", stream_usage=True)  # type: ignore
 
-def get_rag_chain(source: str,):
-    """
-    Create a Retrieval-Augmented Generation (RAG) chain for the given query.
-    """
-    print("source", source, "UNDER MAIN ")
-    filtered_retriever = get_filtered_retriever(source)
 
-    cohere_compressor = CohereRerank(model="rerank-multilingual-v3.0")
-    compression_retriever = ContextualCompressionRetriever(
-        base_compressor=cohere_compressor, base_retriever=filtered_retriever
+def get_filtered_retriever(matched_source: str):
+    document = get_document_by_filename(matched_source)
+    if document and document.get("namespace"):
+        # The document's own namespace holds exactly its chunks
+        search_kwargs = {"k": 10, "namespace": document["namespace"]}
+    else:
+        # Indexed into the shared default namespace (not migrated yet)
+        search_kwargs = {"k": 10, "filter": {"source": {"$in": [matched_source]}}}
+    dense_retriever = get_vectorstore().as_retriever(search_kwargs=search_kwargs)
+    if not HYBRID_RETRIEVAL:
+        return dense_retriever
+    # Exact article numbers and defined terms are found by BM25, then fused with the dense hits
+    return HybridRetriever(
+        dense_retriever=dense_retriever,
+        keyword_index=get_bm25_index(),
+        sources=[matched_source],
+        k=10,
     )
 
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system",
-         "You are ANB regulatory Advisor, an AI assistant specialized in regulatory topics in Saudi Arabia, including Banks, Finance, Payments, AML/CTF, Money Exchange, and Credit Information.\n\n"
-         "Your task is to reformulate the user's input into a **clear, precise, self-contained query** that captures the intent accurately without relying on previous chat turns.\n\n"
-         "**Guidelines for Reformulation:**\n"
-         "1. **Expand abbreviations** (e.g., 'AML' → 'Anti-Money Laundering', 'CC' → 'Credit Card').\n"
-         "2. If the input is vague or incomplete, rephrase to make it legally and regulatorily precise while keeping financial terminology intact.\n"
-         "3. Retain key regulatory context or department-relevant details.\n"
-         "4. Do **not** introduce new assumptions or speculate.\n\n"
-         "Return only the reformulated query."),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}")
-    ])
 
-    qa_prompt = ChatPromptTemplate.from_messages([
+contextualize_q_prompt = ChatPromptTemplate.from_messages([
+    ("system",
+     "You are ANB regulatory Advisor, an AI assistant specialized in regulatory topics in Saudi Arabia, including Banks, Finance, Payments, AML/CTF, Money Exchange, and Credit Information.\n\n"
+     "Your task is to reformulate the user's input into a **clear, precise, self-contained query** that captures the intent accurately without relying on previous chat turns.\n\n"
+     "**Guidelines for Reformulation:**\n"
+     "1. **Expand abbreviations** (e.g., 'AML' → 'Anti-Money Laundering', 'CC' → 'Credit Card').\n"
+     "2. If the input is vague or incomplete, rephrase to make it legally and regulatorily precise while keeping financial terminology intact.\n"
+     "3. Retain key regulatory context or department-relevant details.\n"
+     "4. Do **not** introduce new assumptions or speculate.\n\n"
+     "Return only the reformulated query."),
+    MessagesPlaceholder("chat_history"),
+    ("human", "{input}")
+])
+
+qa_prompt = ChatPromptTemplate.from_messages([
     ("system",
      "You are ANB regulatory Advisor, a domain-specific assistant trained to handle questions related to the regulatory scope in Saudi Arabia.\n\n"
      "You provide factual, concise, and well-referenced answers strictly based on retrieved official SAMA documents or approved policies.\n\n"
@@ -78,12 +89,50 @@ def get_rag_chain(source: str,):
 ])
 
 
-    llm = ChatOpenAI(model="gpt-4o-mini") # type: ignore
-    history_aware_retriever = create_history_aware_retriever(
-        llm, compression_retriever, contextualize_q_prompt
+def build_reranker(mode: str = RERANKER, top_n: int = RERANK_TOP_N):
+    """
+    cohere: hosted multilingual rerank (network round trip per question).
+    local: CPU scorer, an ONNX cross-encoder if RERANK_ONNX_MODEL_DIR is set,
+           else embedding similarity blended with lexical overlap.
+    none: keeps the retriever's order.
+    """
+    from rerankers import LocalReranker, OnnxCrossEncoder, PassthroughReranker, TimedReranker
+
+    if mode == "cohere":
+        from langchain_cohere import CohereRerank
+        reranker = CohereRerank(model="rerank-multilingual-v3.0", top_n=top_n)
+    elif mode == "local":
+        model_dir = os.getenv("RERANK_ONNX_MODEL_DIR")
+        reranker = LocalReranker(
+            embedding=get_embedding_function(),
+            cross_encoder=OnnxCrossEncoder(model_dir) if model_dir else None,
+            top_n=top_n,
+        )
+    elif mode == "none":
+        reranker = PassthroughReranker(top_n=top_n)
+    else:
+        raise ValueError(f"Unknown reranker: {mode}")
+    return TimedReranker(base=reranker, mode=mode)
+
+
+class RagParts(NamedTuple):
+    """The stages of a RAG answer (retrieve, rerank, contextualize, answer), kept separate so each can be run (or awaited) on its own."""
+    retriever: object
+    compressor: object
+    contextualize_chain: object
+    qa_chain: object
+
+
+def get_rag_parts(source: str, llm=None, compressor=None) -> RagParts:
+    from langchain.chains.combine_documents import create_stuff_documents_chain
+
+    llm = llm or _default_llm()
+    return RagParts(
+        retriever=get_filtered_retriever(source),
+        compressor=compressor or build_reranker(),
+        contextualize_chain=contextualize_q_prompt | llm | StrOutputParser(),
+        qa_chain=create_stuff_documents_chain(llm, qa_prompt),
     )
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    return create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
 
 simple_system_prompt = """
@@ -132,12 +181,15 @@ simple_prompt_template = ChatPromptTemplate.from_messages([
 ])
 
 
-from document_util import get_all_documents
+from document_util import get_all_documents, get_document_by_filename, get_registry_version, STATUS_INDEXED
+
+
+def get_routable_filenames() -> List[str]:
+    # Files still being indexed would route questions to an empty source
+    return [doc['filename'] for doc in get_all_documents() if doc['status'] == STATUS_INDEXED]
 
-def get_simple_chain():
-    documents = get_all_documents()
-    filenames = [doc['filename'] for doc in documents]
-    
+
+def build_router_prompt(filenames: List[str]) -> ChatPromptTemplate:
     # Fallback if no documents
     if not filenames:
         filenames_str = "No documents available."
@@ -151,20 +203,171 @@ def get_simple_chain():
         1. If the query is general/off-topic (greetings, jokes, chatbot questions), reply briefly and normally.
         2. If the query refers to laws, articles, penalties, compliance, or SAMA/ Saudi Arabia regulation, outsourcing, NDMO Data Classification/Policy, CyberSecurity, IT Framework — even if mixed with small talk — OR if the query asks about any of the available documents, respond:
         False
-        <one of:
+        <the most relevant filename, one per line, from:
 {filenames_str}
         >
+        Give one filename; give up to {MAX_ROUTED_SOURCES} (most relevant first) only when the query spans several documents, e.g. a law and its implementing regulation.
         3. Use chat history for context.
 
         No summaries. No explanations. No document text. Only return format or normal reply.
         """
 
-    dynamic_prompt_template = ChatPromptTemplate.from_messages([
+    return ChatPromptTemplate.from_messages([
         ("system", "Context: " + dynamic_system_prompt),
         MessagesPlaceholder("chat_history"),
         ("human", "{input}")
     ])
 
-    llm = ChatOpenAI(model="gpt-4o-mini")
-    simple_chain = LLMChain(llm=llm, prompt=dynamic_prompt_template)
+
+def get_simple_chain(llm=None):
+    filenames = get_routable_filenames()
+
+    from langchain.chains import LLMChain
+
+    llm = llm or _default_llm()
+    simple_chain = LLMChain(llm=llm, prompt=build_router_prompt(filenames))
     return simple_chain
+
+
+class RouteDecision(BaseModel):
+    """Structured output of the combined routing + query rewrite call."""
+    needs_documents: bool = Field(description="True if the question is about laws, regulations or the available documents")
+    sources: List[str] = Field(default_factory=list, description="Exact filenames of the relevant documents, most relevant first, when needs_documents is true")
+    standalone_query: Optional[str] = Field(default=None, description="The question rewritten to be self-contained using the chat history")
+    reply: Optional[str] = Field(default=None, description="Brief direct reply, when needs_documents is false")
+
+
+def build_route_rewrite_prompt(filenames: List[str]) -> ChatPromptTemplate:
+    filenames_str = "\n".join([f'"{f}"' for f in filenames]) if filenames else "No documents available."
+
+    system_prompt = f"""
+        You are ANB regulatory Advisor, a classifier for banking and financial regulation queries in Saudi Arabia.
+
+        Rules:
+        1. If the query is general/off-topic (greetings, jokes, chatbot questions), set needs_documents to false and put a brief, normal reply in reply.
+        2. If the query refers to laws, articles, penalties, compliance, or SAMA/ Saudi Arabia regulation, outsourcing, NDMO Data Classification/Policy, CyberSecurity, IT Framework — even if mixed with small talk — OR if the query asks about any of the available documents, set needs_documents to true and sources to the relevant filenames from:
+{filenames_str}
+        Give one filename; give up to {MAX_ROUTED_SOURCES} (most relevant first) only when the query spans several documents, e.g. a law and its implementing regulation.
+        3. Use chat history for context. When there is chat history, also set standalone_query to a clear, precise, self-contained version of the query: expand abbreviations, keep financial terminology, do not add assumptions.
+        """
+
+    return ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}")
+    ])
+
+
+def get_route_rewrite_chain(llm=None):
+    """One call that replaces both the router chain and the contextualize step."""
+    filenames = get_routable_filenames()
+    llm = llm or _default_llm()
+    return build_route_rewrite_prompt(filenames) | llm.with_structured_output(RouteDecision)
+
+
+class ChainRegistry:
+    """
+    Keeps the router chain and the RAG stages for each source alive across requests.
+
+    The LLM and reranker clients are shared by every chain. The router chain is
+    only rebuilt after refresh_router() marks it stale (upload/delete) or the
+    document registry's version counter moves (another worker changed it), and RAG
+    stages are kept per (source, namespace) in a small LRU so a misbehaving router
+    can't grow it forever.
+    """
+
+    def __init__(self, max_rag_chains: int = 64):
+        self._lock = threading.Lock()
+        self._max_rag_chains = max_rag_chains
+        self._rag_chains = OrderedDict()
+        self._router_chain = None
+        self._route_rewrite_chain = None
+        self._registry_version = None
+        self._llm = None
+        self._compressor = None
+        self._stats = {
+            "rag_builds": 0,
+            "rag_hits": 0,
+            "router_builds": 0,
+            "router_hits": 0,
+            "router_refreshes": 0,
+            "route_rewrite_builds": 0,
+        }
+
+    def _shared_clients(self):
+        if self._llm is None:
+            self._llm = _default_llm()
+        if self._compressor is None:
+            self._compressor = build_reranker()
+        return self._llm, self._compressor
+
+    def _check_registry_version(self):
+        """Caller holds the lock. Picks up uploads/deletes made by other worker processes."""
+        version = get_registry_version()
+        if version != self._registry_version:
+            self._router_chain = None
+            self._route_rewrite_chain = None
+            self._registry_version = version
+
+    def get_router_chain(self):
+        with self._lock:
+            self._check_registry_version()
+            if self._router_chain is not None:
+                self._stats["router_hits"] += 1
+                return self._router_chain
+            llm, _ = self._shared_clients()
+            self._router_chain = get_simple_chain(llm=llm)
+            self._stats["router_builds"] += 1
+            return self._router_chain
+
+    def get_route_rewrite_chain(self):
+        with self._lock:
+            self._check_registry_version()
+            if self._route_rewrite_chain is None:
+                llm, _ = self._shared_clients()
+                self._route_rewrite_chain = get_route_rewrite_chain(llm=llm)
+                self._stats["route_rewrite_builds"] += 1
+            return self._route_rewrite_chain
+
+    def get_rag_parts(self, source: str) -> RagParts:
+        # Keyed on the namespace the registry has now, so a retriever bound to
+        # a namespace that another process re-indexed or deleted is not reused
+        document = get_document_by_filename(source)
+        key = (source, document["namespace"] if document else None)
+        with self._lock:
+            parts = self._rag_chains.get(key)
+            if parts is not None:
+                self._rag_chains.move_to_end(key)
+                self._stats["rag_hits"] += 1
+                return parts
+            llm, compressor = self._shared_clients()
+            parts = get_rag_parts(source, llm=llm, compressor=compressor)
+            self._rag_chains[key] = parts
+            if len(self._rag_chains) > self._max_rag_chains:
+                self._rag_chains.popitem(last=False)
+            self._stats["rag_builds"] += 1
+            return parts
+
+    def refresh_router(self):
+        """Mark the router prompt stale after the documents table changed."""
+        with self._lock:
+            self._router_chain = None
+            self._route_rewrite_chain = None
+            self._stats["router_refreshes"] += 1
+
+    def invalidate_source(self, source: str):
+        with self._lock:
+            for key in [key for key in self._rag_chains if key[0] == source]:
+                del self._rag_chains[key]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_rag_chains"] = len(self._rag_chains)
+            stats["router_cached"] = self._router_chain is not None
+            if self._compressor is not None:
+                stats["reranker"] = self._compressor.stats()
+            return stats
+
+
+chain_registry = ChainRegistry()
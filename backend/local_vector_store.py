@@ -0,0 +1,513 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking across processes
+    fcntl = None
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class _Partition:
+    """
+    One append-only partition on disk:
+
+        partition.json           key, dimension, namespace flag and current generation
+        vectors[.<gen>].f32      float32 rows, L2-normalized, memory-mapped for search
+        rows[.<gen>].jsonl       {"id", "metadata"} per row, same order as the vectors
+        tombstones[.<gen>].jsonl row numbers that were deleted
+
+    When an id is written again its newest row wins. Deleted rows are masked
+    out until dead rows pass compact_ratio, then the live rows are written as
+    the next generation, which replacing partition.json commits.
+
+    A row is appended after its vector and only rows that have a complete
+    vector are loaded, so a write cut short by a crash is ignored, and cut
+    off by the next writer (repair). The store holds its file lock around
+    every call; refresh() reads what other processes appended, compacted
+    or dropped since the last call.
+    """
+
+    def __init__(self, path: str, key: str, dimension: int, namespace: bool = False):
+        self.path = path
+        self.key = key
+        self.dimension = dimension
+        self.namespace = namespace
+        self._row_bytes = 4 * dimension
+        os.makedirs(path, exist_ok=True)
+        if not os.path.exists(self._file("partition.json")):
+            self._write_info(0)
+        self._reset(None, 0)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _data_file(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self.generation if generation is None else generation
+        name, extension = {"vectors": ("vectors", "f32"), "rows": ("rows", "jsonl"),
+                           "tombstones": ("tombstones", "jsonl")}[kind]
+        return self._file(f"{name}.{generation}.{extension}" if generation else f"{name}.{extension}")
+
+    def _write_info(self, generation: int):
+        with open(self._file("partition.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "dimension": self.dimension, "namespace": self.namespace,
+                       "generation": generation}, f)
+        os.replace(self._file("partition.json.tmp"), self._file("partition.json"))
+
+    def _reset(self, info_stamp: Optional[tuple], generation: int):
+        self.info_stamp = info_stamp
+        self.generation = generation
+        self.ids: List[str] = []
+        self.metadata: List[dict] = []
+        self.live = np.zeros(0, dtype=bool)
+        self.row_by_id: Dict[str, int] = {}
+        self._rows_offset = 0
+        self._tombstones_offset = 0
+        self._stamp = None
+        self._matrix = None
+        self._ivf = None
+
+    def stamp(self) -> Optional[tuple]:
+        """Changes whenever the partition is written to; None once it was dropped."""
+        try:
+            info = os.stat(self._file("partition.json"))
+        except FileNotFoundError:
+            return None
+        return (info.st_ino, info.st_mtime_ns, _file_size(self._data_file("rows")),
+                _file_size(self._data_file("tombstones")), _file_size(self._data_file("vectors")))
+
+    def refresh(self) -> bool:
+        """Loads what was written since the last call; False if the partition was dropped."""
+        stamp = self.stamp()
+        if stamp is None:
+            return False
+        if stamp == self._stamp:
+            return True
+        if stamp[:2] != self.info_stamp:
+            # First load, or another process compacted the partition
+            with open(self._file("partition.json"), encoding="utf-8") as f:
+                self._reset(stamp[:2], json.load(f).get("generation", 0))
+            stamp = self.stamp()
+
+        vector_rows = _file_size(self._data_file("vectors")) // self._row_bytes
+        first_new = len(self.ids)
+        if first_new < vector_rows and os.path.exists(self._data_file("rows")):
+            with open(self._data_file("rows"), "rb") as f:
+                f.seek(self._rows_offset)
+                for line in f:
+                    if len(self.ids) >= vector_rows or not line.endswith(b"\n"):
+                        break
+                    row = json.loads(line)
+                    self.ids.append(row["id"])
+                    self.metadata.append(row["metadata"])
+                    self._rows_offset += len(line)
+        if len(self.ids) > first_new:
+            self.live = np.concatenate([self.live, np.ones(len(self.ids) - first_new, dtype=bool)])
+            for row in range(first_new, len(self.ids)):
+                previous = self.row_by_id.get(self.ids[row])
+                if previous is not None:
+                    self.live[previous] = False
+                self.row_by_id[self.ids[row]] = row
+            self._ivf = None
+
+        if os.path.exists(self._data_file("tombstones")):
+            with open(self._data_file("tombstones"), "rb") as f:
+                f.seek(self._tombstones_offset)
+                for line in f:
+                    if not line.endswith(b"\n") or int(line) >= len(self.ids):
+                        break
+                    row = int(line)
+                    if self.live[row]:
+                        self.live[row] = False
+                        if self.row_by_id.get(self.ids[row]) == row:
+                            del self.row_by_id[self.ids[row]]
+                        self._ivf = None
+                    self._tombstones_offset += len(line)
+        self._stamp = stamp
+        return True
+
+    def repair(self):
+        """Under the exclusive lock, after refresh(): cuts off what a crashed write left behind."""
+        for path, size in ((self._data_file("vectors"), len(self.ids) * self._row_bytes),
+                           (self._data_file("rows"), self._rows_offset),
+                           (self._data_file("tombstones"), self._tombstones_offset)):
+            if _file_size(path) > size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+        self._stamp = self.stamp()
+
+    @property
+    def live_count(self) -> int:
+        return int(self.live.sum())
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None or self._matrix.shape[0] != len(self.ids):
+            if not self.ids:
+                self._matrix = np.zeros((0, self.dimension), dtype=np.float32)
+            else:
+                self._matrix = np.memmap(self._data_file("vectors"), dtype=np.float32, mode="r",
+                                         shape=(len(self.ids), self.dimension))
+        return self._matrix
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, metadatas: List[dict]):
+        with open(self._data_file("vectors"), "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self._data_file("rows"), "a", encoding="utf-8") as f:
+            for vector_id, metadata in zip(ids, metadatas):
+                f.write(json.dumps({"id": vector_id, "metadata": metadata}, ensure_ascii=False) + "\n")
+        self.refresh()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        rows = [self.row_by_id[i] for i in ids if i in self.row_by_id]
+        if rows:
+            with open(self._data_file("tombstones"), "a") as f:
+                f.write("".join(f"{row}\n" for row in rows))
+            self.refresh()
+        return len(rows)
+
+    def compact(self, compact_ratio: float):
+        dead = len(self.ids) - self.live_count
+        if not dead or dead / max(len(self.ids), 1) < compact_ratio:
+            return
+        keep = np.flatnonzero(self.live)
+        generation = self.generation + 1
+        old_files = [self._data_file(kind) for kind in ("vectors", "rows", "tombstones")]
+        # Leftovers of a compaction that crashed before its commit are overwritten
+        with open(self._data_file("vectors", generation), "wb") as f:
+            f.write(np.ascontiguousarray(self.matrix()[keep]).tobytes())
+        with open(self._data_file("rows", generation), "w", encoding="utf-8") as f:
+            for row in keep:
+                f.write(json.dumps({"id": self.ids[row], "metadata": self.metadata[row]}, ensure_ascii=False) + "\n")
+        if os.path.exists(self._data_file("tombstones", generation)):
+            os.remove(self._data_file("tombstones", generation))
+        self._write_info(generation)
+        for path in old_files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.refresh()
+
+    def _build_ivf(self, nlist: int, iterations: int = 8):
+        rows = np.flatnonzero(self.live)
+        data = self.matrix()[rows]
+        rng = np.random.default_rng(0)
+        centroids = data[rng.choice(len(rows), size=min(nlist, len(rows)), replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(data @ centroids.T, axis=1)
+            for c in range(len(centroids)):
+                members = data[assignment == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        lists = [rows[assignment == c] for c in range(len(centroids))]
+        self._ivf = (centroids, lists)
+
+    def search(self, query: np.ndarray, k: int, ivf_min_rows: Optional[int], nprobe: int) -> List[Tuple[int, float]]:
+        if not self.live_count:
+            return []
+        matrix = self.matrix()
+        if ivf_min_rows is not None and self.live_count >= ivf_min_rows:
+            if self._ivf is None:
+                self._build_ivf(nlist=int(np.sqrt(self.live_count)))
+            centroids, lists = self._ivf
+            probe = np.argsort(centroids @ query)[::-1][:nprobe]
+            rows = np.concatenate([lists[c] for c in probe])
+            scores = matrix[rows] @ query
+        else:
+            rows = np.flatnonzero(self.live)
+            scores = matrix[rows] @ query if len(rows) < len(self.ids) else matrix @ query
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store for corpora that fit in RAM.
+
+    Calls that pass a namespace (as Pinecone's do) read and write that
+    namespace's partition only, and delete_all drops it in one step. Without
+    one, vectors are partitioned by a metadata key (source by default), so
+    a `{"source": {"$in": [...]}}` filter only touches the matching
+    partitions. Search is exact, vectorized cosine
+    top-k unless ivf_min_rows is set, in which case partitions at least that
+    large are searched through an IVF index (nprobe lists).
+
+    Several processes (gunicorn workers, bulk_ingest.py) can share one
+    directory: writes take an exclusive lock on path/.lock, reads a shared
+    one, and every call first picks up the partitions other processes
+    created, wrote to or dropped.
+
+    It also exposes the subset of the Pinecone Index API the ingestion
+    pipeline uses (upsert/delete/fetch/query), so it can be used as both.
+    """
+
+    def __init__(self, path: str, embedding: Embeddings, dimension: int, partition_key: str = "source",
+                 text_key: str = "text", ivf_min_rows: Optional[int] = None, nprobe: int = 8,
+                 compact_ratio: float = 0.3):
+        self.path = path
+        self.embedding = embedding
+        self.dimension = dimension
+        self.partition_key = partition_key
+        self.text_key = text_key
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        # Default namespace, partitioned by metadata key; and one partition per namespace
+        self._partitions: Dict[str, _Partition] = {}
+        self._namespaces: Dict[str, _Partition] = {}
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(os.path.join(path, ".lock"), "a")
+        with self._locked():
+            self._scan()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """Thread lock plus the file lock shared with other processes; nested calls reuse the outer one."""
+        with self._lock:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _directory(self, key: str, namespace: bool) -> str:
+        name = f"namespace:{key}" if namespace else key
+        return os.path.join(self.path, hashlib.sha1(name.encode("utf-8")).hexdigest()[:16])
+
+    def _scan(self):
+        """Caller holds the lock. Loads every partition on disk and drops the ones that are gone."""
+        for name in sorted(os.listdir(self.path)):
+            info_path = os.path.join(self.path, name, "partition.json")
+            if not os.path.exists(info_path):
+                continue
+            try:
+                with open(info_path, encoding="utf-8") as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            key, namespace = info["key"], info.get("namespace", False)
+            partitions = self._namespaces if namespace else self._partitions
+            if key not in partitions:
+                partitions[key] = _Partition(os.path.join(self.path, name), key, self.dimension, namespace)
+        for partitions in (self._partitions, self._namespaces):
+            for key in [key for key, partition in partitions.items() if not partition.refresh()]:
+                del partitions[key]
+
+    def _existing(self, key: str, namespace: bool = False) -> Optional[_Partition]:
+        """Caller holds the lock. The up to date partition for key, if any process created it."""
+        partitions = self._namespaces if namespace else self._partitions
+        partition = partitions.get(key)
+        if partition is None:
+            directory = self._directory(key, namespace)
+            if not os.path.exists(os.path.join(directory, "partition.json")):
+                return None
+            partition = partitions[key] = _Partition(directory, key, self.dimension, namespace)
+        if not partition.refresh():
+            del partitions[key]
+            return None
+        return partition
+
+    def _partition(self, key: str, namespace: bool = False) -> _Partition:
+        """Caller holds the exclusive lock. The partition for key, created if needed, ready to append to."""
+        partition = self._existing(key, namespace)
+        if partition is None:
+            partitions = self._namespaces if namespace else self._partitions
+            partition = partitions[key] = _Partition(self._directory(key, namespace), key, self.dimension, namespace)
+            partition.refresh()
+        partition.repair()
+        return partition
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _partitions_for(self, filter: Optional[dict], namespace: Optional[str] = None) -> List[_Partition]:
+        if namespace:
+            partition = self._existing(namespace, namespace=True)
+            return [partition] if partition is not None else []
+        if not filter:
+            self._scan()
+            return list(self._partitions.values())
+        condition = filter.get(self.partition_key)
+        if condition is None:
+            raise ValueError(f"LocalVectorStore only filters on '{self.partition_key}'")
+        if isinstance(condition, dict):
+            keys = condition.get("$in") or [condition.get("$eq")]
+        else:
+            keys = [condition]
+        partitions = [self._existing(str(key)) for key in keys]
+        return [partition for partition in partitions if partition is not None]
+
+    # Pinecone Index-style API
+
+    def upsert(self, vectors: List[dict], namespace: Optional[str] = None, **kwargs):
+        grouped: Dict[str, list] = {}
+        for vector in vectors:
+            key = namespace or str(vector["metadata"].get(self.partition_key, ""))
+            grouped.setdefault(key, []).append(vector)
+        with self._locked(exclusive=True):
+            for key, group in grouped.items():
+                partition = self._partition(key, namespace=bool(namespace))
+                partition.upsert(
+                    [v["id"] for v in group],
+                    self._normalize([v["values"] for v in group]),
+                    [v["metadata"] for v in group],
+                )
+                partition.compact(self.compact_ratio)
+            if not namespace:
+                # An id moving to another partition must not stay behind in the old one
+                for partition in self._partitions_for(None):
+                    moved = [v["id"] for key, group in grouped.items() if key != partition.key for v in group
+                             if v["id"] in partition.row_by_id]
+                    if moved:
+                        partition.repair()
+                        partition.delete(moved)
+                        partition.compact(self.compact_ratio)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: Optional[str] = None,
+               delete_all: bool = False, **kwargs) -> Optional[bool]:
+        with self._locked(exclusive=True):
+            if namespace and delete_all:
+                self._namespaces.pop(namespace, None)
+                shutil.rmtree(self._directory(namespace, True), ignore_errors=True)
+                return True
+            for partition in self._partitions_for(None, namespace):
+                present = [i for i in ids or [] if i in partition.row_by_id]
+                if present:
+                    partition.repair()
+                    partition.delete(present)
+                    partition.compact(self.compact_ratio)
+        return True
+
+    def describe_index_stats(self, **kwargs) -> dict:
+        """Live vectors per namespace; the metadata-partitioned default namespace is reported as ""."""
+        with self._locked():
+            self._scan()
+            namespaces = {key: {"vector_count": p.live_count} for key, p in self._namespaces.items()}
+            default_count = sum(p.live_count for p in self._partitions.values())
+        if default_count:
+            namespaces[""] = {"vector_count": default_count}
+        return {"namespaces": namespaces, "dimension": self.dimension,
+                "total_vector_count": sum(summary["vector_count"] for summary in namespaces.values())}
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None, **kwargs) -> dict:
+        found = {}
+        with self._locked():
+            for partition in self._partitions_for(None, namespace):
+                for vector_id in ids:
+                    row = partition.row_by_id.get(vector_id)
+                    if row is not None:
+                        found[vector_id] = {"id": vector_id, "values": partition.matrix()[row].tolist(),
+                                            "metadata": partition.metadata[row]}
+        return {"vectors": found}
+
+    def query(self, vector: List[float], top_k: int = 10, filter: Optional[dict] = None,
+              include_metadata: bool = True, namespace: Optional[str] = None, **kwargs) -> dict:
+        matches = [
+            {"id": vector_id, "score": score, "metadata": metadata if include_metadata else {}}
+            for vector_id, metadata, score in self._search(vector, top_k, filter, namespace)
+        ]
+        return {"matches": matches}
+
+    def _search(self, vector, k: int, filter: Optional[dict], namespace: Optional[str] = None):
+        """Top k as (id, metadata, score), read under the lock so a concurrent compaction can't renumber rows."""
+        query = self._normalize(vector)
+        results = []
+        with self._locked():
+            for partition in self._partitions_for(filter, namespace):
+                for row, score in partition.search(query, k, self.ivf_min_rows, self.nprobe):
+                    results.append((partition.ids[row], partition.metadata[row], score))
+        results.sort(key=lambda item: item[2], reverse=True)
+        return results[:k]
+
+    # LangChain VectorStore API
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        vectors = self.embedding.embed_documents(texts)
+        self.upsert([
+            {"id": vector_id, "values": values, "metadata": {**metadata, self.text_key: text}}
+            for vector_id, values, metadata, text in zip(ids, vectors, metadatas, texts)
+        ])
+        return ids
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4, filter: Optional[dict] = None,
+                                               namespace: Optional[str] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        results = []
+        for _, metadata, score in self._search(embedding, k, filter, namespace):
+            metadata = dict(metadata)
+            text = metadata.pop(self.text_key, "")
+            results.append((Document(page_content=text, metadata=metadata), score))
+        return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[dict] = None,
+                                     namespace: Optional[str] = None, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter, namespace)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   path: str = "local_index", dimension: Optional[int] = None, **kwargs: Any) -> "LocalVectorStore":
+        dimension = dimension or len(embedding.embed_query("dimension probe"))
+        store = cls(path, embedding, dimension, **kwargs)
+        store.add_texts(texts, metadatas)
+        return store
+
+    def stats(self) -> dict:
+        with self._locked():
+            self._scan()
+            stats = {key: {"rows": len(p.ids), "live": p.live_count} for key, p in self._partitions.items()}
+            stats.update({f"namespace:{key}": {"rows": len(p.ids), "live": p.live_count}
+                          for key, p in self._namespaces.items()})
+            return stats
@@ -1,13 +1,15 @@
-from flask import Flask, request, jsonify
-from pinecone_util import index_document_to_pinecone, delete_doc_from_pinecone, show_metadata
+from flask import Flask, request, jsonify, Response, stream_with_context
+from pinecone_util import show_metadata
 import logging
-from flask import Flask, request, jsonify
 from flask_cors import CORS
 from pydantic_models import QueryInput, QueryResponse, DeleteFileRequest
-from langchain_util import get_rag_chain, get_simple_chain
-from document_util import get_all_documents, insert_document_record, delete_document_record, get_document_by_filename
+from services import route_question, answer_question, stream_answer, load_history, remember_turn, ingest_files, finish_upload, get_job, get_page_text, start_ingest_workers, delete_document as delete_indexed_document, collect_stats, check_readiness
+from document_util import get_all_documents
+from session_memory import history_tokens
+from tracing import TIMING_HEADERS, current_trace, metrics, stage, start_trace
 import os
-import logging
+import json
+import time
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)
@@ -17,70 +19,148 @@ logging.basicConfig(level=logging.ERROR,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
+@app.before_request
+def trace_request():
+    start_trace()
+
+
+@app.before_request
+def ensure_ingest_workers():
+    # Each worker process runs INGEST_JOB_WORKERS indexing threads; they share
+    # the jobs database, so a job is only ever claimed by one of them. Started
+    # by the first request rather than at import, so importing the app (the
+    # reloader's parent, gunicorn --preload, import_time_bench) runs no jobs.
+    start_ingest_workers()
+
+
+@app.after_request
+def add_timing_headers(response):
+    # Streamed responses send their headers before most stages have run
+    trace = current_trace()
+    if TIMING_HEADERS and trace is not None and trace.stages:
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+
 @app.route("/")
 def home():
     return "Hello from Personal RAG Chatbot!"
 
-@app.route("/chat", methods=["POST"])
-def chat():
-    data = request.get_json()
+
+def parse_query_input(data):
+    """Returns (query_input, chat_history, error_response)."""
     try:
-        query_input = QueryInput(**data)
+        query_input = QueryInput(**(data or {}))
     except Exception as e:
         logging.error(f"Error in input data: {str(e)}")
-        return jsonify({"error": "Invalid input data"}), 400
+        return None, None, (jsonify({"error": "Invalid input data"}), 400)
 
-    session_id = query_input.session_id
-    if not session_id:
-        return jsonify({"error": "No session assigned"}), 400
+    if not query_input.session_id:
+        return None, None, (jsonify({"error": "No session assigned"}), 400)
 
-    chat_history = []
-    if query_input.history:
-        chat_history = [entry.model_dump() for entry in query_input.history]
+    return query_input, load_history(query_input), None
 
-    simple_chain = get_simple_chain()
-    general_response = simple_chain.invoke({
-        "input": query_input.question,
-        "chat_history": chat_history
-    })
 
-    response_text = general_response['text']
-    response_lines = response_text.splitlines()
+@app.route("/health")
+def health():
+    """Liveness only: never touches the database or upstream services."""
+    return jsonify({"status": "ok"})
 
-    if response_lines[0].strip() == "False":  
-        source = response_lines[1].strip() if len(response_lines) > 1 else ""
-    else:
-        return jsonify({
+
+@app.route("/ready")
+def ready():
+    """Warms up lazily created clients; 503 until all of them work."""
+    report, is_ready = check_readiness()
+    return jsonify({"ready": is_ready, "checks": report}), (200 if is_ready else 503)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Per-stage latency histograms and LLM token counters, Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    query_input, chat_history, error = parse_query_input(request.get_json())
+    if error:
+        return error
+
+    sources, response_text, query = route_question(query_input.question, chat_history)
+    if sources is None:
+        response = {
             "answer": response_text,
             "highlighted_contexts": []
-        })
+        }
+    else:
+        response = answer_question(sources, query_input.question, chat_history, query)
 
-    rag_chain = get_rag_chain(source)
-    rag_response = rag_chain.invoke({
-        "input": query_input.question,
-        "chat_history": chat_history
-    })
-
-    highlighted_contexts = []
-    data = rag_response.get("answer")
-
-    for context in rag_response.get("context", []):
-        if hasattr(context, 'page_content'):
-            context_text = context.page_content
-            metadata = context.metadata if hasattr(context, 'metadata') else {}
-
-            highlighted_contexts.append({
-                "file_id": metadata.get("file_id"),
-                "page": metadata.get("page", None), 
-                "source": metadata.get("source", None),
-                "language": metadata.get("language", None),
-                "context_text": context_text 
+    with stage("assemble"):
+        return jsonify(remember_turn(query_input.session_id, query_input.question, response, chat_history))
+
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Server-sent events variant of /chat. Emits, in order: `route` (router
+    decision), `contexts` (highlighted_contexts), `token` (answer pieces) and
+    `done` with time-to-first-token, total latency in milliseconds and the
+    token count of the history used for this turn.
+    """
+    query_input, chat_history, error = parse_query_input(request.get_json())
+    if error:
+        return error
+
+    def generate():
+        started = time.perf_counter()
+        first_token_at = None
+        answer_parts = []
+        history_token_count = history_tokens(chat_history)
+        try:
+            sources, response_text, query = route_question(query_input.question, chat_history)
+            routed_at = time.perf_counter()
+            yield sse_event("route", {
+                "sources": sources,
+                "router_ms": round((routed_at - started) * 1000, 1)
             })
 
-    return jsonify({
-        "answer": data,
-        "highlighted_contexts": highlighted_contexts,
-    })
+            if sources is None:
+                first_token_at = time.perf_counter()
+                yield sse_event("contexts", {"highlighted_contexts": []})
+                answer_parts.append(response_text)
+                yield sse_event("token", {"text": response_text})
+            else:
+                for event, payload in stream_answer(sources, query_input.question, chat_history, query):
+                    if event == "contexts":
+                        yield sse_event("contexts", {"highlighted_contexts": payload})
+                    else:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        answer_parts.append(payload)
+                        yield sse_event("token", {"text": payload})
+            remember_turn(query_input.session_id, query_input.question,
+                          {"answer": "".join(answer_parts)}, chat_history)
+        except Exception as e:
+            logging.error(f"Error streaming chat response: {str(e)}", exc_info=True)
+            yield sse_event("error", {"error": "An error occurred while generating the answer"})
+
+        finished = time.perf_counter()
+        yield sse_event("done", {
+            "ttft_ms": round((first_token_at - started) * 1000, 1) if first_token_at else None,
+            "total_ms": round((finished - started) * 1000, 1),
+            "history_tokens": history_token_count
+        })
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.route("/upload-doc", methods=["POST"])
@@ -89,72 +169,30 @@ def index_document():
         return jsonify({"error": "No file part in request"}), 400
 
     files = request.files.getlist('file')
-    allowed_extensions = ['.pdf', '.docx', '.html']
-    results = []
-
-    for file in files:
-        filename = file.filename
-        file_extension = os.path.splitext(filename)[1].lower() # type: ignore
-
-        if file_extension not in allowed_extensions:
-            results.append({
-                "filename": filename,
-                "status": "error",
-                "message": f"Unsupported file type: {file_extension}"
-            })
-            continue
-
-        try:
-            existing_document = get_document_by_filename(filename)
-            if existing_document:
-                results.append({
-                    "filename": filename,
-                    "status": "exists",
-                    "file_id": existing_document['id'],
-                    "message": "File already uploaded"
-                })
-                continue
-
-            temp_file_path = filename  # no path change
-
-            file.save(temp_file_path) # type: ignore
-
-            file_id = insert_document_record(filename)
-            success = index_document_to_pinecone(temp_file_path, file_id)  # type: ignore
-
-            os.remove(temp_file_path) # type: ignore
-
-            if success:
-                results.append({
-                    "filename": filename,
-                    "status": "success",
-                    "file_id": file_id,
-                    "message": "Indexed successfully"
-                })
-            else:
-                delete_document_record(file_id)
-                results.append({
-                    "filename": filename,
-                    "status": "error",
-                    "message": "Failed to index"
-                })
-
-        except Exception as e:
-            results.append({
-                "filename": filename,
-                "status": "error",
-                "message": str(e)
-            })
-
-    return jsonify({
-        "summary": {
-            "total_files": len(files),
-            "success": sum(1 for r in results if r["status"] == "success"),
-            "errors": sum(1 for r in results if r["status"] == "error"),
-            "duplicates": sum(1 for r in results if r["status"] == "exists")
-        },
-        "results": results
-    })
+    # mode=update re-indexes only the chunks that changed in an existing file
+    update_mode = request.form.get('mode') == 'update'
+    results = ingest_files([(file.filename, file.save) for file in files], update_mode)  # type: ignore
+
+    # Indexing happens in the background; poll /jobs/<id> for progress
+    body = finish_upload(results)
+    # 409 when every file already had a job running, so nothing was queued
+    busy = bool(results) and body["summary"]["busy"] == len(results)
+    return jsonify(body), 409 if busy else 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/documents/<int:file_id>/pages/<int:page>", methods=["GET"])
+def page_text(file_id, page):
+    """Text of a cited page (file_id and page come from highlighted_contexts), without opening the file."""
+    result = get_page_text(file_id, page)
+    if result is None:
+        return jsonify({"error": "Page not found"}), 404
+    return jsonify(result)
 
 @app.route('/delete-doc', methods=['DELETE'])
 def delete_document():
@@ -167,14 +205,12 @@ def delete_document():
             return jsonify({"error": "file_id is required"}), 400
 
         response = DeleteFileRequest(**data)
+        message, status = delete_indexed_document(response.file_id)
 
-        message = delete_doc_from_pinecone(response.file_id)
-
-        if "Successfully deleted" in message:  # type: ignore
-            delete_document_record(file_id)
+        if status == 200:
             return jsonify({"message": message}), 200
         else:
-            return jsonify({"error": message}), 500
+            return jsonify({"error": message}), status
     except Exception as e:
         logging.error(f"Error deleting document: {str(e)}", exc_info=True)
         return jsonify({"error": "An error occurred while deleting the document"}), 500
@@ -186,6 +222,11 @@ def list_documents():
     return jsonify(documents)
 
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify(collect_stats())
+
+
 @app.route("/show-docs", methods=["GET"])
 def show_metaData():
     documents = show_metadata()
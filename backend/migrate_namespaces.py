@@ -0,0 +1,92 @@
+"""
+Moves documents indexed into the shared default namespace into their own
+namespace (pinecone_util.new_namespace), so retrieval becomes a namespace
+query and deletion a namespace drop.
+
+    cd backend && python migrate_namespaces.py --dry-run
+    cd backend && python migrate_namespaces.py
+    cd backend && python migrate_namespaces.py --delete-legacy
+
+For each document without a namespace, its vectors are fetched by id from
+the default namespace (ids from the manifest, or a scan for documents older
+than the manifest), upserted unchanged into the new namespace, and then the
+document row is switched over. Running app servers keep retrievers cached
+with the old filter, so the default-namespace copies are only removed by
+--delete-legacy, to be run once the servers have been restarted.
+"""
+import json
+import argparse
+
+from document_util import get_all_documents, get_manifest_vector_ids, insert_manifest_entries, set_document_namespace
+from pinecone_util import _scan_vector_ids_for_file, delete_batch_size, get_index, new_namespace
+
+
+def _fetch_vectors(index, vector_ids):
+    response = index.fetch(ids=vector_ids)
+    vectors = response["vectors"] if isinstance(response, dict) else response.vectors
+    records = []
+    for vector_id, vector in vectors.items():
+        values = vector["values"] if isinstance(vector, dict) else vector.values
+        metadata = vector.get("metadata", {}) if isinstance(vector, dict) else (vector.metadata or {})
+        records.append({"id": vector_id, "values": list(values), "metadata": dict(metadata)})
+    return records
+
+
+def migrate_document(index, document: dict, batch_size: int, dry_run: bool = False) -> dict:
+    file_id = document["id"]
+    namespace = new_namespace(file_id)
+    vector_ids = get_manifest_vector_ids(file_id)
+    from_manifest = bool(vector_ids)
+    if not vector_ids:
+        vector_ids = _scan_vector_ids_for_file(file_id)
+    report = {"file_id": file_id, "filename": document["filename"], "namespace": namespace,
+              "vectors": len(vector_ids), "copied": 0}
+    if dry_run or not vector_ids:
+        return report
+
+    for start in range(0, len(vector_ids), batch_size):
+        records = _fetch_vectors(index, vector_ids[start:start + batch_size])
+        if records:
+            index.upsert(vectors=records, namespace=namespace)
+        if not from_manifest:
+            # Lets later deletes and updates skip the scan
+            insert_manifest_entries(file_id, [(r["id"], r["metadata"].get("page"), None, None) for r in records])
+        report["copied"] += len(records)
+
+    report["missing"] = len(vector_ids) - report["copied"]
+    if report["copied"]:
+        set_document_namespace(file_id, namespace)
+    return report
+
+
+def delete_legacy_copies(index, document: dict) -> int:
+    vector_ids = get_manifest_vector_ids(document["id"])
+    for start in range(0, len(vector_ids), delete_batch_size):
+        # No namespace: removes only the copies left in the default namespace
+        index.delete(ids=vector_ids[start:start + delete_batch_size])
+    return len(vector_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="only list what would be copied")
+    parser.add_argument("--delete-legacy", action="store_true",
+                        help="remove default-namespace copies of documents that were already migrated")
+    parser.add_argument("--batch-size", type=int, default=100, help="vectors per fetch/upsert")
+    args = parser.parse_args()
+
+    index = get_index()
+    documents = get_all_documents()
+    if args.delete_legacy:
+        deleted = {document["id"]: delete_legacy_copies(index, document)
+                   for document in documents if document.get("namespace")}
+        print(json.dumps({"deleted_legacy_vectors": sum(deleted.values()), "documents": len(deleted)}, indent=2))
+        return
+
+    reports = [migrate_document(index, document, args.batch_size, args.dry_run)
+               for document in documents if not document.get("namespace")]
+    print(json.dumps({"dry_run": args.dry_run, "documents": reports}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
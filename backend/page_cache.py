@@ -0,0 +1,207 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+DEFAULT_PAGE_CACHE_PATH = os.getenv("PAGE_CACHE_PATH",
+                                    os.path.join(os.path.dirname(os.path.abspath(__file__)), "page_cache.db"))
+
+
+class PageCache:
+    """
+    Extracted pages of indexed files, keyed by the sha256 of the file content.
+
+    Each page is stored once as (position, page number, language, zlib
+    compressed text). Re-chunking, re-embedding or rebuilding the index then
+    reads pages from here instead of running PDF extraction and language
+    detection again, and the text of a cited page can be served without
+    opening the file. Entries are keyed by content, not by document id, so
+    they survive a registry reset (reset_db.py) and are shared by identical
+    files uploaded under different names.
+
+    A file only counts as cached once all of its pages were written, so an
+    interrupted extraction is redone. Least recently used files beyond
+    max_files are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_PAGE_CACHE_PATH, max_files: int = 1000, write_batch_size: int = 50,
+                 read_batch_size: int = 200, compress_level: int = 6):
+        self.path = path
+        self.max_files = max_files
+        self.write_batch_size = write_batch_size
+        self.read_batch_size = read_batch_size
+        self.compress_level = compress_level
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._ready = False
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _init_schema(self, conn: sqlite3.Connection):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS page_files (
+                content_hash TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL,
+                text_bytes INTEGER NOT NULL,
+                stored_bytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                content_hash TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                page INTEGER,
+                language TEXT,
+                text BLOB NOT NULL,
+                PRIMARY KEY (content_hash, position)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_page ON pages (content_hash, page)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_page_files_last_used ON page_files (last_used)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        if not self._ready:
+            with self._init_lock:
+                if not self._ready:
+                    self._init_schema(conn)
+                    self._ready = True
+        return conn
+
+    def has(self, content_hash: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM page_files WHERE content_hash = ?", (content_hash,)).fetchone()
+        with self._lock:
+            if row is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return row is not None
+
+    def iter_pages(self, content_hash: str, source: str) -> Iterator[Document]:
+        """Cached pages in document order, with the metadata extraction gives them."""
+        conn = self._conn()
+        conn.execute("UPDATE page_files SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+        conn.commit()
+        position = -1
+        while True:
+            # Read in batches rather than through one cursor, so no read stays open while chunks are embedded
+            rows = conn.execute(
+                "SELECT position, page, language, text FROM pages WHERE content_hash = ? AND position > ? "
+                "ORDER BY position LIMIT ?",
+                (content_hash, position, self.read_batch_size)
+            ).fetchall()
+            if not rows:
+                return
+            for position, page, language, text in rows:
+                metadata = {"source": source}
+                if page is not None:
+                    metadata["page"] = page
+                if language is not None:
+                    metadata["language"] = language
+                yield Document(page_content=zlib.decompress(text).decode("utf-8"), metadata=metadata)
+
+    def _put(self, content_hash: str, rows: List[Tuple[int, Optional[int], Optional[str], bytes]]):
+        conn = self._conn()
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages (content_hash, position, page, language, text) VALUES (?, ?, ?, ?, ?)",
+            [(content_hash, *row) for row in rows]
+        )
+        conn.commit()
+
+    def write_through(self, content_hash: str, pages: Iterable[Document]) -> Iterator[Document]:
+        """Yields pages as they are extracted and stores them; the file is marked cached after the last one."""
+        conn = self._conn()
+        # Leftovers of an earlier, interrupted extraction
+        conn.execute("DELETE FROM pages WHERE content_hash = ?", (content_hash,))
+        conn.commit()
+        rows = []
+        page_count = text_bytes = stored_bytes = 0
+        for page in pages:
+            text = page.page_content.encode("utf-8")
+            compressed = zlib.compress(text, self.compress_level)
+            rows.append((page_count, page.metadata.get("page"), page.metadata.get("language"), compressed))
+            page_count += 1
+            text_bytes += len(text)
+            stored_bytes += len(compressed)
+            if len(rows) >= self.write_batch_size:
+                self._put(content_hash, rows)
+                rows = []
+            yield page
+        if rows:
+            self._put(content_hash, rows)
+        conn.execute(
+            "INSERT OR REPLACE INTO page_files (content_hash, page_count, text_bytes, stored_bytes, last_used) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (content_hash, page_count, text_bytes, stored_bytes, time.time())
+        )
+        conn.commit()
+        self._evict()
+
+    def _evict(self):
+        conn = self._conn()
+        victims = [row[0] for row in conn.execute(
+            "SELECT content_hash FROM page_files ORDER BY last_used DESC LIMIT -1 OFFSET ?", (self.max_files,)
+        )]
+        for content_hash in victims:
+            self.delete(content_hash)
+        with self._lock:
+            self._evictions += len(victims)
+
+    def get_page(self, content_hash: str, page: int) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT page, language, text FROM pages WHERE content_hash = ? AND page = ? ORDER BY position LIMIT 1",
+            (content_hash, page)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"page": row[0], "language": row[1], "text": zlib.decompress(row[2]).decode("utf-8")}
+
+    def delete(self, content_hash: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM pages WHERE content_hash = ?", (content_hash,))
+            conn.execute("DELETE FROM page_files WHERE content_hash = ?", (content_hash,))
+
+    def stats(self) -> dict:
+        files, pages, text_bytes, stored_bytes = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(page_count), 0), COALESCE(SUM(text_bytes), 0), "
+            "COALESCE(SUM(stored_bytes), 0) FROM page_files"
+        ).fetchone()
+        with self._lock:
+            hits, misses, evictions = self._hits, self._misses, self._evictions
+        lookups = hits + misses
+        return {
+            "files": files,
+            "pages": pages,
+            "text_bytes": text_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": round(stored_bytes / text_bytes, 3) if text_bytes else None,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "evictions": evictions,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_page_cache() -> PageCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache(max_files=int(os.getenv("PAGE_CACHE_MAX_FILES", "1000")))
+        return _default_cache
@@ -1,159 +1,397 @@
-from langchain_community.document_loaders import Docx2txtLoader, UnstructuredHTMLLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from pinecone import Pinecone, ServerlessSpec
-from typing import List
+from typing import Iterable, Iterator, List, Optional, Tuple
 from langchain_core.documents import Document
 import os
+import uuid
+import logging
+import threading
 from dotenv import load_dotenv
-import fitz
-from langdetect import detect 
+import hashlib
+from embedding_cache import CachedEmbeddings
+from document_util import get_all_documents, get_document_by_id, get_manifest_vector_ids, delete_manifest_entries
+
+# Clients (OpenAI, Pinecone, the local store) and heavy parsers are created or
+# imported on first use, so importing this module does no network or disk work.
 
 load_dotenv()
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=200, length_function=len)
-embedding_function = OpenAIEmbeddings(model="text-embedding-3-large")
+embedding_model = "text-embedding-3-large"
 
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 
-# Pinecone setup
-pc = Pinecone(api_key=PINECONE_API_KEY)
-
 index_name = "saama-laws"
 dimension = 3072 
+delete_batch_size = 1000  # Pinecone's per-request limit for delete by ids
+fetch_batch_size = 100  # ids go in the fetch URL
+
+# "pinecone" (default) or "local" for the in-process LocalVectorStore
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_index"))
+
+# Language is detected once per section of this many pages, from its first pages
+LANGUAGE_SECTION_PAGES = int(os.getenv("LANGUAGE_SECTION_PAGES", "50"))
+LANGUAGE_SAMPLE_CHARS = 500
+LANGUAGE_SAMPLE_PAGES = 3
+NO_TEXT_FALLBACK = "[NO TEXT FOUND ON PAGE]"
+
+_clients = {}
+_clients_lock = threading.RLock()
+
+def _get_or_create(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def _create_embedding_function():
+    def openai_embeddings():
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=embedding_model)
+
+    return CachedEmbeddings(
+        openai_embeddings,
+        model=embedding_model,
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000")),
+    )
+
+def get_embedding_function() -> CachedEmbeddings:
+    return _get_or_create("embedding_function", _create_embedding_function)
+
+def get_pinecone_client():
+    """None with the local backend."""
+    if VECTOR_BACKEND == "local":
+        return None
+
+    def create():
+        from pinecone import Pinecone
+        return Pinecone(api_key=PINECONE_API_KEY)
+
+    return _get_or_create("pc", create)
 
 def index_exists(index_name):
     try:
-        indexes = pc.list_indexes()
+        indexes = get_pinecone_client().list_indexes()
         return index_name in [i.name for i in indexes]
     except Exception as e:
         print(f"Error checking index existence: {e}")
         return False
 
-if not index_exists(index_name):
-    pc.create_index(
-        name=index_name,
-        dimension=dimension,
-        metric="cosine",
-        spec=ServerlessSpec(
-            cloud="aws",
-            region="us-east-1"
-        )
+def _create_local_store():
+    from local_vector_store import LocalVectorStore
+    local_ivf_min_rows = os.getenv("LOCAL_INDEX_IVF_MIN_ROWS")
+    return LocalVectorStore(
+        LOCAL_INDEX_DIR,
+        get_embedding_function(),
+        dimension,
+        ivf_min_rows=int(local_ivf_min_rows) if local_ivf_min_rows else None,
     )
 
-index = pc.Index(index_name)
-from langchain_pinecone import PineconeVectorStore
-vectorstore = PineconeVectorStore(index_name=index_name, embedding=embedding_function)
+def _create_pinecone_index():
+    from pinecone import ServerlessSpec
+    pc = get_pinecone_client()
+    if not index_exists(index_name):
+        pc.create_index(
+            name=index_name,
+            dimension=dimension,
+            metric="cosine",
+            spec=ServerlessSpec(
+                cloud="aws",
+                region="us-east-1"
+            )
+        )
+    return pc.Index(index_name)
+
+def get_index():
+    """The raw index (upsert/delete/fetch/query); the local store implements the same calls."""
+    if VECTOR_BACKEND == "local":
+        return _get_or_create("vectorstore", _create_local_store)
+    return _get_or_create("index", _create_pinecone_index)
+
+def get_vectorstore():
+    if VECTOR_BACKEND == "local":
+        return _get_or_create("vectorstore", _create_local_store)
+
+    def create():
+        from langchain_pinecone import PineconeVectorStore
+        get_index()  # makes sure the index exists
+        return PineconeVectorStore(index_name=index_name, embedding=get_embedding_function())
+
+    return _get_or_create("vectorstore", create)
+
+_lazy_names = {
+    "embedding_function": get_embedding_function,
+    "pc": get_pinecone_client,
+    "index": get_index,
+    "vectorstore": get_vectorstore,
+}
+
+def __getattr__(name):
+    # Keeps `from pinecone_util import index` (and friends) working, lazily
+    if name in _lazy_names:
+        return _lazy_names[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def get_pdf_page_count(file_path: str) -> int:
+    import fitz
+    with fitz.open(file_path) as doc:
+        return len(doc)
+
+_language_cache = {}
+_language_cache_lock = threading.Lock()
+
+def detect_language(text: str) -> str:
+    from langdetect import detect
+    try:
+        return detect(text)
+    except Exception:
+        return "unknown"
+
+def _section_language(file_path: str, section: int, sample: List[str]) -> str:
+    """Cached per (file revision, section), so page ranges parsed separately share one detection."""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, section)
+    with _language_cache_lock:
+        language = _language_cache.get(key)
+    if language is None:
+        text = " ".join(t for t in sample if t != NO_TEXT_FALLBACK)
+        language = detect_language(text[:LANGUAGE_SAMPLE_CHARS]) if text else "unknown"
+        with _language_cache_lock:
+            if len(_language_cache) > 10000:
+                _language_cache.clear()
+            _language_cache[key] = language
+    return language
+
+def iter_pdf_pages(file_path: str, start_page: int = 0, end_page: Optional[int] = None) -> Iterator[Document]:
+    """Yields one Document per PDF page, extracted with PyMuPDF (fitz).
+
+    start_page/end_page select a zero-based, end-exclusive page range so large
+    files can be split across workers. Language is detected per section of
+    LANGUAGE_SECTION_PAGES pages from the text of its first pages, which are
+    held back until the sample is complete; every other page is yielded as
+    soon as it is read.
+    """
+    import fitz
 
-def extract_text_from_pdf(file_path: str) -> List[Document]:
-    """Extracts text from a PDF file using PyMuPDF (fitz) with fallback for empty pages."""
-    doc = fitz.open(file_path)
-    documents = []
     file_name = os.path.basename(file_path)
+    with fitz.open(file_path) as doc:
+        end_page = len(doc) if end_page is None else min(end_page, len(doc))
+        held = []  # (page number, text) waiting for the section's language
+        section, language = None, None
 
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
-        raw_text = page.get_text() # type: ignore
-        cleaned_text = raw_text.strip()
-
-        if not cleaned_text:
-            cleaned_text = "[NO TEXT FOUND ON PAGE]"  # Fallback text
-
-        # Safely detect language (use fallback if detection fails)
-        try:
-            language = detect(cleaned_text[:200])
-        except:
-            language = "unknown"
-
-        documents.append(Document(
-            page_content=cleaned_text,
-            metadata={
-                "page": page_num + 1,
-                "source": file_name,
-                "language": language
-            }
-        ))
-
-    return documents
-def load_and_split_document(file_path: str) -> List[Document]:
-    """Loads and splits a document based on its file type, adding metadata."""
+        for page_num in range(start_page, end_page):
+            if page_num // LANGUAGE_SECTION_PAGES != section:
+                section, language = page_num // LANGUAGE_SECTION_PAGES, None
+            cleaned_text = doc.load_page(page_num).get_text().strip() or NO_TEXT_FALLBACK  # type: ignore
+
+            if language is None:
+                held.append((page_num, cleaned_text))
+                sampled = sum(len(text) for _, text in held if text != NO_TEXT_FALLBACK)
+                section_end = min((section + 1) * LANGUAGE_SECTION_PAGES, end_page)
+                if sampled < LANGUAGE_SAMPLE_CHARS and len(held) < LANGUAGE_SAMPLE_PAGES and page_num + 1 < section_end:
+                    continue
+                language = _section_language(file_path, section, [text for _, text in held])
+                for held_num, held_text in held:
+                    yield _page_document(held_text, held_num, file_name, language)
+                held = []
+                continue
+
+            yield _page_document(cleaned_text, page_num, file_name, language)
+
+def _page_document(text: str, page_num: int, file_name: str, language: str) -> Document:
+    return Document(page_content=text, metadata={"page": page_num + 1, "source": file_name, "language": language})
+
+def extract_text_from_pdf(file_path: str, start_page: int = 0, end_page: Optional[int] = None) -> List[Document]:
+    """All pages of iter_pdf_pages as a list (process pool workers return them this way)."""
+    return list(iter_pdf_pages(file_path, start_page, end_page))
+
+def load_document(file_path: str) -> List[Document]:
+    """Loads a document based on its file type, one Document per page/section."""
     if file_path.endswith('.pdf'):
-        documents = extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path)
     elif file_path.endswith('.docx'):
+        from langchain_community.document_loaders import Docx2txtLoader
         loader = Docx2txtLoader(file_path)
-        documents = loader.load()
+        return loader.load()
     elif file_path.endswith('.html'):
+        from langchain_community.document_loaders import UnstructuredHTMLLoader
         loader = UnstructuredHTMLLoader(file_path)
-        documents = loader.load()
+        return loader.load()
     else:
         raise ValueError(f"Unsupported file type: {file_path}")
-    
-    result_documents = []
+
+def iter_split_documents(documents: Iterable[Document]) -> Iterator[Document]:
+    """Chunks each page as it arrives; every chunk gets its own copy of the page's metadata."""
     for document in documents:
-        chunks = text_splitter.split_text(document.page_content)
-        for chunk in chunks:
-            result_documents.append(Document(
-                page_content=chunk,
-                metadata=document.metadata
-            ))
+        for chunk in text_splitter.split_text(document.page_content):
+            yield Document(page_content=chunk, metadata=dict(document.metadata))
 
-    return result_documents
+def split_documents(documents: List[Document]) -> List[Document]:
+    return list(iter_split_documents(documents))
 
-def index_document_to_pinecone(file_path: str, file_id: int) -> bool:
-    try:
-        splits = load_and_split_document(file_path)
-        
-        for split in splits:
-            split.metadata['file_id'] = file_id
-        
-        vectorstore.add_documents(splits)
-        return True
-    except Exception as e:
-        print(f"Error indexing document: {e}")
-        return False
+def load_and_split_document(file_path: str) -> List[Document]:
+    """Loads and splits a document based on its file type, adding metadata."""
+    return split_documents(load_document(file_path))
 
-def delete_doc_from_pinecone(file_id: int) -> bool:
-    try:
-        index = pc.Index(index_name)
-
-        vectors_to_delete = []
-        next_token = None
-        batch_size = 1000
-
-        while True:
-            query_results = index.query(
-                vector=[0] * dimension,  # type: ignore
-                top_k=batch_size,        
-                include_metadata=True,   
-                cursor=next_token
-            )
+class VectorIdBuilder:
+    """
+    Deterministic vector IDs of the form "{file_id}:{content hash}".
 
-            if query_results and "matches" in query_results: # type: ignore
-                for match in query_results["matches"]: # type: ignore
-                    metadata = match.get("metadata", {})
-                    if metadata.get("file_id") == file_id:
-                        vectors_to_delete.append(match["id"])
+    Re-indexing the same content yields the same IDs, so upserts overwrite
+    instead of duplicating. The page is left out, so a chunk keeps its ID when
+    a revision shifts the pagination around it. Fed one chunk at a time in
+    document order, so IDs can be assigned while a file is still being read;
+    entry() returns (vector_id, page, chunk_index, content_hash).
+    """
 
-                next_token = query_results.get("next_page_token", None) # type: ignore
+    def __init__(self, file_id: int):
+        self.file_id = file_id
+        self._seen = {}
+        self._chunk_index_by_page = {}
 
-                if not next_token:
-                    break
-            else:
-                return "No vectors found or metadata retrieval failed." # type: ignore
+    def entry(self, split: Document) -> tuple:
+        page = split.metadata.get("page", 0)
+        chunk_index = self._chunk_index_by_page.get(page, 0)
+        self._chunk_index_by_page[page] = chunk_index + 1
 
-        if vectors_to_delete:
-            index.delete(ids=vectors_to_delete)
-            return f"Successfully deleted {len(vectors_to_delete)} vectors with file_id {file_id}." # type: ignore
+        content_hash = hashlib.sha256(split.page_content.encode("utf-8")).hexdigest()
+        vector_id = f"{self.file_id}:{content_hash[:16]}"
+        # Identical text repeated in the file still needs distinct IDs
+        occurrence = self._seen.get(vector_id, 0)
+        self._seen[vector_id] = occurrence + 1
+        if occurrence:
+            vector_id = f"{vector_id}-{occurrence}"
+        return (vector_id, page, chunk_index, content_hash)
+
+def _scan_vector_ids_for_file(file_id: int) -> List[str]:
+    """Legacy lookup for documents indexed before the manifest existed."""
+    if VECTOR_BACKEND == "local":
+        # The local backend has always been indexed through the manifest
+        return []
+
+    vectors_to_delete = []
+    next_token = None
+    batch_size = 1000
+
+    while True:
+        query_results = get_index().query(
+            vector=[0] * dimension,  # type: ignore
+            top_k=batch_size,        
+            include_metadata=True,   
+            cursor=next_token
+        )
+
+        if query_results and "matches" in query_results: # type: ignore
+            for match in query_results["matches"]: # type: ignore
+                metadata = match.get("metadata", {})
+                if metadata.get("file_id") == file_id:
+                    vectors_to_delete.append(match["id"])
+
+            next_token = query_results.get("next_page_token", None) # type: ignore
+
+            if not next_token:
+                break
         else:
-            return f"No vectors found with file_id {file_id}." # type: ignore
+            break
+
+    return vectors_to_delete
+
+def new_namespace(file_id: int) -> str:
+    """
+    Every document gets its own namespace, so a search or delete only touches
+    that document. Ids start over after reset_db.py, so the namespace is made
+    unique rather than derived from the id; it is stored in documents.namespace
+    and always read from there.
+    """
+    return f"file-{file_id}-{uuid.uuid4().hex[:12]}"
+
+def delete_doc_from_pinecone(file_id: int) -> Tuple[int, bool]:
+    """
+    Removes a document's vectors and manifest rows; returns (vectors deleted,
+    ok). A document with nothing indexed (never written, or still queued)
+    deletes 0 vectors and is ok; ok is False only when the index call failed.
+    """
+    try:
+        document = get_document_by_id(file_id)
+        if document and document.get("namespace"):
+            namespace = document["namespace"]
+            vector_count = len(get_manifest_vector_ids(file_id))
+            try:
+                get_index().delete(delete_all=True, namespace=namespace)
+            except Exception:
+                # Pinecone rejects deleting a namespace that was never written;
+                # then there is nothing to remove and the document can still go
+                if vector_count:
+                    raise
+            delete_manifest_entries(file_id)
+            return vector_count, True
+
+        # Documents indexed into the shared default namespace, before namespaces were used
+        vectors_to_delete = get_manifest_vector_ids(file_id)
+        if not vectors_to_delete:
+            vectors_to_delete = _scan_vector_ids_for_file(file_id)
+
+        if vectors_to_delete:
+            for start in range(0, len(vectors_to_delete), delete_batch_size):
+                get_index().delete(ids=vectors_to_delete[start:start + delete_batch_size])
+            delete_manifest_entries(file_id)
+        return len(vectors_to_delete), True
     except Exception as e:
-        return f"Error deleting vectors for file_id {file_id}: {str(e)}" # type: ignore
+        logging.error(f"Error deleting vectors for file_id {file_id}: {str(e)}", exc_info=True)
+        return 0, False
+
+def audit_index() -> dict:
+    """
+    Checks the manifest against the vector index: manifest ids the index does
+    not have, namespaces holding more vectors than their document's manifest
+    lists, and namespaces no document uses (e.g. left behind by reset_db.py).
+    Pinecone's per-namespace counts lag recent writes by a few seconds.
+    """
+    index = get_index()
+    documents = [document for document in get_all_documents() if document.get("namespace")]
+    manifest_counts = {}
+    missing = {}
+    for document in documents:
+        vector_ids = get_manifest_vector_ids(document["id"])
+        manifest_counts[document["namespace"]] = len(vector_ids)
+        found = 0
+        for start in range(0, len(vector_ids), fetch_batch_size):
+            response = index.fetch(ids=vector_ids[start:start + fetch_batch_size], namespace=document["namespace"])
+            found += len(response["vectors"] if isinstance(response, dict) else response.vectors)
+        if found < len(vector_ids):
+            missing[document["id"]] = len(vector_ids) - found
+
+    stats = index.describe_index_stats()
+    namespaces = stats["namespaces"] if isinstance(stats, dict) else stats.namespaces
+    file_ids = {document["namespace"]: document["id"] for document in documents}
+    unlisted, unknown = {}, []
+    for name, summary in namespaces.items():
+        count = summary["vector_count"] if isinstance(summary, dict) else summary.vector_count
+        if name in file_ids:
+            if count > manifest_counts[name]:
+                unlisted[file_ids[name]] = count - manifest_counts[name]
+        elif name not in ("", "__default__"):
+            unknown.append(name)
+    return {
+        "documents_checked": len(documents),
+        "vectors_missing_from_index": missing,
+        "vectors_missing_from_manifest": unlisted,
+        "unknown_namespaces": sorted(unknown),
+    }
 
-def show_metadata() -> List[dict]:
+def show_metadata(namespace: Optional[str] = None) -> List[dict]:
+    """A few stored vectors, from the given namespace or else the newest namespaced document's."""
     try:
-        query_results = index.query(
+        if namespace is None:
+            namespaces = [document["namespace"] for document in get_all_documents() if document.get("namespace")]
+            namespace = namespaces[-1] if namespaces else None
+        query_results = get_index().query(
             vector=[0] * dimension,  # type: ignore
             top_k=5,
-            include_metadata=True
+            include_metadata=True,
+            namespace=namespace
         )
 
         if query_results and "matches" in query_results: # type: ignore
@@ -0,0 +1,208 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from pydantic import ConfigDict, PrivateAttr
+
+from bm25_index import tokenize
+
+# Shared by every local reranker so scoring never competes with itself for CPU
+_scoring_pool = ThreadPoolExecutor(max_workers=int(os.getenv("RERANK_THREADS", "4")), thread_name_prefix="rerank")
+
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """LRU of (query, chunk) -> score; chunks are keyed by content hash since dense hits carry no id."""
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, query_key: str, chunk_keys: List[str]) -> List[Optional[float]]:
+        found = []
+        with self._lock:
+            for chunk_key in chunk_keys:
+                score = self._scores.get((query_key, chunk_key))
+                if score is None:
+                    self.misses += 1
+                else:
+                    self._scores.move_to_end((query_key, chunk_key))
+                    self.hits += 1
+                found.append(score)
+        return found
+
+    def put_many(self, query_key: str, items):
+        with self._lock:
+            for chunk_key, score in items:
+                self._scores[(query_key, chunk_key)] = score
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+
+class OnnxCrossEncoder:
+    """
+    Small cross-encoder (e.g. an ms-marco MiniLM export) run with onnxruntime.
+
+    model_dir must contain model.onnx and tokenizer.json. onnxruntime and
+    tokenizers are optional dependencies, only imported when this is used.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 512, batch_size: int = 16):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, "model.onnx"),
+                                                    providers=["CPUExecutionProvider"])
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.batch_size = batch_size
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _score_batch(self, query: str, texts: List[str]) -> List[float]:
+        encodings = self.tokenizer.encode_batch([(query, text) for text in texts])
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+        return logits.reshape(len(texts), -1)[:, -1].tolist()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        futures = [_scoring_pool.submit(self._score_batch, query, batch) for batch in batches]
+        return [score for future in futures for score in future.result()]
+
+
+class LocalReranker(BaseDocumentCompressor):
+    """
+    CPU-only reranker. Uses the ONNX cross-encoder when one is configured,
+    otherwise blends cosine similarity of the query and chunk embeddings
+    (chunk vectors come out of the embedding cache filled at index time)
+    with a lexical overlap score. Scores are cached per (query, chunk).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    embedding: Optional[object] = None
+    cross_encoder: Optional[object] = None
+    top_n: int = 3
+    lexical_weight: float = 0.3
+    score_cache: ScoreCache = None  # type: ignore
+
+    def model_post_init(self, __context):
+        if self.score_cache is None:
+            self.score_cache = ScoreCache()
+
+    def _similarity_scores(self, query: str, texts: List[str]) -> List[float]:
+        query_terms = set(tokenize(query))
+        lexical = [
+            len(query_terms & set(tokenize(text))) / len(query_terms) if query_terms else 0.0
+            for text in texts
+        ]
+        if self.embedding is None:
+            return lexical
+        # One batched call; both hit the embedding cache for indexed chunks and repeat queries
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        chunk_vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        query_vector /= (np.linalg.norm(query_vector) or 1.0)
+        chunk_vectors /= np.maximum(np.linalg.norm(chunk_vectors, axis=1, keepdims=True), 1e-12)
+        dense = chunk_vectors @ query_vector
+        return [(1 - self.lexical_weight) * float(d) + self.lexical_weight * l for d, l in zip(dense, lexical)]
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        query_key = _text_key(query)
+        chunk_keys = [_text_key(text) for text in texts]
+        scores = self.score_cache.get_many(query_key, chunk_keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            if self.cross_encoder is not None:
+                fresh = self.cross_encoder.score(query, missing_texts)
+            else:
+                fresh = _scoring_pool.submit(self._similarity_scores, query, missing_texts).result()
+            self.score_cache.put_many(query_key, [(chunk_keys[i], s) for i, s in zip(missing, fresh)])
+            for i, s in zip(missing, fresh):
+                scores[i] = s
+        return scores  # type: ignore
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        if not documents:
+            return []
+        scores = self.score(query, [doc.page_content for doc in documents])
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)[:self.top_n]
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "relevance_score": score})
+            for doc, score in ranked
+        ]
+
+
+class PassthroughReranker(BaseDocumentCompressor):
+    """No reranking: keeps the retriever's order, cut to the same top_n as the rerankers."""
+
+    top_n: int = 3
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        return list(documents)[:self.top_n]
+
+
+class TimedReranker(BaseDocumentCompressor):
+    """Wraps any compressor and records per-call latency for /stats."""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    base: BaseDocumentCompressor
+    mode: str
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _total_ms: float = PrivateAttr(default=0.0)
+
+    def _record(self, started: float):
+        with self._lock:
+            self._calls += 1
+            self._total_ms += (time.perf_counter() - started) * 1000
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        started = time.perf_counter()
+        try:
+            return self.base.compress_documents(documents, query, callbacks=callbacks)
+        finally:
+            self._record(started)
+
+    async def acompress_documents(self, documents: Sequence[Document], query: str,
+                                  callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        started = time.perf_counter()
+        try:
+            return await self.base.acompress_documents(documents, query, callbacks=callbacks)
+        finally:
+            self._record(started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "mode": self.mode,
+                "calls": self._calls,
+                "avg_ms": round(self._total_ms / self._calls, 2) if self._calls else None,
+            }
+        score_cache = getattr(self.base, "score_cache", None)
+        if score_cache is not None:
+            stats["score_cache_hits"] = score_cache.hits
+            stats["score_cache_misses"] = score_cache.misses
+        return stats
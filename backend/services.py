@@ -0,0 +1,799 @@
+import os
+import time
+import uuid
+import hashlib
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from pinecone_util import delete_doc_from_pinecone, get_embedding_function, get_index, new_namespace
+from ingest_pipeline import get_default_pipeline
+from langchain_util import chain_registry, MAX_ROUTED_SOURCES
+from fast_router import FastRouter
+from answer_cache import AnswerCache
+from bm25_index import get_bm25_index
+from session_memory import DEFAULT_SPILL_PATH, SessionMemory, history_tokens
+from job_queue import DEFAULT_SPOOL_DIR, JobQueue
+from tracing import stage, stage_config
+from context_packing import ContextPacker
+from page_cache import get_page_cache
+from document_util import (
+    STATUS_INDEXED,
+    STATUS_INDEXING,
+    audit_manifest,
+    delete_document_record,
+    delete_document_records,
+    get_all_documents,
+    get_document_by_id,
+    get_documents_by_filenames,
+    get_manifest_vector_ids,
+    insert_document_records,
+    set_document_namespace,
+    update_document_status,
+)
+
+# Shared by the Flask app (main.py) and the async app (asgi_app.py)
+ALLOWED_EXTENSIONS = ['.pdf', '.docx', '.html']
+
+# Cheap to build: the cache opens its database and the OpenAI client on first use
+embedding_function = get_embedding_function()
+
+fast_router = FastRouter(
+    embedding=embedding_function if os.getenv("FAST_ROUTER_USE_EMBEDDINGS", "0") == "1" else None,
+    min_score=float(os.getenv("FAST_ROUTER_MIN_SCORE", "0.3")),
+    min_margin=float(os.getenv("FAST_ROUTER_MIN_MARGIN", "0.1")),
+    audit_rate=float(os.getenv("FAST_ROUTER_AUDIT_RATE", "0.05")),
+    enabled=os.getenv("FAST_ROUTER_ENABLED", "1") == "1",
+)
+
+answer_cache = AnswerCache(
+    ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000")),
+    embedding=embedding_function if os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1" else None,
+    similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+)
+
+context_packer = ContextPacker(
+    token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")),
+    enabled=os.getenv("CONTEXT_PACKING", "1") == "1",
+)
+
+session_memory = SessionMemory(
+    max_sessions=int(os.getenv("SESSION_MAX_IN_MEMORY", "1000")),
+    recent_messages=int(os.getenv("SESSION_RECENT_MESSAGES", "6")),
+    summary_token_budget=int(os.getenv("SESSION_SUMMARY_TOKENS", "400")),
+    spill_path=DEFAULT_SPILL_PATH if os.getenv("SESSION_SPILL", "0") == "1" else None,
+)
+
+
+class UpstreamLimits:
+    """
+    One asyncio semaphore per upstream service, so the async app's concurrency
+    is bounded by what OpenAI/Pinecone/Cohere can take rather than by workers.
+    """
+
+    def __init__(self, limits: Dict[str, int]):
+        self._limits = dict(limits)
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+        self._waiting = {name: 0 for name in limits}
+
+    @asynccontextmanager
+    async def acquire(self, upstream: str):
+        semaphore = self._semaphores[upstream]
+        self._waiting[upstream] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[upstream] -= 1
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            name: {"limit": self._limits[name], "waiting": self._waiting[name]}
+            for name in self._limits
+        }
+
+
+# combined: one structured call picks the sources and rewrites the question (see
+# get_route_rewrite_chain); legacy: router chain, then a separate contextualize call.
+ROUTING_MODE = os.getenv("ROUTING_MODE", "combined")
+
+llm_calls = {"router": 0, "route_rewrite": 0, "contextualize": 0}
+
+
+def parse_router_response(response_text: str) -> Tuple[Optional[List[str]], str]:
+    response_lines = response_text.splitlines()
+    if response_lines and response_lines[0].strip() == "False":
+        sources = [line.strip().strip('",') for line in response_lines[1:]]
+        # An empty pick keeps the old behaviour of searching source ""
+        return [source for source in sources if source][:MAX_ROUTED_SOURCES] or [""], response_text
+    return None, response_text
+
+
+def llm_route_question(question, chat_history):
+    simple_chain = chain_registry.get_router_chain()
+    llm_calls["router"] += 1
+    general_response = simple_chain.invoke({
+        "input": question,
+        "chat_history": chat_history
+    }, config=stage_config("route"))
+    return parse_router_response(general_response['text'])
+
+
+def audit_route_question(question, chat_history):
+    """
+    The router chain for FastRouter's background agreement check. Not counted
+    in llm_calls and not traced as the route stage, so audits don't show up
+    as routing cost.
+    """
+    general_response = chain_registry.get_router_chain().invoke({
+        "input": question,
+        "chat_history": chat_history
+    }, config={"run_name": "route_audit"})
+    return parse_router_response(general_response['text'])
+
+
+async def allm_route_question(question, chat_history, limits: UpstreamLimits):
+    # Reads the registry and may rebuild the chain, so it stays off the event loop
+    simple_chain = await asyncio.to_thread(chain_registry.get_router_chain)
+    llm_calls["router"] += 1
+    async with limits.acquire("openai"):
+        general_response = await simple_chain.ainvoke({
+            "input": question,
+            "chat_history": chat_history
+        }, config=stage_config("route"))
+    return parse_router_response(general_response['text'])
+
+
+def parse_route_decision(decision, chat_history) -> Tuple[Optional[List[str]], str, Optional[str]]:
+    """(sources, response_text, query); query is only set when history had to be folded in."""
+    if not decision.needs_documents or not decision.sources:
+        return None, decision.reply or "", None
+    sources = decision.sources[:MAX_ROUTED_SOURCES]
+    query = decision.standalone_query if chat_history and decision.standalone_query else None
+    return sources, "False\n" + "\n".join(sources), query
+
+
+def llm_route_and_rewrite(question, chat_history):
+    llm_calls["route_rewrite"] += 1
+    decision = chain_registry.get_route_rewrite_chain().invoke({
+        "input": question,
+        "chat_history": chat_history
+    }, config=stage_config("route"))
+    return parse_route_decision(decision, chat_history)
+
+
+async def allm_route_and_rewrite(question, chat_history, limits: UpstreamLimits):
+    llm_calls["route_rewrite"] += 1
+    route_rewrite_chain = await asyncio.to_thread(chain_registry.get_route_rewrite_chain)
+    async with limits.acquire("openai"):
+        decision = await route_rewrite_chain.ainvoke({
+            "input": question,
+            "chat_history": chat_history
+        }, config=stage_config("route"))
+    return parse_route_decision(decision, chat_history)
+
+
+def route_question(question, chat_history) -> Tuple[Optional[List[str]], str, Optional[str]]:
+    """
+    Returns (sources, response_text, query); sources is None when the router
+    answered directly instead of picking documents, and query is the
+    rewritten question when the combined route+rewrite call produced one.
+    Confident matches are resolved locally by fast_router, everything else
+    goes to the LLM.
+    """
+    rewritten = {}
+
+    def llm_route():
+        if ROUTING_MODE != "combined":
+            return llm_route_question(question, chat_history)
+        sources, response_text, rewritten["query"] = llm_route_and_rewrite(question, chat_history)
+        return sources, response_text
+
+    with stage("route"):
+        sources, response_text = fast_router.route(
+            question,
+            llm_route,
+            audit_route=lambda: audit_route_question(question, chat_history),
+            chat_history=chat_history,
+        )
+    return sources, response_text, rewritten.get("query")
+
+
+async def aroute_question(question, chat_history, limits: UpstreamLimits):
+    rewritten = {}
+
+    async def allm_route():
+        if ROUTING_MODE != "combined":
+            return await allm_route_question(question, chat_history, limits)
+        sources, response_text, rewritten["query"] = await allm_route_and_rewrite(question, chat_history, limits)
+        return sources, response_text
+
+    with stage("route"):
+        sources, response_text = await fast_router.aroute(
+            question,
+            allm_route,
+            audit_route=lambda: audit_route_question(question, chat_history),
+            chat_history=chat_history,
+        )
+    return sources, response_text, rewritten.get("query")
+
+
+def load_history(query_input) -> List[dict]:
+    """History sent by the client wins (older clients resend it); otherwise the server-side session is used."""
+    if query_input.history:
+        return [entry.model_dump() for entry in query_input.history]
+    return session_memory.get_history(query_input.session_id)
+
+
+def remember_turn(session_id: str, question: str, response: dict, chat_history: List[dict]) -> dict:
+    """Stores the exchange and returns the response with the history token count of this turn."""
+    session_memory.append(session_id, question, response["answer"])
+    return {**response, "history_tokens": history_tokens(chat_history)}
+
+
+def build_highlighted_contexts(contexts):
+    highlighted_contexts = []
+    for context in contexts:
+        if hasattr(context, 'page_content'):
+            context_text = context.page_content
+            metadata = context.metadata if hasattr(context, 'metadata') else {}
+
+            highlighted_contexts.append({
+                "file_id": metadata.get("file_id"),
+                "page": metadata.get("page", None),
+                "source": metadata.get("source", None),
+                "language": metadata.get("language", None),
+                "context_text": context_text
+            })
+    return highlighted_contexts
+
+
+class RetrievalTimings:
+    """Per-source search latency and the wall-clock time of each fan-out, for /stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._per_source: Dict[str, List[float]] = {}
+        self._stats = {"searches": 0, "sources_total": 0, "wall_ms_total": 0.0, "sequential_ms_total": 0.0}
+
+    def record(self, per_source_ms: Dict[str, float], wall_ms: float):
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["sources_total"] += len(per_source_ms)
+            self._stats["wall_ms_total"] += wall_ms
+            self._stats["sequential_ms_total"] += sum(per_source_ms.values())
+            for source, ms in per_source_ms.items():
+                entry = self._per_source.setdefault(source, [0, 0.0])
+                entry[0] += 1
+                entry[1] += ms
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            per_source = {source: {"searches": n, "avg_ms": round(total / n, 2)}
+                          for source, (n, total) in self._per_source.items()}
+        searches = s["searches"]
+        return {
+            "searches": searches,
+            "avg_sources": round(s["sources_total"] / searches, 2) if searches else None,
+            "avg_wall_ms": round(s["wall_ms_total"] / searches, 2) if searches else None,
+            # What the same searches would have cost run one after another
+            "avg_sequential_ms": round(s["sequential_ms_total"] / searches, 2) if searches else None,
+            "per_source": per_source,
+        }
+
+
+retrieval_timings = RetrievalTimings()
+_retrieval_pool = ThreadPoolExecutor(max_workers=int(os.getenv("RETRIEVAL_FANOUT_THREADS", "8")),
+                                     thread_name_prefix="retrieve")
+
+
+def merge_retrieved(result_lists: List[list]) -> list:
+    """Interleaves per-source results by rank and drops chunks seen in an earlier list."""
+    seen = set()
+    merged = []
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank >= len(results):
+                continue
+            document = results[rank]
+            key = (document.metadata.get("source"), document.metadata.get("page"), document.page_content)
+            if key not in seen:
+                seen.add(key)
+                merged.append(document)
+    return merged
+
+
+def _timed_search(retriever, query):
+    started = time.perf_counter()
+    documents = retriever.invoke(query)
+    return documents, (time.perf_counter() - started) * 1000
+
+
+def retrieve_context(sources, question, chat_history, query=None):
+    """
+    contextualize (only with history) -> one vector search per source, run
+    concurrently -> merge -> a single rerank over the pooled chunks.
+    A query already rewritten by the router skips the contextualize call.
+    """
+    parts = [chain_registry.get_rag_parts(source) for source in sources]
+    if query is None:
+        query = question
+        if chat_history:
+            llm_calls["contextualize"] += 1
+            with stage("contextualize"):
+                query = parts[0].contextualize_chain.invoke({"input": question, "chat_history": chat_history},
+                                                            config=stage_config("contextualize"))
+
+    with stage("retrieval"):
+        started = time.perf_counter()
+        if len(parts) == 1:
+            results = [_timed_search(parts[0].retriever, query)]
+        else:
+            futures = [_retrieval_pool.submit(_timed_search, p.retriever, query) for p in parts]
+            results = [future.result() for future in futures]
+        retrieval_timings.record({source: ms for source, (_, ms) in zip(sources, results)},
+                                 (time.perf_counter() - started) * 1000)
+        documents = merge_retrieved([documents for documents, _ in results])
+
+    if documents:
+        with stage("rerank"):
+            documents = list(parts[0].compressor.compress_documents(documents, query))
+    return documents
+
+
+async def aretrieve_context(sources, question, chat_history, limits: UpstreamLimits, query=None):
+    parts = await asyncio.to_thread(lambda: [chain_registry.get_rag_parts(source) for source in sources])
+    if query is None:
+        query = question
+        if chat_history:
+            llm_calls["contextualize"] += 1
+            with stage("contextualize"):
+                async with limits.acquire("openai"):
+                    query = await parts[0].contextualize_chain.ainvoke(
+                        {"input": question, "chat_history": chat_history}, config=stage_config("contextualize"))
+
+    async def search(retriever):
+        async with limits.acquire("pinecone"):
+            search_started = time.perf_counter()
+            documents = await retriever.ainvoke(query)
+            return documents, (time.perf_counter() - search_started) * 1000
+
+    with stage("retrieval"):
+        started = time.perf_counter()
+        results = await asyncio.gather(*(search(p.retriever) for p in parts))
+        retrieval_timings.record({source: ms for source, (_, ms) in zip(sources, results)},
+                                 (time.perf_counter() - started) * 1000)
+        documents = merge_retrieved([documents for documents, _ in results])
+
+    if documents:
+        with stage("rerank"):
+            async with limits.acquire("cohere"):
+                documents = list(await parts[0].compressor.acompress_documents(documents, query))
+    return documents
+
+
+def pack_context(documents) -> Tuple[list, dict]:
+    """Reranked chunks -> the passages the answer is generated from (and shown as highlighted contexts)."""
+    with stage("pack"):
+        return context_packer.pack(documents)
+
+
+def source_versions(sources: List[str]) -> tuple:
+    """
+    What the indexed content of these sources is, for the answer cache key.
+    Read from the registry, so re-indexing or deleting a source in another
+    worker or in bulk_ingest.py also changes it.
+    """
+    documents = get_documents_by_filenames(sources)
+    return tuple(
+        (source, documents[source]["id"], documents[source]["status"], documents[source]["content_hash"],
+         documents[source]["updated_at"]) if source in documents else (source, None)
+        for source in sorted(sources)
+    )
+
+
+def answer_question(sources, question, chat_history, query=None) -> dict:
+    # Answers only depend on (sources, question) when there is no history
+    cacheable = not chat_history
+    if cacheable:
+        version = source_versions(sources)
+        cached = answer_cache.get(sources, question, version)
+        if cached is not None:
+            return cached
+
+    documents, packing = pack_context(retrieve_context(sources, question, chat_history, query))
+    with stage("answer"):
+        answer = chain_registry.get_rag_parts(sources[0]).qa_chain.invoke({
+            "input": question,
+            "chat_history": chat_history,
+            "context": documents
+        }, config=stage_config("answer"))
+
+    result = {
+        "answer": answer,
+        "highlighted_contexts": build_highlighted_contexts(documents),
+        "context_packing": packing,
+    }
+    if cacheable:
+        answer_cache.put(sources, question, result, version)
+    return result
+
+
+async def aanswer_question(sources, question, chat_history, limits: UpstreamLimits, query=None) -> dict:
+    cacheable = not chat_history
+    if cacheable:
+        version = await asyncio.to_thread(source_versions, sources)
+        cached = await asyncio.to_thread(answer_cache.get, sources, question, version)
+        if cached is not None:
+            return cached
+
+    documents, packing = pack_context(await aretrieve_context(sources, question, chat_history, limits, query))
+    parts = await asyncio.to_thread(chain_registry.get_rag_parts, sources[0])
+    with stage("answer"):
+        async with limits.acquire("openai"):
+            answer = await parts.qa_chain.ainvoke({
+                "input": question,
+                "chat_history": chat_history,
+                "context": documents
+            }, config=stage_config("answer"))
+
+    result = {
+        "answer": answer,
+        "highlighted_contexts": build_highlighted_contexts(documents),
+        "context_packing": packing,
+    }
+    if cacheable:
+        await asyncio.to_thread(answer_cache.put, sources, question, result, version)
+    return result
+
+
+def stream_answer(sources, question, chat_history, query=None) -> Iterator[Tuple[str, object]]:
+    """Yields ("contexts", highlighted_contexts) once, then ("token", text) pieces."""
+    cacheable = not chat_history
+    version = source_versions(sources) if cacheable else None
+    cached = answer_cache.get(sources, question, version) if cacheable else None
+    if cached is not None:
+        yield "contexts", cached["highlighted_contexts"]
+        yield "token", cached["answer"]
+        return
+
+    documents, _ = pack_context(retrieve_context(sources, question, chat_history, query))
+    highlighted_contexts = build_highlighted_contexts(documents)
+    yield "contexts", highlighted_contexts
+
+    answer_parts = []
+    # Includes the time the client takes to read each token
+    with stage("answer"):
+        for token in chain_registry.get_rag_parts(sources[0]).qa_chain.stream({
+            "input": question,
+            "chat_history": chat_history,
+            "context": documents
+        }, config=stage_config("answer")):
+            if token:
+                answer_parts.append(token)
+                yield "token", token
+
+    if cacheable:
+        answer_cache.put(sources, question, {
+            "answer": "".join(answer_parts),
+            "highlighted_contexts": highlighted_contexts,
+        }, version)
+
+
+def documents_changed(sources: List[str], added: bool = False, removed: bool = False):
+    """Drops everything derived from the document list or from these sources."""
+    if added or removed:
+        chain_registry.refresh_router()
+    fast_router.refresh()
+    for source in sources:
+        answer_cache.invalidate_source(source)
+        if removed:
+            chain_registry.invalidate_source(source)
+
+
+def file_fingerprint(path: str) -> Tuple[int, str]:
+    """(byte size, sha256 hex) of a file on disk."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return os.path.getsize(path), digest.hexdigest()
+
+
+def _spool_path(job_id: str, filename: str) -> str:
+    return os.path.join(DEFAULT_SPOOL_DIR, job_id, os.path.basename(filename))
+
+
+def _remove_spooled(file_path: str):
+    # Only uploads spooled by ingest_files are ours to delete
+    spool_dir = os.path.abspath(DEFAULT_SPOOL_DIR)
+    if os.path.commonpath([spool_dir, os.path.abspath(file_path)]) != spool_dir:
+        return
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    try:
+        os.rmdir(os.path.dirname(file_path))
+    except OSError:
+        pass
+
+
+def index_file(kind: str, file_id: int, filename: str, file_path: str, progress: Optional[Callable] = None,
+               resume: bool = False) -> dict:
+    """
+    Indexes (kind "index") or re-indexes (kind "update") a registered
+    document from file_path, then marks it indexed. With resume, chunks
+    already committed to the manifest by an interrupted run are skipped.
+    """
+    pipeline = get_default_pipeline()
+    byte_size, content_hash = file_fingerprint(file_path)
+
+    if kind == "update":
+        document = get_document_by_id(file_id)
+        namespace = document["namespace"] if document else None
+        # Documents indexed before the manifest existed have nothing to diff
+        # against, so their old vectors are removed and everything is re-added,
+        # into the document's own namespace.
+        if not get_manifest_vector_ids(file_id):
+            _, ok = delete_doc_from_pinecone(file_id)
+            if not ok:
+                raise RuntimeError(f"Could not remove the old vectors of file_id {file_id}")
+            namespace = new_namespace(file_id)
+            set_document_namespace(file_id, namespace)
+            # Its cached retriever still filters the default namespace
+            chain_registry.invalidate_source(filename)
+        stats = pipeline.update(file_path, file_id, progress=progress, namespace=namespace, content_hash=content_hash)
+        message = f"Added {stats['added']}, moved {stats['moved']} and removed {stats['removed']} chunks"
+    else:
+        document = get_document_by_id(file_id)
+        # A resumed job keeps writing to the namespace its first attempt chose
+        namespace = document["namespace"] if resume and document and document["namespace"] else new_namespace(file_id)
+        if not resume:
+            # Keyword rows of an earlier document that had this id (before a registry reset)
+            get_bm25_index().delete_file(file_id)
+        update_document_status(file_id, STATUS_INDEXING, namespace=namespace)
+        stats = pipeline.run(file_path, file_id, progress=progress, resume=resume, namespace=namespace,
+                             content_hash=content_hash)
+        message = "Indexed successfully"
+
+    update_document_status(file_id, STATUS_INDEXED, chunk_count=stats["chunks"],
+                           byte_size=byte_size, content_hash=content_hash)
+    documents_changed([filename], added=kind == "index")
+    return {"message": message, "stats": stats}
+
+
+def run_ingest_job(job: dict, progress: Callable) -> dict:
+    """
+    Job handler for a spooled upload. A job claimed again after a crash
+    resumes from the manifest entries its earlier attempt committed.
+    """
+    result = index_file(job["kind"], job["file_id"], job["filename"], job["file_path"], progress,
+                        resume=job["attempts"] > 1)
+    _remove_spooled(job["file_path"])
+    return result
+
+
+def fail_ingest_job(job: dict):
+    """Removes what a failed new-document job left behind: vectors, keyword rows and the registry row."""
+    if job["kind"] == "index" and job["file_id"] is not None:
+        delete_doc_from_pinecone(job["file_id"])
+        get_bm25_index().delete_file(job["file_id"])
+        delete_document_records([job["file_id"]])
+    _remove_spooled(job["file_path"])
+
+
+job_queue = JobQueue(
+    run_ingest_job,
+    on_failure=fail_ingest_job,
+    workers=int(os.getenv("INGEST_JOB_WORKERS", "2")),
+    poll_seconds=float(os.getenv("INGEST_JOB_POLL_SECONDS", "1")),
+    lease_seconds=float(os.getenv("INGEST_JOB_LEASE_SECONDS", "600")),
+    max_attempts=int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3")),
+)
+
+
+def start_ingest_workers():
+    """Starts the job workers; queued and interrupted jobs are picked up straight away. Cheap once started."""
+    if job_queue.running:
+        return
+    os.makedirs(DEFAULT_SPOOL_DIR, exist_ok=True)
+    job_queue.start()
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job = job_queue.get(job_id)
+    if job is None:
+        return None
+    return {key: job[key] for key in (
+        "id", "kind", "filename", "file_id", "status", "pages_parsed", "chunks_total", "chunks_embedded",
+        "vectors_upserted", "attempts", "error", "result", "created_at", "updated_at",
+    )}
+
+
+def _busy_result(filename: str, file_id: int, job_id: str) -> dict:
+    return {
+        "filename": filename,
+        "status": "busy",
+        "file_id": file_id,
+        "job_id": job_id,
+        "message": "An indexing job for this file is already queued or running; upload again once it has finished"
+    }
+
+
+def ingest_files(uploads: List[Tuple[str, Callable[[str], None]]], update_mode: bool = False) -> List[dict]:
+    """
+    Queues uploaded files for indexing; uploads are (filename, save_to) where
+    save_to(path) writes the file to disk. Files are spooled, new ones are
+    registered as pending in one transaction, and one job per file is
+    enqueued, so this returns as soon as the files are on disk.
+    """
+    results: Dict[int, dict] = {}
+    existing = get_documents_by_filenames([filename for filename, _ in uploads])
+    new_uploads = []  # (position, filename, job_id, byte_size, content_hash)
+    seen = set()
+
+    for position, (filename, save_to) in enumerate(uploads):
+        file_extension = os.path.splitext(filename)[1].lower()
+        if file_extension not in ALLOWED_EXTENSIONS:
+            results[position] = {
+                "filename": filename,
+                "status": "error",
+                "message": f"Unsupported file type: {file_extension}"
+            }
+            continue
+
+        existing_document = existing.get(filename)
+        if (existing_document and not update_mode) or filename in seen:
+            results[position] = {
+                "filename": filename,
+                "status": "exists",
+                "file_id": existing_document['id'] if existing_document else None,
+                "message": "File already uploaded"
+            }
+            continue
+
+        job_id = uuid.uuid4().hex
+        file_path = _spool_path(job_id, filename)
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            save_to(file_path)
+        except Exception as e:
+            results[position] = {
+                "filename": filename,
+                "status": "error",
+                "message": str(e)
+            }
+            continue
+        seen.add(filename)
+
+        if existing_document:
+            queued_job_id = job_queue.enqueue("update", filename, file_path, existing_document['id'], job_id=job_id)
+            if queued_job_id != job_id:
+                _remove_spooled(file_path)
+                results[position] = _busy_result(filename, existing_document['id'], queued_job_id)
+                continue
+            results[position] = {
+                "filename": filename,
+                "status": "queued",
+                "file_id": existing_document['id'],
+                "job_id": job_id,
+                "message": "Queued for re-indexing"
+            }
+        else:
+            new_uploads.append((position, filename, job_id, *file_fingerprint(file_path)))
+
+    file_ids = insert_document_records([(filename, size, digest) for _, filename, _, size, digest in new_uploads])
+    for (position, filename, job_id, _, _), file_id in zip(new_uploads, file_ids):
+        if file_id is None:
+            # Registered by a concurrent upload between the lookup and the insert
+            _remove_spooled(_spool_path(job_id, filename))
+            results[position] = {"filename": filename, "status": "exists", "message": "File already uploaded"}
+            continue
+        queued_job_id = job_queue.enqueue("index", filename, _spool_path(job_id, filename), file_id, job_id=job_id)
+        if queued_job_id != job_id:
+            _remove_spooled(_spool_path(job_id, filename))
+            results[position] = _busy_result(filename, file_id, queued_job_id)
+            continue
+        results[position] = {
+            "filename": filename,
+            "status": "queued",
+            "file_id": file_id,
+            "job_id": job_id,
+            "message": "Queued for indexing"
+        }
+
+    return [results[position] for position in range(len(uploads))]
+
+
+def get_page_text(file_id: int, page: int) -> Optional[dict]:
+    """Text of one page of an indexed document, from the page cache (for citation previews)."""
+    document = get_document_by_id(file_id)
+    if not document or not document.get("content_hash"):
+        return None
+    cached = get_page_cache().get_page(document["content_hash"], page)
+    if cached is None:
+        return None
+    return {"file_id": file_id, "filename": document["filename"], **cached}
+
+
+def finish_upload(results: List[dict]) -> dict:
+    # The document list changes once each job finishes (see run_ingest_job)
+    return {
+        "summary": {
+            "total_files": len(results),
+            "queued": sum(1 for r in results if r["status"] == "queued"),
+            "errors": sum(1 for r in results if r["status"] == "error"),
+            "duplicates": sum(1 for r in results if r["status"] == "exists"),
+            "busy": sum(1 for r in results if r["status"] == "busy"),
+        },
+        "jobs": [r["job_id"] for r in results if r["status"] == "queued"],
+        "results": results
+    }
+
+
+def delete_document(file_id: int) -> Tuple[str, int]:
+    """Returns (message, HTTP status)."""
+    document = get_document_by_id(file_id)
+    if document is None:
+        return f"No document with file_id {file_id}", 404
+    # A queued or running job would write the vectors back after they are removed
+    if file_id in job_queue.active_file_ids():
+        return f"{document['filename']} is being indexed; delete it once the job finishes", 409
+    deleted, ok = delete_doc_from_pinecone(file_id)
+    if not ok:
+        return f"Error deleting vectors for file_id {file_id}", 500
+
+    delete_document_record(file_id)
+    get_bm25_index().delete_file(file_id)
+    documents_changed([document['filename']], removed=True)
+    return f"Deleted {document['filename']} ({deleted} vectors) with file_id {file_id}", 200
+
+
+def collect_stats() -> dict:
+    return {
+        "chains": chain_registry.get_stats(),
+        "embedding_cache": embedding_function.stats(),
+        "router": fast_router.stats(),
+        "answer_cache": answer_cache.stats(),
+        "sessions": session_memory.stats(),
+        "routing": {"mode": ROUTING_MODE, "llm_calls": dict(llm_calls)},
+        "retrieval": retrieval_timings.stats(),
+        "context_packing": context_packer.stats(),
+        "ingest_jobs": job_queue.stats(),
+        "page_cache": get_page_cache().stats(),
+        # Registry vs manifest only; `python document_util.py audit` also checks the vector index
+        "manifest": audit_manifest(),
+    }
+
+
+def check_readiness() -> Tuple[dict, bool]:
+    """
+    Builds (or reuses) every lazily created dependency and reports how long
+    each took, so /ready both warms a fresh worker and says what is broken.
+    """
+    checks = {
+        "documents_db": lambda: {"documents": len(get_all_documents())},
+        "embedding_cache": lambda: {"entries": embedding_function.stats()["entries"]},
+        "keyword_index": lambda: {"indexed_files": len(get_bm25_index().indexed_file_ids())},
+        "vector_index": lambda: {"backend": type(get_index()).__name__},
+        "router_chain": lambda: {"built": chain_registry.get_router_chain() is not None},
+    }
+    report = {}
+    ready = True
+    for name, check in checks.items():
+        started = time.perf_counter()
+        try:
+            report[name] = {"status": "ok", **check()}
+        except Exception as e:
+            logging.error(f"Readiness check {name} failed: {str(e)}")
+            report[name] = {"status": "error", "error": str(e)}
+            ready = False
+        report[name]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report, ready
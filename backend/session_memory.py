@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+DEFAULT_SPILL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db")
+
+_encoding = None
+
+def count_tokens(text: str) -> int:
+    """gpt-4o tokenizer when tiktoken is installed (it comes with langchain_openai), else ~4 chars per token."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except ImportError:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    words = text.split()
+    if count_tokens(text) <= max_tokens:
+        return text
+    while len(words) > 1 and count_tokens(" ".join(words)) > max_tokens:
+        words = words[:len(words) * 3 // 4]
+    return " ".join(words) + " ..."
+
+
+class SessionMemory:
+    """
+    Server-side chat history keyed by session_id.
+
+    The last `recent_messages` messages are kept verbatim. Older exchanges are
+    compacted into one summary line each (the question plus the start of the
+    answer), and the oldest lines are dropped once the summary exceeds
+    `summary_token_budget`, so the history put into prompts stays bounded no
+    matter how long the conversation runs. Sessions live in an in-memory LRU;
+    with a spill path, evicted sessions are written to SQLite and loaded back
+    on their next turn.
+    """
+
+    def __init__(self, max_sessions: int = 1000, recent_messages: int = 6, summary_token_budget: int = 400,
+                 answer_tokens_per_line: int = 60, spill_path: Optional[str] = None,
+                 max_age_seconds: float = 7 * 24 * 3600):
+        self.max_sessions = max_sessions
+        self.recent_messages = recent_messages
+        self.summary_token_budget = summary_token_budget
+        self.answer_tokens_per_line = answer_tokens_per_line
+        self.spill_path = spill_path
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()
+        self._stats = {"turns": 0, "compactions": 0, "spilled": 0, "restored": 0}
+        if spill_path:
+            conn = sqlite3.connect(spill_path)
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            conn.close()
+
+    def _spill(self, evicted: Dict[str, dict]):
+        conn = sqlite3.connect(self.spill_path, timeout=30)  # type: ignore
+        conn.executemany(
+            "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+            [(sid, json.dumps(state, ensure_ascii=False), state["updated_at"]) for sid, state in evicted.items()]
+        )
+        conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.max_age_seconds,))
+        conn.commit()
+        conn.close()
+
+    def _restore(self, session_id: str) -> Optional[dict]:
+        conn = sqlite3.connect(self.spill_path, timeout=30)  # type: ignore
+        row = conn.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.commit()
+        conn.close()
+        return json.loads(row[0]) if row else None
+
+    def _state(self, session_id: str, create: bool) -> Optional[dict]:
+        """Caller holds the lock."""
+        state = self._sessions.get(session_id)
+        if state is None and self.spill_path:
+            state = self._restore(session_id)
+            if state is not None:
+                self._stats["restored"] += 1
+        if state is None and create:
+            state = {"summary": [], "recent": [], "updated_at": time.time()}
+        if state is not None:
+            self._sessions[session_id] = state
+            self._sessions.move_to_end(session_id)
+            evicted = {}
+            while len(self._sessions) > self.max_sessions:
+                sid, old = self._sessions.popitem(last=False)
+                evicted[sid] = old
+            if evicted and self.spill_path:
+                self._spill(evicted)
+                self._stats["spilled"] += len(evicted)
+        return state
+
+    def get_history(self, session_id: str) -> List[dict]:
+        """Chat history in the {"role", "content"} shape QueryInput.history used."""
+        with self._lock:
+            state = self._state(session_id, create=False)
+            if state is None:
+                return []
+            history = []
+            if state["summary"]:
+                history.append({
+                    "role": "system",
+                    "content": "Earlier in this conversation:\n" + "\n".join(state["summary"]),
+                })
+            history.extend(dict(message) for message in state["recent"])
+            return history
+
+    def append(self, session_id: str, question: str, answer: str):
+        with self._lock:
+            state = self._state(session_id, create=True)
+            state["recent"].append({"role": "user", "content": question})  # type: ignore
+            state["recent"].append({"role": "assistant", "content": answer})  # type: ignore
+            state["updated_at"] = time.time()  # type: ignore
+            self._stats["turns"] += 1
+            self._compact(state)
+
+    def _compact(self, state: dict):
+        recent = state["recent"]
+        if len(recent) <= self.recent_messages:
+            return
+        overflow = recent[:len(recent) - self.recent_messages]
+        state["recent"] = recent[len(recent) - self.recent_messages:]
+        for i in range(0, len(overflow), 2):
+            question = overflow[i]["content"]
+            answer = overflow[i + 1]["content"] if i + 1 < len(overflow) else ""
+            state["summary"].append(
+                f"User asked: {_truncate(question, self.answer_tokens_per_line)} | "
+                f"Answer: {_truncate(answer, self.answer_tokens_per_line)}"
+            )
+        while len(state["summary"]) > 1 and count_tokens("\n".join(state["summary"])) > self.summary_token_budget:
+            state["summary"].pop(0)
+        self._stats["compactions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["sessions_in_memory"] = len(self._sessions)
+            return stats
+
+
+def history_tokens(history: List[dict]) -> int:
+    return sum(count_tokens(message["content"]) for message in history)
@@ -0,0 +1,186 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Adds a Server-Timing header (per-stage ms, plus LLM tokens) to every response
+TIMING_HEADERS = os.getenv("TIMING_HEADERS", "0") == "1"
+
+# Seconds; covers a cache hit up to a slow answer generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            running += count
+            yield ("+Inf" if bound == float("inf") else repr(bound)), running
+
+
+class StageMetrics:
+    """
+    Process-wide latency histograms and token counters per stage, rendered in
+    the Prometheus text format by /metrics. Each gunicorn worker keeps its own
+    numbers, so Prometheus should scrape every worker (or run one per pod).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stage_seconds: Dict[str, Histogram] = {}
+        self._llm_seconds: Dict[str, Histogram] = {}
+        self._tokens: Dict[Tuple[str, str], int] = {}
+        self._llm_calls: Dict[str, int] = {}
+
+    def observe_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self._stage_seconds.setdefault(stage, Histogram()).observe(seconds)
+
+    def observe_llm(self, stage: str, seconds: float, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            self._llm_seconds.setdefault(stage, Histogram()).observe(seconds)
+            self._llm_calls[stage] = self._llm_calls.get(stage, 0) + 1
+            for kind, tokens in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+                self._tokens[(stage, kind)] = self._tokens.get((stage, kind), 0) + tokens
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, help_text, histograms in (
+                ("rag_stage_seconds", "Wall time of each /chat pipeline stage.", self._stage_seconds),
+                ("rag_llm_seconds", "Time spent inside LLM calls, by stage.", self._llm_seconds),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for stage, histogram in sorted(histograms.items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            lines += ["# HELP rag_llm_calls_total LLM calls, by stage.", "# TYPE rag_llm_calls_total counter"]
+            for stage, calls in sorted(self._llm_calls.items()):
+                lines.append(f'rag_llm_calls_total{{stage="{stage}"}} {calls}')
+            lines += ["# HELP rag_llm_tokens_total LLM tokens, by stage and kind.", "# TYPE rag_llm_tokens_total counter"]
+            for (stage, kind), tokens in sorted(self._tokens.items()):
+                lines.append(f'rag_llm_tokens_total{{stage="{stage}",kind="{kind}"}} {tokens}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = StageMetrics()
+
+
+class RequestTrace:
+    """Stage timings and token counts of one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.tokens: Dict[str, int] = {}
+
+    def add_stage(self, stage: str, ms: float):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    def add_tokens(self, stage: str, tokens: int):
+        with self._lock:
+            self.tokens[stage] = self.tokens.get(stage, 0) + tokens
+
+    def server_timing(self) -> str:
+        with self._lock:
+            return ", ".join(
+                f'{stage};dur={ms:.1f}' + (f';desc="{self.tokens[stage]} tokens"' if stage in self.tokens else "")
+                for stage, ms in self.stages.items()
+            )
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def start_trace() -> RequestTrace:
+    """Starts collecting for the current request (and threads/tasks it spawns with a copied context)."""
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe_stage(name, elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, elapsed * 1000)
+
+
+def _token_usage(response) -> Tuple[int, int]:
+    """(prompt, completion) tokens from an LLMResult, from llm_output or per-message usage_metadata."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+    prompt = completion = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata:
+                prompt += usage_metadata.get("input_tokens", 0)
+                completion += usage_metadata.get("output_tokens", 0)
+    return prompt, completion
+
+
+class StageCallbackHandler(BaseCallbackHandler):
+    """Attributes LLM latency and token usage to a pipeline stage."""
+
+    # Cheap enough to run inline instead of being handed to an executor in async chains
+    run_inline = True
+
+    def __init__(self, stage_name: str, trace: Optional[RequestTrace] = None):
+        self.stage_name = stage_name
+        self.trace = trace
+        self._started: Dict[object, float] = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        prompt_tokens, completion_tokens = _token_usage(response)
+        metrics.observe_llm(self.stage_name, seconds, prompt_tokens, completion_tokens)
+        if self.trace is not None:
+            self.trace.add_tokens(self.stage_name, prompt_tokens + completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+def stage_config(name: str) -> dict:
+    """RunnableConfig for a chain call made inside stage(name)."""
+    return {"callbacks": [StageCallbackHandler(name, current_trace())], "run_name": name}
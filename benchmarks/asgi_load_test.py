@@ -0,0 +1,152 @@
+"""
+Load test for backend/asgi_app.py against stubbed upstreams.
+
+Router, contextualization, retrieval, rerank and generation are replaced by
+fakes that only sleep for a fixed latency, so the numbers reflect how many
+concurrent sessions each serving mode can keep in flight, not API speed.
+
+    python benchmarks/asgi_load_test.py --sessions 200 --turns 5
+    python benchmarks/asgi_load_test.py --compare-sync 8   # also run Flask with 8 sync workers
+    python benchmarks/asgi_load_test.py --sources 3        # router picks 3 documents per question
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import httpx
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+import services
+from langchain_util import chain_registry, RagParts, RouteDecision
+
+SOURCE = "Banking Control Law.pdf"
+
+
+def stub(latency, result):
+    def call(_):
+        time.sleep(latency)
+        return result
+
+    async def acall(_):
+        await asyncio.sleep(latency)
+        return result
+
+    return RunnableLambda(call, afunc=acall)
+
+
+class StubCompressor:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def compress_documents(self, documents, query, callbacks=None):
+        time.sleep(self.latency)
+        return documents[:3]
+
+    async def acompress_documents(self, documents, query, callbacks=None):
+        await asyncio.sleep(self.latency)
+        return documents[:3]
+
+
+def install_stubs(args):
+    sources = [SOURCE] + [f"Related Regulation {i}.pdf" for i in range(1, args.sources)]
+    parts_by_source = {
+        source: RagParts(
+            retriever=stub(args.retrieval_ms / 1000, [
+                Document(page_content=f"{source} article {i} text", metadata={"source": source, "page": i, "file_id": 1})
+                for i in range(10)
+            ]),
+            compressor=StubCompressor(args.rerank_ms / 1000),
+            contextualize_chain=stub(args.llm_ms / 1000, "reformulated question"),
+            qa_chain=stub(args.llm_ms / 1000, "stub answer"),
+        )
+        for source in sources
+    }
+    router = stub(args.llm_ms / 1000, {"text": "False\n" + "\n".join(sources)})
+    route_rewrite = stub(args.llm_ms / 1000, RouteDecision(needs_documents=True, sources=sources))
+    chain_registry.get_router_chain = lambda: router
+    chain_registry.get_route_rewrite_chain = lambda: route_rewrite
+    chain_registry.get_rag_parts = lambda source: parts_by_source[source]
+    # Every request should reach the stubbed upstreams
+    services.fast_router.enabled = False
+    services.answer_cache.max_entries = 0
+
+
+def summarize(mode, latencies, elapsed):
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 1),
+        "p95_ms": round(quantiles[94] * 1000, 1),
+        "p99_ms": round(quantiles[98] * 1000, 1),
+    }
+
+
+async def run_async(args):
+    from asgi_app import app
+
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        async def session(n):
+            for turn in range(args.turns):
+                payload = {"session_id": f"s{n}", "question": f"question {n}-{turn}", "history": []}
+                started = time.perf_counter()
+                response = await client.post("/chat", json=payload)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(session(n) for n in range(args.sessions)))
+        return summarize("asgi", latencies, time.perf_counter() - started)
+
+
+def run_sync(args, workers):
+    from main import app
+
+    client = app.test_client()
+    latencies = []
+
+    def session(n):
+        for turn in range(args.turns):
+            payload = {"session_id": f"s{n}", "question": f"question {n}-{turn}", "history": []}
+            started = time.perf_counter()
+            response = client.post("/chat", json=payload)
+            assert response.status_code == 200, response.data
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    # Sessions queue for a worker the way they would behind gunicorn sync workers
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(session, range(args.sessions)))
+    return summarize(f"flask-sync-{workers}", latencies, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--llm-ms", type=float, default=400)
+    parser.add_argument("--retrieval-ms", type=float, default=80)
+    parser.add_argument("--rerank-ms", type=float, default=120)
+    parser.add_argument("--compare-sync", type=int, default=0, help="sync worker count to compare against")
+    parser.add_argument("--sources", type=int, default=1, help="documents the stub router picks per question")
+    args = parser.parse_args()
+
+    install_stubs(args)
+    results = [asyncio.run(run_async(args))]
+    if args.compare_sync:
+        results.append(run_sync(args, args.compare_sync))
+    results.append({"retrieval": services.retrieval_timings.stats()})
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,91 @@
+"""
+Cold import time of the backend entry points, for tracking worker start-up.
+
+Each module is imported in a fresh interpreter (from backend/, as gunicorn
+and uvicorn do) several times and the median wall time is reported, with the
+slowest dependencies according to `python -X importtime`. Importing must not
+reach OpenAI/Pinecone, so this runs fine without API keys; --max-ms turns it
+into a regression check that exits non-zero when a module gets slower.
+
+    python benchmarks/import_time_bench.py
+    python benchmarks/import_time_bench.py --modules main asgi_app --repeat 5 --max-ms 1500
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+DEFAULT_MODULES = ["document_util", "pinecone_util", "langchain_util", "ingest_pipeline", "services", "main", "asgi_app"]
+
+TIMED_IMPORT = "import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+
+
+def import_ms(module: str) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", TIMED_IMPORT.format(module=module)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def top_level_imports(code: str):
+    """(name, cumulative ms) of top-level imports, from -X importtime's stderr table."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level
+        if len(name) - len(name.lstrip()) == 1:
+            rows.append((name.strip(), int(cumulative) / 1000))
+    return rows
+
+
+def slowest_imports(module: str, top: int, startup: set):
+    rows = [row for row in top_level_imports(f"import {module}") if row[0] not in startup]
+    rows.sort(key=lambda row: row[1], reverse=True)
+    return [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in rows[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if any module's median exceeds this")
+    args = parser.parse_args()
+
+    # Imported by every interpreter before our code runs
+    startup = {name for name, _ in top_level_imports("pass")}
+    results = {}
+    failed = []
+    for module in args.modules:
+        try:
+            timings = [import_ms(module) for _ in range(args.repeat)]
+        except subprocess.CalledProcessError as e:
+            results[module] = {"error": e.stderr.strip().splitlines()[-1] if e.stderr else str(e)}
+            failed.append(module)
+            continue
+        median = statistics.median(timings)
+        results[module] = {
+            "median_ms": round(median, 1),
+            "min_ms": round(min(timings), 1),
+            "slowest_imports": slowest_imports(module, args.top, startup),
+        }
+        if args.max_ms is not None and median > args.max_ms:
+            failed.append(module)
+
+    print(json.dumps(results, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
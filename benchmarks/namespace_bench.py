@@ -0,0 +1,154 @@
+"""
+Filtered query and delete latency as the corpus grows: one shared namespace
+with a source filter vs one namespace per document.
+
+The corpus is grown to each --docs size with random unit vectors. At every
+size, top-k queries for one document are timed both ways, and documents are
+deleted (and re-added) both ways: by vector ids in the shared namespace, or
+by dropping the document's namespace.
+
+Runs against a LocalVectorStore in a temporary directory. --pinecone runs
+the same against the live index instead, in namespaces prefixed "bench-",
+all of which are deleted at the end (needs PINECONE_API_KEY).
+
+    python benchmarks/namespace_bench.py
+    python benchmarks/namespace_bench.py --docs 10 100 500 --chunks-per-doc 200 --dimension 768
+    python benchmarks/namespace_bench.py --pinecone --docs 5 20 --chunks-per-doc 100
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from local_vector_store import LocalVectorStore
+
+
+def summarize(latencies):
+    if len(latencies) < 2:
+        return {"p50_ms": round(latencies[0], 3) if latencies else None}
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {"p50_ms": round(quantiles[49], 3), "p95_ms": round(quantiles[94], 3),
+            "mean_ms": round(statistics.mean(latencies), 3)}
+
+
+def timed(fn, calls):
+    latencies = []
+    for args in calls:
+        started = time.perf_counter()
+        fn(*args)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+class Corpus:
+    """The same documents written in both layouts."""
+
+    def __init__(self, index, shared_namespace, prefix, chunks_per_doc, dimension, rng):
+        self.index = index
+        self.shared_namespace = shared_namespace
+        self.prefix = prefix
+        self.chunks_per_doc = chunks_per_doc
+        self.dimension = dimension
+        self.rng = rng
+        self.docs = 0
+
+    def source(self, doc):
+        return f"doc-{doc}.pdf"
+
+    def namespace(self, doc):
+        return f"{self.prefix}file-{doc}"
+
+    def ids(self, doc):
+        return [f"{doc}:{i}" for i in range(self.chunks_per_doc)]
+
+    def add(self, doc):
+        vectors = self.rng.normal(size=(self.chunks_per_doc, self.dimension)).astype(np.float32)
+        records = [{"id": vector_id, "values": vectors[i].tolist(), "metadata": {"source": self.source(doc), "text": ""}}
+                   for i, vector_id in enumerate(self.ids(doc))]
+        for start in range(0, len(records), 100):
+            batch = records[start:start + 100]
+            self.index.upsert(vectors=batch, namespace=self.shared_namespace)
+            self.index.upsert(vectors=batch, namespace=self.namespace(doc))
+
+    def grow_to(self, docs):
+        while self.docs < docs:
+            self.add(self.docs)
+            self.docs += 1
+
+    def query_shared(self, vector, doc, k):
+        return self.index.query(vector=vector, top_k=k, filter={"source": {"$in": [self.source(doc)]}},
+                                include_metadata=True, namespace=self.shared_namespace)
+
+    def query_namespace(self, vector, doc, k):
+        return self.index.query(vector=vector, top_k=k, include_metadata=True, namespace=self.namespace(doc))
+
+    def delete_shared(self, doc):
+        self.index.delete(ids=self.ids(doc), namespace=self.shared_namespace)
+
+    def delete_namespace(self, doc):
+        self.index.delete(delete_all=True, namespace=self.namespace(doc))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--chunks-per-doc", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--deletes", type=int, default=5, help="documents deleted (and re-added) per size")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--pinecone", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as path:
+        if args.pinecone:
+            from pinecone_util import get_index
+            index, shared_namespace, prefix = get_index(), "bench-shared", "bench-"
+        else:
+            index = LocalVectorStore(path, DeterministicFakeEmbedding(size=args.dimension), args.dimension)
+            shared_namespace, prefix = None, ""
+        corpus = Corpus(index, shared_namespace, prefix, args.chunks_per_doc, args.dimension, rng)
+
+        results = []
+        try:
+            for docs in sorted(args.docs):
+                corpus.grow_to(docs)
+                if args.pinecone:
+                    time.sleep(5)  # let upserts become visible to queries
+                queries = rng.normal(size=(args.queries, args.dimension)).astype(np.float32)
+                targets = rng.integers(0, docs, size=args.queries)
+                calls = [(q.tolist(), int(doc), args.k) for q, doc in zip(queries, targets)]
+                corpus.query_shared(*calls[0])  # warm up
+                corpus.query_namespace(*calls[0])
+                row = {
+                    "docs": docs,
+                    "vectors_per_layout": docs * args.chunks_per_doc,
+                    "query_shared_filter": timed(corpus.query_shared, calls),
+                    "query_namespace": timed(corpus.query_namespace, calls),
+                }
+                victims = [(int(doc),) for doc in rng.choice(docs, size=min(args.deletes, docs), replace=False)]
+                row["delete_by_ids"] = timed(corpus.delete_shared, victims)
+                row["delete_namespace"] = timed(corpus.delete_namespace, victims)
+                for (doc,) in victims:
+                    corpus.add(doc)
+                results.append(row)
+        finally:
+            if args.pinecone:
+                for doc in range(corpus.docs):
+                    corpus.delete_namespace(doc)
+                index.delete(delete_all=True, namespace=shared_namespace)
+
+    print(json.dumps({"config": vars(args), "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
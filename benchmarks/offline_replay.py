@@ -0,0 +1,453 @@
+"""
+Offline replay of uploads and chat traffic through the real app, with the
+paid upstreams replaced by deterministic local stand-ins:
+
+- ChatOpenAI -> StubChatModel: answers the router, route+rewrite,
+  contextualize and answer prompts from their own text, after --llm-ms, and
+  reports token usage (about 4 characters per token)
+- OpenAIEmbeddings -> DeterministicFakeEmbedding behind the embedding cache,
+  after --embed-ms per call
+- CohereRerank -> StubReranker: keeps the top_n by word overlap, after --rerank-ms
+- Pinecone -> LocalVectorStore with --index-ms added to every call
+
+Everything else (routing, fast router, answer cache, hybrid retrieval, the
+ingest job queue and pipeline, session memory) is the production code, so
+changes to it can be compared run to run without API keys or spend. All
+databases, the index and the upload spool live in a temporary directory.
+
+Synthetic PDFs are uploaded to /upload-doc first and indexed by the job
+workers; then a query log is replayed against /chat. The log is JSONL with a
+"question" (or "query", or "title") per line and an optional "session_id";
+turns of one session run in order. Without --queries, synthetic questions
+are used. Per-stage numbers come from the Server-Timing header of each
+response and the stage timings each ingest job reports.
+
+    python benchmarks/offline_replay.py
+    python benchmarks/offline_replay.py --queries chat_log.jsonl --repeat 3 --concurrency 16
+    python benchmarks/offline_replay.py --app flask --uploads 4 --files-per-upload 5 --pages 40
+    python benchmarks/offline_replay.py --llm-ms 0 --embed-ms 0 --rerank-ms 0 --index-ms 0  # app overhead only
+"""
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from langchain_core.documents import Document
+from langchain_core.documents.compressor import BaseDocumentCompressor
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from pdf_stream_bench import WORDS, write_pdf
+
+SERVER_TIMING = re.compile(r'([\w-]+);dur=([\d.]+)(?:;desc="(\d+) tokens")?')
+FILENAME_LINE = re.compile(r'^\s*"(.+)",?\s*$', re.M)
+
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def pick_source(prompt: str, question: str) -> List[str]:
+    """The listed filename sharing most words with the question; ties broken by a hash of the question."""
+    filenames = FILENAME_LINE.findall(prompt)
+    if not filenames:
+        return []
+    offset = int(hashlib.sha256(question.encode("utf-8")).hexdigest(), 16) % len(filenames)
+    rotated = filenames[offset:] + filenames[:offset]
+    question_words = _words(question)
+    return [max(rotated, key=lambda filename: len(question_words & _words(filename)))]
+
+
+def stub_reply(messages, answer_words: int) -> str:
+    """What each prompt of langchain_util expects back, derived only from the prompt."""
+    system = [str(m.content) for m in messages if m.type == "system"]
+    question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+    has_history = sum(1 for m in messages if m.type in ("human", "ai")) > 1
+    instructions = system[0] if system else ""
+
+    if "needs_documents" in instructions:
+        sources = pick_source(instructions, question)
+        return json.dumps({
+            "needs_documents": bool(sources),
+            "sources": sources,
+            "standalone_query": question if has_history else None,
+            "reply": None if sources else "Hello! Ask me about the indexed regulations.",
+        })
+    if "a classifier" in instructions:
+        sources = pick_source(instructions, question)
+        return "False\n" + sources[0] if sources else "Hello! Ask me about the indexed regulations."
+    if "reformulate" in instructions:
+        return question
+    context = next((s[len("Context: "):] for s in system[1:] if s.startswith("Context: ")), "")
+    return "Based on the provided context: " + " ".join(context.split()[:answer_words])
+
+
+class StubChatModel(BaseChatModel):
+    """Stands in for ChatOpenAI: fixed latency, deterministic replies, token usage on every message."""
+
+    latency: float = 0.4
+    answer_words: int = 80
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _result(self, messages) -> ChatResult:
+        text = stub_reply(messages, self.answer_words)
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4
+        completion_tokens = len(text) // 4
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return self._result(messages)
+
+    def with_structured_output(self, schema, **kwargs):
+        # The model itself answers in JSON, so the LLM call (and its tokens) stays visible to callbacks
+        return self | RunnableLambda(lambda message: schema.model_validate_json(message.content))
+
+
+class StubEmbeddings(Embeddings):
+    """Stands in for OpenAIEmbeddings: hash-seeded vectors after a fixed latency per call."""
+
+    def __init__(self, size: int, latency: float):
+        self.fake = DeterministicFakeEmbedding(size=size)
+        self.latency = latency
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self.fake.embed_query(text)
+
+
+class StubReranker(BaseDocumentCompressor):
+    """Stands in for CohereRerank: word overlap with the query, after a fixed latency."""
+
+    top_n: int = 3
+    latency: float = 0.12
+
+    def _rank(self, documents: Sequence[Document], query: str) -> List[Document]:
+        query_words = _words(query)
+        scored = [(len(query_words & _words(doc.page_content)) / (len(query_words) or 1), doc) for doc in documents]
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [Document(page_content=doc.page_content, metadata={**doc.metadata, "relevance_score": score})
+                for score, doc in scored[:self.top_n]]
+
+    def compress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> List[Document]:
+        time.sleep(self.latency)
+        return self._rank(documents, query)
+
+    async def acompress_documents(self, documents: Sequence[Document], query: str, callbacks=None) -> List[Document]:
+        await asyncio.sleep(self.latency)
+        return self._rank(documents, query)
+
+
+def slow_vector_store_class():
+    from local_vector_store import LocalVectorStore
+
+    class SlowVectorStore(LocalVectorStore):
+        """Stands in for the Pinecone index: the local store plus a round trip per call."""
+
+        latency = 0.0
+
+        def upsert(self, vectors, namespace=None, **kwargs):
+            time.sleep(self.latency)
+            return super().upsert(vectors, namespace=namespace, **kwargs)
+
+        def delete(self, ids=None, namespace=None, **kwargs):
+            time.sleep(self.latency)
+            return super().delete(ids=ids, namespace=namespace, **kwargs)
+
+        def fetch(self, ids, namespace=None, **kwargs):
+            time.sleep(self.latency)
+            return super().fetch(ids, namespace=namespace, **kwargs)
+
+        def _search(self, vector, k, filter, namespace=None):
+            time.sleep(self.latency)
+            return super()._search(vector, k, filter, namespace=namespace)
+
+    return SlowVectorStore
+
+
+def install_stubs(args, workdir: str):
+    """Must run before services (or either app) is imported: they pick up env and clients at import."""
+    os.environ.update({
+        "VECTOR_BACKEND": "local",
+        "TIMING_HEADERS": "1",
+        "DOCUMENTS_DB_PATH": os.path.join(workdir, "documents.db"),
+        "INGEST_JOBS_DB_PATH": os.path.join(workdir, "jobs.db"),
+        "INGEST_SPOOL_DIR": os.path.join(workdir, "uploads"),
+        "INGEST_JOB_POLL_SECONDS": "0.1",
+        "PAGE_CACHE_PATH": os.path.join(workdir, "page_cache.db"),
+    })
+    if args.no_fast_router:
+        os.environ["FAST_ROUTER_ENABLED"] = "0"
+    if args.no_page_cache:
+        os.environ["PAGE_CACHE_ENABLED"] = "0"
+
+    import bm25_index
+    import pinecone_util
+    import langchain_util
+    from embedding_cache import CachedEmbeddings
+    from rerankers import TimedReranker
+
+    embedding = CachedEmbeddings(StubEmbeddings(args.dimension, args.embed_ms / 1000), model="stub-embedding",
+                                 db_path=os.path.join(workdir, "embedding_cache.db"))
+    store = slow_vector_store_class()(os.path.join(workdir, "index"), embedding, args.dimension)
+    store.latency = args.index_ms / 1000
+    pinecone_util._clients["embedding_function"] = embedding
+    pinecone_util._clients["vectorstore"] = store
+    bm25_index._default_index = bm25_index.BM25Index(os.path.join(workdir, "bm25_index.db"))
+
+    llm = StubChatModel(latency=args.llm_ms / 1000, answer_words=args.answer_words)
+    langchain_util._default_llm = lambda: llm
+    langchain_util.build_reranker = lambda *a, **kw: TimedReranker(
+        base=StubReranker(top_n=langchain_util.RERANK_TOP_N, latency=args.rerank_ms / 1000), mode="stub")
+
+    import services
+    if args.no_answer_cache:
+        services.answer_cache.max_entries = 0
+    services.start_ingest_workers()
+
+
+class AppClient:
+    """The Flask or FastAPI app in-process, behind one interface that is safe to share between threads."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        if kind == "flask":
+            from main import app
+            self._client = app.test_client()
+        else:
+            from fastapi.testclient import TestClient
+            from asgi_app import app
+            # Entered once: every request then runs on the same event loop, as under uvicorn
+            self._client = TestClient(app).__enter__()
+
+    def _json(self, response):
+        return response.get_json() if self.kind == "flask" else response.json()
+
+    def post_json(self, path: str, payload: dict):
+        response = self._client.post(path, json=payload)
+        return response.status_code, self._json(response), response.headers
+
+    def upload(self, files):
+        if self.kind == "flask":
+            response = self._client.post("/upload-doc", content_type="multipart/form-data",
+                                         data={"file": [(io.BytesIO(content), name) for name, content in files]})
+        else:
+            response = self._client.post("/upload-doc", files=[("file", (name, content, "application/pdf"))
+                                                               for name, content in files])
+        return response.status_code, self._json(response)
+
+    def get_json(self, path: str):
+        response = self._client.get(path)
+        return response.status_code, self._json(response)
+
+    def close(self):
+        if self.kind == "asgi":
+            self._client.__exit__(None, None, None)
+
+
+def summarize(latencies_ms: List[float]) -> dict:
+    if not latencies_ms:
+        return {"count": 0}
+    if len(latencies_ms) < 2:
+        return {"count": 1, "p50_ms": round(latencies_ms[0], 1)}
+    quantiles = statistics.quantiles(latencies_ms, n=100)
+    return {
+        "count": len(latencies_ms),
+        "p50_ms": round(quantiles[49], 1),
+        "p95_ms": round(quantiles[94], 1),
+        "p99_ms": round(quantiles[98], 1),
+        "mean_ms": round(statistics.mean(latencies_ms), 1),
+    }
+
+
+def run_uploads(client: AppClient, args, workdir: str) -> dict:
+    request_latencies, job_ids, errors = [], [], 0
+    started = time.perf_counter()
+    for upload in range(args.uploads):
+        files = []
+        for n in range(args.files_per_upload):
+            doc = upload * args.files_per_upload + n
+            path = os.path.join(workdir, f"synthetic-{doc}.pdf")
+            write_pdf(path, args.pages, args.words_per_page, seed=doc)
+            with open(path, "rb") as f:
+                files.append((f"Synthetic Regulation {doc}.pdf", f.read()))
+        request_started = time.perf_counter()
+        status, body = client.upload(files)
+        request_latencies.append((time.perf_counter() - request_started) * 1000)
+        if status != 202:
+            errors += 1
+            continue
+        job_ids += body["jobs"]
+        errors += body["summary"]["errors"]
+
+    jobs, pending = {}, list(job_ids)
+    while pending:
+        time.sleep(0.1)
+        for job_id in list(pending):
+            _, job = client.get_json(f"/jobs/{job_id}")
+            if job["status"] in ("succeeded", "failed"):
+                jobs[job_id] = job
+                pending.remove(job_id)
+    elapsed = time.perf_counter() - started
+
+    succeeded = [job for job in jobs.values() if job["status"] == "succeeded"]
+    stages = {}
+    for job in succeeded:
+        for name, entry in job["result"]["stats"]["stages"].items():
+            total = stages.setdefault(name, {"items": 0, "seconds": 0.0})
+            total["items"] += entry["items"]
+            total["seconds"] = round(total["seconds"] + entry["seconds"], 3)
+    pages = sum(job["result"]["stats"]["pages"] for job in succeeded)
+    chunks = sum(job["result"]["stats"]["chunks"] for job in succeeded)
+    return {
+        "requests": args.uploads,
+        "files": len(job_ids),
+        "succeeded": len(succeeded),
+        "failed": len(jobs) - len(succeeded),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "documents_per_second": round(len(succeeded) / elapsed, 2),
+        "pages": pages,
+        "chunks": chunks,
+        "chunks_per_second": round(chunks / elapsed, 1),
+        "upload_request": summarize(request_latencies),
+        # Queue wait plus indexing, per job
+        "job": summarize([(job["updated_at"] - job["created_at"]) * 1000 for job in succeeded]),
+        # Summed over jobs; stages of one job overlap, so they add up to more than its wall time
+        "stages": stages,
+    }
+
+
+def load_queries(path: Optional[str], count: int, repeat: int) -> List[List[str]]:
+    """Sessions, each a list of questions in the order they were asked."""
+    sessions = {}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                question = record.get("question") or record.get("query") or record.get("title")
+                if question:
+                    sessions.setdefault(record.get("session_id") or f"line-{line_number}", []).append(question)
+    else:
+        rng = random.Random(0)
+        for n in range(count):
+            sessions[f"synthetic-{n}"] = [
+                f"What does article {rng.randint(1, 60)} say about {rng.choice(WORDS)} {rng.choice(WORDS)}?"]
+    return [questions for _ in range(repeat) for questions in sessions.values()]
+
+
+def run_chat(client: AppClient, sessions: List[List[str]], concurrency: int) -> dict:
+    latencies, stage_ms, stage_tokens, errors = [], {}, {}, []
+
+    def session(numbered):
+        n, questions = numbered
+        for question in questions:
+            started = time.perf_counter()
+            status, body, headers = client.post_json("/chat", {"session_id": f"replay-{n}", "question": question,
+                                                               "history": []})
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors.append({"status": status, "body": body})
+                continue
+            for name, ms, tokens in SERVER_TIMING.findall(headers.get("Server-Timing", "")):
+                stage_ms.setdefault(name, []).append(float(ms))
+                if tokens:
+                    stage_tokens[name] = stage_tokens.get(name, 0) + int(tokens)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(session, enumerate(sessions)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_errors": errors[:3],
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        **{key: value for key, value in summarize(latencies).items() if key != "count"},
+        # A stage is missing from requests that skipped it (cache hits, fast-routed, off-topic)
+        "stages": {name: summarize(values) for name, values in sorted(stage_ms.items())},
+        "llm_tokens": dict(sorted(stage_tokens.items())),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app", choices=["asgi", "flask"], default="asgi")
+    parser.add_argument("--queries", help="JSONL query log to replay; synthetic questions if omitted")
+    parser.add_argument("--synthetic-queries", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=1, help="times the query log is replayed")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions replayed at once")
+    parser.add_argument("--uploads", type=int, default=2, help="/upload-doc requests")
+    parser.add_argument("--files-per-upload", type=int, default=3)
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--llm-ms", type=float, default=400)
+    parser.add_argument("--embed-ms", type=float, default=60)
+    parser.add_argument("--rerank-ms", type=float, default=120)
+    parser.add_argument("--index-ms", type=float, default=40)
+    parser.add_argument("--answer-words", type=int, default=80)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--no-fast-router", action="store_true")
+    parser.add_argument("--no-answer-cache", action="store_true")
+    parser.add_argument("--no-page-cache", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        install_stubs(args, workdir)
+        import services
+        from langchain_util import chain_registry
+
+        client = AppClient(args.app)
+        try:
+            report = {"config": vars(args), "upload": run_uploads(client, args, workdir)}
+            sessions = load_queries(args.queries, args.synthetic_queries, args.repeat)
+            report["chat"] = run_chat(client, sessions, args.concurrency)
+            report["services"] = {
+                "retrieval": services.retrieval_timings.stats(),
+                "chains": chain_registry.get_stats(),
+                "fast_router": services.fast_router.stats(),
+                "answer_cache": services.answer_cache.stats(),
+                "context_packing": services.context_packer.stats(),
+            }
+        finally:
+            client.close()
+            services.job_queue.stop(timeout=5)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
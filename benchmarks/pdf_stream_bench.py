@@ -0,0 +1,132 @@
+"""
+Peak RSS and pages/s of indexing a large PDF, streamed vs fully materialized.
+
+Writes a synthetic PDF (1000 pages of regulation-like text by default) and
+indexes it with fake embeddings and an index that drops the vectors, so only
+parsing, chunking and batching are measured. Each mode runs in a fresh
+interpreter so peak RSS is not shared between them:
+
+- stream: IngestPipeline.run, pages -> chunks -> batches as a stream
+- list: every page and chunk of the file in memory before embedding starts,
+  as the pipeline used to do
+
+    python benchmarks/pdf_stream_bench.py
+    python benchmarks/pdf_stream_bench.py --pages 2000 --parse-workers 1 --dimension 1536
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+WORDS = ("bank licence capital article penalty SAMA customer due diligence record retention report "
+         "payment service provider finance lease data classification outsourcing regulation shall").split()
+
+
+def write_pdf(path: str, pages: int, words_per_page: int, seed: int = 0):
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        text = f"Article {page_num + 1}\n" + " ".join(rng.choice(WORDS) for _ in range(words_per_page))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    doc.save(path)
+    doc.close()
+
+
+class DiscardingIndex:
+    """Counts upserted vectors without keeping them."""
+
+    def __init__(self):
+        self.upserted = 0
+
+    def upsert(self, vectors, **kwargs):
+        self.upserted += len(vectors)
+        return {"upserted_count": len(vectors)}
+
+
+def run_child(args):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from ingest_pipeline import IngestPipeline, StageTimer
+    import pinecone_util
+
+    detections = 0
+    detect = pinecone_util.detect_language
+
+    def counting_detect(text):
+        nonlocal detections
+        detections += 1
+        return detect(text)
+
+    pinecone_util.detect_language = counting_detect
+    index = DiscardingIndex()
+    pipeline = IngestPipeline(DeterministicFakeEmbedding(size=args.dimension), index, record_manifest=False,
+                              parse_workers=args.parse_workers, embed_batch_size=args.embed_batch_size)
+    started = time.perf_counter()
+    if args.child == "stream":
+        stats = pipeline.run(args.pdf, 1)
+        pages, chunks = stats["pages"], stats["chunks"]
+    else:
+        counts = {"pages": 0, "chunks": 0}
+        timer = StageTimer()
+        chunks_in_memory = list(pipeline.iter_chunks(args.pdf, 1, timer, counts))
+        pipeline.embed_and_upsert(chunks_in_memory, timer)
+        pages, chunks = counts["pages"], counts["chunks"]
+    seconds = time.perf_counter() - started
+    pipeline.shutdown()
+
+    print(json.dumps({
+        "mode": args.child,
+        "pages": pages,
+        "chunks": chunks,
+        "vectors_upserted": index.upserted,
+        "seconds": round(seconds, 2),
+        "pages_per_second": round(pages / seconds, 1),
+        # Detections in this process only; use --parse-workers 1 to count them all
+        "language_detections": detections,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--words-per-page", type=int, default=450)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--parse-workers", type=int, default=4)
+    parser.add_argument("--embed-batch-size", type=int, default=128)
+    parser.add_argument("--modes", nargs="+", default=["list", "stream"], choices=["list", "stream"])
+    parser.add_argument("--child", choices=["list", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = os.path.join(tmp, "synthetic.pdf")
+        write_pdf(pdf, args.pages, args.words_per_page)
+        results = []
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", mode, "--pdf", pdf,
+                 "--dimension", str(args.dimension), "--parse-workers", str(args.parse_workers),
+                 "--embed-batch-size", str(args.embed_batch_size)],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps({"pdf_pages": args.pages, "words_per_page": args.words_per_page, "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
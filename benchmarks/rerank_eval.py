@@ -0,0 +1,94 @@
+"""
+Rerank latency per mode and top-k agreement with Cohere on a fixed eval set.
+
+Candidates for each question in rerank_eval_set.jsonl are retrieved once with
+the live retriever and saved to rerank_candidates.json, so later runs (and
+every mode within a run) rerank exactly the same chunks. Agreement is
+|top_k(mode) & top_k(cohere)| / k averaged over questions. Needs the usual
+OPENAI/PINECONE/COHERE keys for the first run and for the cohere mode.
+
+    python benchmarks/rerank_eval.py
+    python benchmarks/rerank_eval.py --modes cohere local none --k 3 --repeat 3
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, '..', 'backend'))
+
+from langchain_core.documents import Document
+from langchain_util import build_reranker, get_filtered_retriever
+
+
+def load_candidates(eval_path, candidates_path):
+    if os.path.exists(candidates_path):
+        with open(candidates_path, encoding="utf-8") as f:
+            items = json.load(f)
+    else:
+        items = []
+        with open(eval_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                documents = get_filtered_retriever(item["source"]).invoke(item["question"])
+                item["candidates"] = [{"text": d.page_content, "metadata": d.metadata} for d in documents]
+                items.append(item)
+        with open(candidates_path, "w", encoding="utf-8") as f:
+            json.dump(items, f, ensure_ascii=False)
+    for item in items:
+        item["documents"] = [Document(page_content=c["text"], metadata=c["metadata"]) for c in item["candidates"]]
+    return [item for item in items if item["documents"]]
+
+
+def rank(reranker, items, repeat):
+    """Returns per-question top texts and latencies; later repeats show the warm (cached) path."""
+    tops, cold, warm = [], [], []
+    for item in items:
+        for attempt in range(repeat):
+            started = time.perf_counter()
+            result = reranker.compress_documents(item["documents"], item["question"])
+            (cold if attempt == 0 else warm).append((time.perf_counter() - started) * 1000)
+        tops.append([d.page_content for d in result])
+    return tops, cold, warm
+
+
+def summarize(latencies):
+    if not latencies:
+        return None
+    ordered = sorted(latencies)
+    return {"p50_ms": round(statistics.median(ordered), 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            "mean_ms": round(statistics.mean(ordered), 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--eval-set", default=os.path.join(HERE, "rerank_eval_set.jsonl"))
+    parser.add_argument("--candidates", default=os.path.join(HERE, "rerank_candidates.json"))
+    parser.add_argument("--modes", nargs="+", default=["cohere", "local", "none"])
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=2)
+    args = parser.parse_args()
+
+    items = load_candidates(args.eval_set, args.candidates)
+    modes = args.modes if "cohere" in args.modes else ["cohere"] + args.modes
+
+    tops, results = {}, {}
+    for mode in modes:
+        tops[mode], cold, warm = rank(build_reranker(mode, top_n=args.k), items, args.repeat)
+        results[mode] = {"cold": summarize(cold), "warm": summarize(warm)}
+
+    for mode in modes:
+        overlaps = [len(set(a) & set(b)) / args.k for a, b in zip(tops[mode], tops["cohere"])]
+        results[mode]["agreement_at_k"] = round(statistics.mean(overlaps), 3) if overlaps else None
+
+    print(json.dumps({"questions": len(items), "k": args.k, "modes": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
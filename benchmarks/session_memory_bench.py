@@ -0,0 +1,65 @@
+"""
+History tokens per turn: client resending the full history vs SessionMemory.
+
+Replays a synthetic conversation (regulatory-length answers) and prints, for
+each turn, the tokens of history that would go into the router and
+contextualize prompts. With SessionMemory the count levels off once older
+turns start being compacted.
+
+    python benchmarks/session_memory_bench.py --turns 40
+    python benchmarks/session_memory_bench.py --turns 40 --recent-messages 4 --summary-tokens 300
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from session_memory import SessionMemory, history_tokens
+
+WORDS = ("bank licence capital article penalty SAMA customer due diligence record retention report "
+         "payment service provider finance lease data classification outsourcing regulation shall").split()
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--answer-words", type=int, default=250)
+    parser.add_argument("--recent-messages", type=int, default=6)
+    parser.add_argument("--summary-tokens", type=int, default=400)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as path:
+        # max_sessions=1 with a second session forces a spill/restore every turn
+        memory = SessionMemory(max_sessions=1, recent_messages=args.recent_messages,
+                               summary_token_budget=args.summary_tokens,
+                               spill_path=os.path.join(path, "sessions.db"))
+        full_history = []
+        rows = []
+        for turn in range(1, args.turns + 1):
+            question = sentence(rng, 15)
+            answer = " ".join(sentence(rng, 25) for _ in range(args.answer_words // 25))
+            session_history = memory.get_history("bench")
+            rows.append({"turn": turn,
+                         "resend_history_tokens": history_tokens(full_history),
+                         "session_history_tokens": history_tokens(session_history)})
+            full_history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+            memory.append("bench", question, answer)
+            memory.get_history("other")
+            memory.append("other", "hello", "hi")
+
+        for row in rows:
+            print(f"turn {row['turn']:3d}  resend={row['resend_history_tokens']:7d}  session={row['session_history_tokens']:6d}")
+        print(json.dumps({"last_turn": rows[-1], "memory": memory.stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
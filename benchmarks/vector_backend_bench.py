@@ -0,0 +1,87 @@
+"""
+Filtered top-k latency: LocalVectorStore vs the Pinecone index.
+
+The local store is filled with random unit vectors (one partition per
+synthetic source) in a temporary directory. --pinecone additionally times
+the same filtered query against the live "saama-laws" index, which needs
+PINECONE_API_KEY and existing data.
+
+    python benchmarks/vector_backend_bench.py --docs 25 --chunks-per-doc 400
+    python benchmarks/vector_backend_bench.py --ivf-min-rows 5000 --chunks-per-doc 20000
+    python benchmarks/vector_backend_bench.py --pinecone --source "Banking Control Law.pdf"
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from local_vector_store import LocalVectorStore
+
+
+def timed(fn, queries):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {"p50_ms": round(quantiles[49], 3), "p99_ms": round(quantiles[98], 3),
+            "mean_ms": round(statistics.mean(latencies), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=25)
+    parser.add_argument("--chunks-per-doc", type=int, default=400)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ivf-min-rows", type=int, default=None)
+    parser.add_argument("--pinecone", action="store_true")
+    parser.add_argument("--source", default="Banking Control Law.pdf", help="source filter for --pinecone")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(args.queries, args.dimension)).astype(np.float32)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(path, DeterministicFakeEmbedding(size=args.dimension), args.dimension,
+                                 ivf_min_rows=args.ivf_min_rows)
+        started = time.perf_counter()
+        for doc in range(args.docs):
+            vectors = rng.normal(size=(args.chunks_per_doc, args.dimension)).astype(np.float32)
+            store.upsert([
+                {"id": f"{doc}:{i}", "values": vectors[i], "metadata": {"source": f"doc-{doc}.pdf", "text": ""}}
+                for i in range(args.chunks_per_doc)
+            ])
+        results["local_build_seconds"] = round(time.perf_counter() - started, 2)
+
+        source_filter = {"source": {"$in": ["doc-0.pdf"]}}
+        store.query(queries[0], top_k=args.k, filter=source_filter)  # warm the memory maps
+        results["local_filtered"] = timed(lambda q: store.query(q, top_k=args.k, filter=source_filter), queries)
+        results["local_unfiltered"] = timed(lambda q: store.query(q, top_k=args.k), queries)
+
+    if args.pinecone:
+        from pinecone_util import get_index
+        index = get_index()
+        pinecone_filter = {"source": {"$in": [args.source]}}
+        results["pinecone_filtered"] = timed(
+            lambda q: index.query(vector=q.tolist(), top_k=args.k, filter=pinecone_filter, include_metadata=True),
+            queries[:min(args.queries, 50)]
+        )
+
+    results["config"] = vars(args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 import sys
 import os
 sys.path.append(os.path.join(os.getcwd(), 'backend'))
-from backend.pinecone_util import index_document_to_pinecone
 import traceback
 import os
 from dotenv import load_dotenv
@@ -11,10 +10,23 @@ load_dotenv()
 print(f"Pinecone Key present: {bool(os.getenv('PINECONE_API_KEY'))}")
 print(f"OpenAI Key present: {bool(os.getenv('OPENAI_API_KEY'))}")
 
+from ingest_pipeline import get_default_pipeline
+from pinecone_util import get_index, new_namespace
+from document_util import delete_manifest_entries
+from bm25_index import get_bm25_index
+
+# Use a dummy file_id 999 in a namespace of its own, removed again afterwards
+namespace = new_namespace(999)
 try:
     print("Attempting to index document...")
-    # Use a dummy file_id 999
-    success = index_document_to_pinecone("test_upload.html", 999)
-    print(f"Indexing success: {success}")
+    stats = get_default_pipeline().run("test_upload.html", 999, namespace=namespace)
+    print(f"Indexing stats: {stats}")
 except Exception:
     traceback.print_exc()
+finally:
+    try:
+        get_index().delete(delete_all=True, namespace=namespace)
+    except Exception:
+        pass
+    delete_manifest_entries(999)
+    get_bm25_index().delete_file(999)
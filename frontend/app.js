@@ -38,50 +38,57 @@ function appendMessage(text, who='bot', highlightedContexts = []) {
   const el = document.createElement('div');
   el.className = 'message ' + (who === 'user' ? 'user' : 'bot');
   el.innerText = text;
-  
-  if (who === 'bot' && Array.isArray(highlightedContexts) && highlightedContexts.length) {
-    const meta = document.createElement('div');
-    meta.className = 'meta';
-    meta.innerText = `${highlightedContexts.length} references found. `;
-    
-    const toggleBtn = document.createElement('button');
-    toggleBtn.className = 'context-toggle';
-    toggleBtn.textContent = 'Show details';
-    
-    const list = document.createElement('div');
-    list.className = 'context-list';
-    list.style.display = 'none';
-
-    highlightedContexts.forEach((ctx) => {
-      const item = document.createElement('div');
-      item.className = 'context-item';
-      
-      const header = document.createElement('div');
-      header.className = 'context-header';
-      header.innerText = `${ctx.source || 'Unknown Source'} (Page ${ctx.page || '?'})`;
-      
-      const body = document.createElement('div');
-      body.className = 'context-body';
-      body.innerText = ctx.context_text || '';
-      
-      item.appendChild(header);
-      item.appendChild(body);
-      list.appendChild(item);
-    });
 
-    toggleBtn.addEventListener('click', () => {
-      const isHidden = list.style.display === 'none';
-      list.style.display = isHidden ? 'flex' : 'none';
-      toggleBtn.textContent = isHidden ? 'Hide details' : 'Show details';
-    });
-
-    meta.appendChild(toggleBtn);
-    el.appendChild(meta);
-    el.appendChild(list);
+  if (who === 'bot') {
+    renderContexts(el, highlightedContexts);
   }
 
   chatWindow.appendChild(el);
   chatWindow.scrollTop = chatWindow.scrollHeight;
+  return el;
+}
+
+function renderContexts(el, highlightedContexts) {
+  if (!Array.isArray(highlightedContexts) || !highlightedContexts.length) return;
+
+  const meta = document.createElement('div');
+  meta.className = 'meta';
+  meta.innerText = `${highlightedContexts.length} references found. `;
+  
+  const toggleBtn = document.createElement('button');
+  toggleBtn.className = 'context-toggle';
+  toggleBtn.textContent = 'Show details';
+  
+  const list = document.createElement('div');
+  list.className = 'context-list';
+  list.style.display = 'none';
+
+  highlightedContexts.forEach((ctx) => {
+    const item = document.createElement('div');
+    item.className = 'context-item';
+    
+    const header = document.createElement('div');
+    header.className = 'context-header';
+    header.innerText = `${ctx.source || 'Unknown Source'} (Page ${ctx.page || '?'})`;
+    
+    const body = document.createElement('div');
+    body.className = 'context-body';
+    body.innerText = ctx.context_text || '';
+    
+    item.appendChild(header);
+    item.appendChild(body);
+    list.appendChild(item);
+  });
+
+  toggleBtn.addEventListener('click', () => {
+    const isHidden = list.style.display === 'none';
+    list.style.display = isHidden ? 'flex' : 'none';
+    toggleBtn.textContent = isHidden ? 'Hide details' : 'Show details';
+  });
+
+  meta.appendChild(toggleBtn);
+  el.appendChild(meta);
+  el.appendChild(list);
 }
 
 function appendSystemMessage(text) {
@@ -94,46 +101,79 @@ function appendSystemMessage(text) {
   chatWindow.scrollTop = chatWindow.scrollHeight;
 }
 
+// Parses a text/event-stream body and calls onEvent(name, data) per event.
+async function readEventStream(res, onEvent) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 async function postQuestion(question) {
   appendMessage(question, 'user');
 
   const payload = {
     session_id: sessionId,
-    question: question,
-    history: [] 
+    question: question
   };
 
-  // Add temporary loading indicator
-  const loadingId = 'loading-' + Date.now();
-  const loadingEl = document.createElement('div');
-  loadingEl.id = loadingId;
-  loadingEl.className = 'message bot';
-  loadingEl.innerText = 'Thinking...';
-  chatWindow.appendChild(loadingEl);
-  chatWindow.scrollTop = chatWindow.scrollHeight;
+  // Bot message is filled in as events arrive
+  const botEl = appendMessage('', 'bot');
+  const textEl = document.createElement('div');
+  textEl.innerText = 'Thinking...';
+  botEl.appendChild(textEl);
+  let answer = '';
 
   try {
-    const res = await fetch(`${apiBase}/chat`, {
+    const res = await fetch(`${apiBase}/chat/stream`, {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
       body: JSON.stringify(payload),
     });
 
-    document.getElementById(loadingId).remove();
-
     if (!res.ok) {
+      botEl.remove();
       const err = await res.text();
       appendSystemMessage('Error: ' + err);
       return;
     }
 
-    const data = await res.json();
-    const answer = data.answer || data;
-    const contexts = data.highlighted_contexts || [];
+    await readEventStream(res, (event, data) => {
+      if (event === 'contexts') {
+        renderContexts(botEl, data.highlighted_contexts || []);
+      } else if (event === 'token') {
+        answer += data.text;
+        textEl.innerText = answer;
+        chatWindow.scrollTop = chatWindow.scrollHeight;
+      } else if (event === 'error') {
+        appendSystemMessage('Error: ' + data.error);
+      } else if (event === 'done') {
+        console.debug('chat timings', data);
+      }
+    });
 
-    appendMessage(answer, 'bot', contexts);
+    if (!answer) textEl.innerText = '';
   } catch (err) {
-    document.getElementById(loadingId)?.remove();
+    botEl.remove();
     appendSystemMessage('Network error: ' + (err.message || err));
   }
 }
@@ -179,9 +219,10 @@ uploadBtn.addEventListener('click', async () => {
     const result = await res.json();
 
     if (res.ok) {
-      uploadStatus.innerText = `Uploaded ${result.summary.success} file(s).`;
+      uploadStatus.innerText = `Queued ${result.summary.queued} file(s) for indexing...`;
       uploadStatus.className = 'status-success';
-      fetchDocuments(); // Refresh list
+      fetchDocuments(); // Refresh list (new files show as pending)
+      watchJobs(result.jobs);
       fileInput.value = '';
       document.querySelector('.file-label span').innerText = 'Choose files...';
     } else {
@@ -197,6 +238,29 @@ uploadBtn.addEventListener('click', async () => {
   }
 });
 
+// Polls indexing jobs until they finish, then refreshes the document list
+async function watchJobs(jobIds) {
+  let pending = [...jobIds];
+  let failed = 0;
+  while (pending.length) {
+    await new Promise(resolve => setTimeout(resolve, 2000));
+    const jobs = await Promise.all(pending.map(async (id) => {
+      const res = await fetch(`${apiBase}/jobs/${id}`);
+      return res.ok ? res.json() : { id, status: 'failed' };
+    }));
+    const running = jobs.filter(job => job.status === 'queued' || job.status === 'running');
+    failed += jobs.filter(job => job.status === 'failed').length;
+    pending = running.map(job => job.id);
+    const upserted = running.reduce((sum, job) => sum + (job.vectors_upserted || 0), 0);
+    const total = running.reduce((sum, job) => sum + (job.chunks_total || 0), 0);
+    uploadStatus.innerText = pending.length
+      ? `Indexing ${pending.length} file(s): ${upserted}/${total} chunks...`
+      : `Indexed ${jobIds.length - failed} file(s)` + (failed ? `, ${failed} failed.` : '.');
+    uploadStatus.className = failed ? 'status-error' : 'status-success';
+  }
+  fetchDocuments();
+}
+
 // Document Listing Logic
 async function fetchDocuments() {
   try {
@@ -1,7 +1,26 @@
 import os
 
-if os.path.exists("documents.db"):
-    os.remove("documents.db")
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+# Same path as document_util.DB_NAME
+DB_PATH = os.getenv("DOCUMENTS_DB_PATH", os.path.join(BACKEND_DIR, "documents.db"))
+# Keyword rows are keyed by document id, which starts over with a new registry
+BM25_PATH = os.path.join(BACKEND_DIR, "bm25_index.db")
+
+
+def remove_database(path):
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    # WAL mode leaves these next to the database
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return True
+
+
+if remove_database(DB_PATH):
+    remove_database(BM25_PATH)
     print("Database reset successfully.")
 else:
     print("Database does not exist.")
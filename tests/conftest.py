@@ -0,0 +1,28 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# The backend reads these when it is imported; none of the tests may touch the
+# databases, spool directory or vector index of a real checkout.
+_scratch = tempfile.mkdtemp(prefix="rag-tests-")
+os.environ["DOCUMENTS_DB_PATH"] = os.path.join(_scratch, "documents.db")
+os.environ["INGEST_JOBS_DB_PATH"] = os.path.join(_scratch, "jobs.db")
+os.environ["INGEST_SPOOL_DIR"] = os.path.join(_scratch, "uploads")
+os.environ["LOCAL_INDEX_DIR"] = os.path.join(_scratch, "local_index")
+os.environ["VECTOR_BACKEND"] = "local"
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """document_util on a fresh documents database of its own."""
+    import document_util
+    monkeypatch.setattr(document_util, "DB_NAME", str(tmp_path / "documents.db"))
+    monkeypatch.setattr(document_util, "_db_ready", False)
+    monkeypatch.setattr(document_util, "_local", threading.local())
+    return document_util
@@ -0,0 +1,71 @@
+import re
+import time
+
+from answer_cache import AnswerCache, normalize_question, question_numbers
+
+
+class WordEmbedding:
+    """Bag of words without digits, so questions that differ only in a number embed identically."""
+
+    VOCABULARY = ["penalty", "article", "late", "reporting", "license", "fee", "bank"]
+
+    def embed_query(self, text):
+        words = re.findall(r"[a-z]+", text.lower())
+        return [float(words.count(word)) for word in self.VOCABULARY]
+
+
+ANSWER = {"answer": "A fine of 10,000 riyals", "highlighted_contexts": []}
+
+
+def test_normalized_questions_share_an_entry():
+    cache = AnswerCache()
+    cache.put(["law.pdf"], "What is the penalty for late reporting?", ANSWER, version=1)
+    assert cache.get(["law.pdf"], "  what is the PENALTY for late   reporting ", version=1) == ANSWER
+    assert cache.stats()["hits"] == 1
+
+
+def test_sources_and_version_are_part_of_the_key():
+    cache = AnswerCache()
+    cache.put(["a.pdf", "b.pdf"], "license fee", ANSWER, version=1)
+    assert cache.get(["b.pdf", "a.pdf"], "license fee", version=1) == ANSWER
+    assert cache.get(["a.pdf"], "license fee", version=1) is None
+    # The source was re-indexed (here or in another process) since the answer was cached
+    assert cache.get(["a.pdf", "b.pdf"], "license fee", version=2) is None
+
+
+def test_semantic_hit_requires_the_same_numbers():
+    cache = AnswerCache(embedding=WordEmbedding(), similarity_threshold=0.95)
+    cache.put(["law.pdf"], "penalty under article 12", ANSWER, version=1)
+
+    assert cache.get(["law.pdf"], "article 12 penalty", version=1) == ANSWER
+    assert cache.get(["law.pdf"], "penalty under article 13", version=1) is None
+    assert cache.get(["law.pdf"], "bank license fee article 12", version=1) is None
+    stats = cache.stats()
+    assert (stats["semantic_hits"], stats["misses"]) == (1, 2)
+
+
+def test_question_numbers_read_arabic_indic_digits():
+    assert question_numbers(normalize_question("المادة ١٢ لعام 2020")) == (12, 2020)
+
+
+def test_invalidate_source_drops_its_entries_only():
+    cache = AnswerCache()
+    cache.put(["a.pdf"], "question one", ANSWER)
+    cache.put(["a.pdf", "b.pdf"], "question two", ANSWER)
+    cache.put(["c.pdf"], "question three", ANSWER)
+
+    cache.invalidate_source("a.pdf")
+    assert cache.get(["a.pdf"], "question one") is None
+    assert cache.get(["a.pdf", "b.pdf"], "question two") is None
+    assert cache.get(["c.pdf"], "question three") == ANSWER
+
+
+def test_entries_expire_and_are_bounded():
+    cache = AnswerCache(ttl_seconds=0.05, max_entries=2)
+    for n in range(3):
+        cache.put(["law.pdf"], f"question {n}", ANSWER)
+    assert cache.stats()["entries"] == 2
+    assert cache.get(["law.pdf"], "question 0") is None
+
+    time.sleep(0.1)
+    assert cache.get(["law.pdf"], "question 2") is None
@@ -0,0 +1,70 @@
+from langchain_core.documents import Document
+
+from context_packing import ContextPacker, merge_passages, overlap_length
+
+LEFT = "Article 3. The bank shall keep records of every transfer for ten years"
+RIGHT = "every transfer for ten years and report suspicious ones to SAMA"
+
+
+def chunk(text, source="law.pdf", page=1, **metadata):
+    return Document(page_content=text, metadata={"source": source, "page": page, **metadata})
+
+
+def test_overlap_length_finds_the_repeated_text():
+    assert overlap_length(LEFT, RIGHT) == len("every transfer for ten years")
+    assert overlap_length(RIGHT, LEFT) == 0
+    # Shorter than MIN_OVERLAP_CHARS: a repeated phrase, not splitter overlap
+    assert overlap_length("the bank shall", "shall pay") == 0
+
+
+def test_merge_passages_joins_continuations_and_contained_chunks():
+    passages = merge_passages([LEFT, "Article 9 is unrelated to the others here", RIGHT, "keep records of every"])
+    assert passages == [
+        ("Article 3. The bank shall keep records of every transfer for ten years"
+         " and report suspicious ones to SAMA", [0, 2, 3]),
+        ("Article 9 is unrelated to the others here", [1]),
+    ]
+
+
+def test_pack_merges_overlapping_chunks_of_a_page_only():
+    packer = ContextPacker(token_budget=10000)
+    packed, report = packer.pack([
+        chunk(RIGHT, page=4, file_id=7),
+        chunk(LEFT, page=4, file_id=7),
+        chunk(RIGHT, page=5, file_id=7),
+    ])
+
+    assert [document.page_content for document in packed] == [LEFT + RIGHT[len("every transfer for ten years"):], RIGHT]
+    # Metadata of the best-ranked chunk of the passage
+    assert packed[0].metadata == {"source": "law.pdf", "page": 4, "file_id": 7, "merged_chunks": 2}
+    assert report["chunks_in"] == 3 and report["passages_out"] == 2
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"] > 0
+
+
+def test_pack_orders_by_source_relevance_then_page():
+    packed, _ = ContextPacker().pack([
+        chunk("Best match on page two of the banking law", source="b.pdf", page=2),
+        chunk("A match in the other document, page five", source="a.pdf", page=5),
+        chunk("Another banking law passage from page one", source="b.pdf", page=1),
+    ])
+    assert [(d.metadata["source"], d.metadata["page"]) for d in packed] == [("b.pdf", 1), ("b.pdf", 2), ("a.pdf", 5)]
+
+
+def test_token_budget_drops_the_least_relevant_but_keeps_the_best():
+    long_text = " ".join(["penalty"] * 200)
+    packer = ContextPacker(token_budget=5)
+    packed, report = packer.pack([
+        chunk(long_text, page=1),
+        chunk("short second passage", page=2),
+    ])
+
+    assert [document.page_content for document in packed] == [long_text]
+    assert report["passages_dropped"] == 1
+    assert packer.stats()["requests"] == 1
+
+
+def test_disabled_packer_passes_documents_through():
+    documents = [chunk(LEFT), chunk(RIGHT)]
+    packed, report = ContextPacker(enabled=False).pack(documents)
+    assert packed == documents
+    assert report["tokens_saved"] == 0
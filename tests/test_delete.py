@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+pytest.importorskip("dotenv")
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import pinecone_util
+from local_vector_store import LocalVectorStore
+from pinecone_util import delete_doc_from_pinecone
+
+DIMENSION = 8
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch, registry):
+    store = LocalVectorStore(str(tmp_path / "index"), DeterministicFakeEmbedding(size=DIMENSION), DIMENSION)
+    monkeypatch.setattr(pinecone_util, "VECTOR_BACKEND", "local")
+    monkeypatch.setitem(pinecone_util._clients, "vectorstore", store)
+    return store
+
+
+def index_document(registry, store, filename, chunks, namespace=None):
+    """Registers an indexed document with `chunks` vectors, in its own namespace or the shared default one."""
+    file_id = registry.insert_document_record(filename, status=registry.STATUS_INDEXED)
+    if namespace:
+        registry.set_document_namespace(file_id, namespace)
+    ids = [f"{file_id}:{n:016x}" for n in range(chunks)]
+    if ids:
+        store.upsert([{"id": vector_id, "values": np.ones(DIMENSION).tolist(), "metadata": {"source": filename}}
+                      for vector_id in ids], namespace=namespace)
+        registry.insert_manifest_entries(file_id, [(vector_id, 1, n, None) for n, vector_id in enumerate(ids)])
+    return file_id, ids
+
+
+def test_namespaced_document(registry, store):
+    file_id, _ = index_document(registry, store, "a.pdf", 3, namespace="file-1-abc")
+    other_id, other_ids = index_document(registry, store, "b.pdf", 2, namespace="file-2-def")
+
+    assert delete_doc_from_pinecone(file_id) == (3, True)
+    assert "file-1-abc" not in store.describe_index_stats()["namespaces"]
+    assert registry.get_manifest_vector_ids(file_id) == []
+    assert registry.get_manifest_vector_ids(other_id) == other_ids
+
+
+def test_namespace_that_was_never_written(registry, store):
+    file_id, _ = index_document(registry, store, "a.pdf", 0, namespace="file-1-abc")
+    assert delete_doc_from_pinecone(file_id) == (0, True)
+
+
+def test_legacy_document_in_the_default_namespace(registry, store):
+    file_id, ids = index_document(registry, store, "a.pdf", 2)
+    assert delete_doc_from_pinecone(file_id) == (2, True)
+    assert store.fetch(ids)["vectors"] == {}
+    assert registry.get_manifest_vector_ids(file_id) == []
+
+
+def test_legacy_document_without_vectors(registry, store):
+    file_id, _ = index_document(registry, store, "a.pdf", 0)
+    assert delete_doc_from_pinecone(file_id) == (0, True)
+
+
+def test_index_failure_keeps_the_manifest(registry, store, monkeypatch):
+    file_id, ids = index_document(registry, store, "a.pdf", 2)
+
+    def fail(**kwargs):
+        raise ConnectionError("index unavailable")
+
+    monkeypatch.setattr(store, "delete", fail)
+    assert delete_doc_from_pinecone(file_id) == (0, False)
+    assert registry.get_manifest_vector_ids(file_id) == ids
+
+
+@pytest.fixture
+def services(tmp_path, monkeypatch, store):
+    services = pytest.importorskip("services")
+    from bm25_index import BM25Index
+    from job_queue import JobQueue
+    monkeypatch.setattr(services, "job_queue", JobQueue(services.run_ingest_job, path=str(tmp_path / "jobs.db")))
+    bm25 = BM25Index(str(tmp_path / "bm25_index.db"))
+    monkeypatch.setattr(services, "get_bm25_index", lambda: bm25)
+    return services
+
+
+def test_delete_document(registry, store, services):
+    file_id, _ = index_document(registry, store, "a.pdf", 2, namespace="file-1-abc")
+    message, status = services.delete_document(file_id)
+    assert status == 200 and "a.pdf" in message
+    assert registry.get_document_by_id(file_id) is None
+    assert "file-1-abc" not in store.describe_index_stats()["namespaces"]
+
+
+def test_delete_unknown_document(services):
+    assert services.delete_document(12345)[1] == 404
+
+
+def test_delete_document_with_an_active_job(registry, store, services):
+    file_id, _ = index_document(registry, store, "a.pdf", 2, namespace="file-1-abc")
+    services.job_queue.enqueue("update", "a.pdf", "/spool/a.pdf", file_id)
+    assert services.delete_document(file_id)[1] == 409
+    assert registry.get_document_by_id(file_id) is not None
+
+
+def test_delete_document_when_the_index_fails(registry, store, services, monkeypatch):
+    file_id, _ = index_document(registry, store, "a.pdf", 2, namespace="file-1-abc")
+    monkeypatch.setattr(services, "delete_doc_from_pinecone", lambda file_id: (0, False))
+    assert services.delete_document(file_id)[1] == 500
+    assert registry.get_document_by_id(file_id) is not None
@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+pytest.importorskip("dotenv")
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from ingest_pipeline import InMemoryIndex, IngestPipeline
+
+TEXTS = {
+    "A": "Article 1. Definitions used throughout this regulation.",
+    "B": "Article 2. Licensing requirements for money changers.",
+    "C": "Article 3. Records shall be kept for ten years.",
+    "D": "Article 4. Penalties for late reporting to SAMA.",
+}
+
+
+@pytest.fixture
+def pipeline(registry):
+    pipeline = IngestPipeline(DeterministicFakeEmbedding(size=8), InMemoryIndex(), embed_batch_size=2,
+                              upsert_batch_size=2, retry_backoff=0)
+    yield pipeline
+    pipeline.shutdown()
+
+
+def revision(pipeline, *page_texts):
+    """Makes the pipeline read these pages (one chunk each) for any file."""
+    def iter_pages(file_path, content_hash=None):
+        for number, key in enumerate(page_texts, 1):
+            yield Document(page_content=TEXTS[key], metadata={"page": number, "source": "law.pdf"})
+
+    pipeline.iter_pages = iter_pages
+
+
+def indexed_pages(pipeline):
+    return sorted((vector["metadata"]["text"], vector["metadata"]["page"]) for vector in pipeline.index.vectors.values())
+
+
+def test_update_embeds_only_added_and_moved_chunks(pipeline, registry):
+    revision(pipeline, "A", "B", "C")
+    assert pipeline.run("/spool/law.pdf", 1)["chunks"] == 3
+
+    revision(pipeline, "A", "C", "D")
+    stats = pipeline.update("/spool/law.pdf", 1)
+
+    assert (stats["added"], stats["moved"], stats["removed"], stats["unchanged"]) == (1, 1, 1, 1)
+    assert indexed_pages(pipeline) == [(TEXTS["A"], 1), (TEXTS["C"], 2), (TEXTS["D"], 3)]
+    assert sorted(registry.get_manifest_pages(1).values()) == [1, 2, 3]
+    assert set(registry.get_manifest_pages(1)) == set(pipeline.index.vectors)
+    assert registry.get_document_profile(1)["vector_count"] == 3
+
+
+def test_repeating_an_update_changes_nothing(pipeline):
+    revision(pipeline, "A", "B")
+    pipeline.run("/spool/law.pdf", 1)
+    revision(pipeline, "B", "D")
+    pipeline.update("/spool/law.pdf", 1)
+
+    stats = pipeline.update("/spool/law.pdf", 1)
+    assert (stats["added"], stats["moved"], stats["removed"], stats["unchanged"]) == (0, 0, 0, 2)
+    assert indexed_pages(pipeline) == [(TEXTS["B"], 1), (TEXTS["D"], 2)]
+
+
+def test_update_keeps_other_documents(pipeline, registry):
+    revision(pipeline, "A")
+    pipeline.run("/spool/other.pdf", 2)
+    revision(pipeline, "A", "B")
+    pipeline.run("/spool/law.pdf", 1)
+
+    revision(pipeline, "C")
+    stats = pipeline.update("/spool/law.pdf", 1)
+
+    assert (stats["added"], stats["removed"]) == (1, 2)
+    assert len(registry.get_manifest_vector_ids(2)) == 1
+    assert set(registry.get_manifest_vector_ids(2)) <= set(pipeline.index.vectors)
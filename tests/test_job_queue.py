@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+from job_queue import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JobQueue
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(handler=lambda job, progress: {"ok": True}, **kwargs):
+        queue = JobQueue(handler, path=str(tmp_path / "jobs.db"), poll_seconds=0.05, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop(timeout=5)
+
+
+def wait_for(queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in (JOB_SUCCEEDED, JOB_FAILED):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_workers_run_jobs_and_record_progress(make_queue):
+    def handler(job, progress):
+        progress(pages_parsed=2, chunks_total=5)
+        return {"file": job["filename"]}
+
+    queue = make_queue(handler)
+    job_id = queue.enqueue("index", "a.pdf", "/spool/a.pdf", file_id=1)
+    assert queue.get(job_id)["status"] == JOB_QUEUED
+    queue.start()
+
+    job = wait_for(queue, job_id)
+    assert job["status"] == JOB_SUCCEEDED
+    assert job["result"] == {"file": "a.pdf"}
+    assert (job["pages_parsed"], job["chunks_total"], job["attempts"]) == (2, 5, 1)
+    assert queue.active_file_ids() == set()
+
+
+def test_enqueue_returns_the_active_job_for_a_busy_document(make_queue):
+    queue = make_queue()
+    first = queue.enqueue("index", "a.pdf", "/spool/a.pdf", file_id=1)
+    assert queue.enqueue("update", "a.pdf", "/spool/a2.pdf", file_id=1) == first
+    assert queue.enqueue("index", "b.pdf", "/spool/b.pdf", file_id=2) != first
+    assert queue.active_file_ids() == {1, 2}
+
+
+def test_failed_job_is_given_up_and_cleaned_up(make_queue):
+    failed = []
+
+    def handler(job, progress):
+        raise RuntimeError("parse error")
+
+    queue = make_queue(handler, on_failure=failed.append)
+    job_id = queue.enqueue("index", "a.pdf", "/spool/a.pdf", file_id=1)
+    queue._run(queue._claim())
+
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == (JOB_FAILED, "parse error")
+    assert [job["id"] for job in failed] == [job_id]
+
+
+def test_expired_lease_is_claimed_again_until_max_attempts(make_queue):
+    failed = []
+    queue = make_queue(on_failure=failed.append, lease_seconds=0.05, max_attempts=2)
+    job_id = queue.enqueue("index", "a.pdf", "/spool/a.pdf", file_id=1)
+
+    # A worker claims the job and dies without heartbeating
+    assert queue._claim()["id"] == job_id
+    assert queue._claim() is None
+    time.sleep(0.1)
+    assert queue._claim()["attempts"] == 2
+    time.sleep(0.1)
+
+    third = queue._claim()
+    assert third["attempts"] == 3
+    queue._run(third)
+    assert queue.get(job_id)["error"] == "Gave up after 2 attempts"
+    assert len(failed) == 1
+
+
+def test_heartbeat_keeps_the_lease(make_queue):
+    queue = make_queue(lease_seconds=0.2)
+    job_id = queue.enqueue("index", "a.pdf", "/spool/a.pdf", file_id=1)
+    queue._claim()
+    for _ in range(3):
+        time.sleep(0.1)
+        queue.update_progress(job_id, chunks_embedded=1)
+    assert queue._claim() is None
+
+
+def test_external_jobs_block_the_document_but_are_never_claimed(make_queue):
+    queue = make_queue()
+    job_id = queue.begin_external("index", "a.pdf", "/data/a.pdf", 1)
+    job = queue.get(job_id)
+    assert (job["kind"], job["status"]) == ("bulk-index", JOB_RUNNING)
+
+    assert queue.begin_external("update", "a.pdf", "/data/a.pdf", 1) is None
+    assert queue.enqueue("update", "a.pdf", "/spool/a.pdf", file_id=1) == job_id
+    assert queue.active_file_ids() == {1}
+    assert queue._claim() is None
+
+    queue.finish_external(job_id, result={"chunks": 3})
+    job = queue.get(job_id)
+    assert (job["status"], job["result"]) == (JOB_SUCCEEDED, {"chunks": 3})
+    assert queue.begin_external("update", "a.pdf", "/data/a.pdf", 1) is not None
+
+
+def test_external_job_that_stopped_heartbeating_is_failed(make_queue):
+    queue = make_queue(lease_seconds=0.05)
+    stale = queue.begin_external("index", "a.pdf", "/data/a.pdf", 1)
+    time.sleep(0.1)
+    assert queue.active_file_ids() == set()
+    # Never handed to a worker, even though its lease expired
+    assert queue._claim() is None
+
+    fresh = queue.enqueue("index", "a.pdf", "/spool/a.pdf", file_id=1)
+    assert fresh != stale
+    assert (queue.get(stale)["status"], queue.get(stale)["error"]) == (JOB_FAILED, "Stopped heartbeating")
+
+    queue.finish_external(stale, error="interrupted")
+    assert queue.get(stale)["status"] == JOB_FAILED
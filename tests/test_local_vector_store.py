@@ -0,0 +1,96 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from local_vector_store import LocalVectorStore
+
+DIMENSION = 8
+
+
+def make_store(path, **kwargs):
+    return LocalVectorStore(str(path), DeterministicFakeEmbedding(size=DIMENSION), DIMENSION, **kwargs)
+
+
+def vector(seed):
+    return np.random.default_rng(seed).normal(size=DIMENSION).tolist()
+
+
+def record(vector_id, seed, source="a.pdf"):
+    return {"id": vector_id, "values": vector(seed), "metadata": {"source": source, "text": vector_id}}
+
+
+def test_namespace_query_and_delete_all(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert([record("1:a", 1), record("1:b", 2)], namespace="file-1")
+    store.upsert([record("2:a", 3)], namespace="file-2")
+
+    matches = store.query(vector(1), top_k=5, namespace="file-1")["matches"]
+    assert [match["id"] for match in matches][0] == "1:a"
+    assert {match["id"] for match in matches} == {"1:a", "1:b"}
+
+    store.delete(delete_all=True, namespace="file-1")
+    assert store.query(vector(1), top_k=5, namespace="file-1")["matches"] == []
+    assert store.describe_index_stats()["namespaces"] == {"file-2": {"vector_count": 1}}
+
+
+def test_filter_only_searches_matching_partitions(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert([record("a", 1, "a.pdf"), record("b", 1, "b.pdf")])
+
+    matches = store.query(vector(1), top_k=5, filter={"source": {"$in": ["b.pdf"]}})["matches"]
+    assert [match["id"] for match in matches] == ["b"]
+    with pytest.raises(ValueError):
+        store.query(vector(1), top_k=5, filter={"page": 1})
+
+
+def test_id_moving_to_another_partition_is_not_left_behind(tmp_path):
+    store = make_store(tmp_path)
+    store.upsert([record("x", 1, "a.pdf")])
+    store.upsert([record("x", 1, "b.pdf")])
+
+    assert store.query(vector(1), top_k=5, filter={"source": "a.pdf"})["matches"] == []
+    assert [m["id"] for m in store.query(vector(1), top_k=5, filter={"source": "b.pdf"})["matches"]] == ["x"]
+
+
+def test_delete_and_compaction_survive_reopening(tmp_path):
+    store = make_store(tmp_path, compact_ratio=0.3)
+    store.upsert([record(f"v{n}", n) for n in range(10)], namespace="ns")
+    store.delete(ids=[f"v{n}" for n in range(6)], namespace="ns")
+
+    reopened = make_store(tmp_path)
+    fetched = reopened.fetch([f"v{n}" for n in range(10)], namespace="ns")["vectors"]
+    assert sorted(fetched) == ["v6", "v7", "v8", "v9"]
+
+
+def test_instances_sharing_a_directory_see_each_others_writes(tmp_path):
+    first, second = make_store(tmp_path), make_store(tmp_path)
+    first.upsert([record("a", 1)], namespace="ns")
+    assert second.fetch(["a"], namespace="ns")["vectors"].keys() == {"a"}
+
+    second.upsert([record("b", 2)], namespace="ns")
+    second.delete(ids=["a"], namespace="ns")
+    assert first.fetch(["a", "b"], namespace="ns")["vectors"].keys() == {"b"}
+
+    second.delete(delete_all=True, namespace="ns")
+    assert first.query(vector(2), top_k=5, namespace="ns")["matches"] == []
+
+
+def _upsert_from_process(path, worker):
+    store = make_store(path)
+    for batch in range(5):
+        store.upsert([record(f"{worker}-{batch}-{n}", worker * 100 + batch * 10 + n) for n in range(4)],
+                     namespace="shared")
+
+
+def test_concurrent_processes_do_not_lose_writes(tmp_path):
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_upsert_from_process, args=(str(tmp_path), worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    assert make_store(tmp_path).describe_index_stats()["namespaces"]["shared"]["vector_count"] == 4 * 5 * 4